@@ -0,0 +1 @@
+'''Benchmarks for the Yukon Cornelius package. Run modules with `python -m benchmarks.<name>`.'''
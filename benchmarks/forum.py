@@ -0,0 +1,234 @@
+'''Synthetic phpBB forums laid out like the Classic Cars forum, and a local server for them.
+
+Usage:
+    python -m benchmarks.forum <directory> [--pages N] [--posts-per-page N]
+                                           [--body-length N] [--serve] [--latency S]
+'''
+
+import argparse
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from yukon_cornelius import constants
+
+NAMES = ['Nate', 'Cathy', 'Sam', 'Josephine', 'MGBfan', 'Jaguar_Jim', 'rustbucket',
+         'Triumph66', 'Healey', 'oldtimer']
+WORDS = ['carburettor', 'gearbox', 'chrome', 'restoration', 'the', 'a', 'wheel',
+         'engine', 'paint', 'rust', 'original', 'mileage', 'sold', 'bought', 'and',
+         'it', 'was', 'garage', 'Sunday', 'drive', 'spares', 'dynamo', 'valve']
+DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct',
+          'Nov', 'Dec']
+
+PAGE_TEMPLATE = '''<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN">
+<html dir="ltr">
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=iso-8859-1">
+<title>Old Classic Car :: View topic - {subject}</title>
+<link rel="stylesheet" href="templates/subSilver/subSilver.css" type="text/css">
+</head>
+<body bgcolor="#E5E5E5" text="#000000" link="#006699" vlink="#5493B4">
+<table width="100%" cellspacing="0" cellpadding="10" border="0" align="center">
+<tr><td class="bodyline">
+<table width="100%" cellspacing="2" cellpadding="2" border="0">
+<tr><td align="left" valign="bottom" colspan="2"><a class="maintitle" href="viewtopic.php?t=1">{subject}</a><br />
+<span class="gensmall"><b>Goto page {navigation}</b></span></td></tr>
+</table>
+<table class="forumline" width="100%" cellspacing="1" cellpadding="3" border="0">
+<tr><th class="thLeft" width="150" height="26" nowrap="nowrap">Author</th>
+<th class="thRight" nowrap="nowrap">Message</th></tr>
+{posts}
+</table>
+<table width="100%" cellspacing="2" border="0" align="center" cellpadding="2">
+<tr><td align="left" valign="middle" nowrap="nowrap"><span class="nav">{navigation}</span></td></tr>
+</table>
+</td></tr>
+</table>
+</body>
+</html>
+'''
+
+POST_TEMPLATE = '''<tr>
+<td width="150" align="left" valign="top" class="row{row}"><span class="name"><a name="{id}"></a><b>{name}</b></span><br /><span class="postdetails">Joined: {joined}<br />Posts: {num_posts}</span><br /></td>
+<td class="row{row}" width="100%" height="28" valign="top"><table width="100%" border="0" cellspacing="0" cellpadding="0">
+<tr><td width="100%"><a href="viewtopic.php?p={id}#{id}"><img src="templates/subSilver/images/icon_minipost.gif" width="12" height="9" alt="Post" title="Post" border="0" /></a><span class="postdetails">Posted: {date}<span class="gen">&nbsp;</span>&nbsp; &nbsp;Post subject: Re: {subject}</span></td>
+<td valign="top" nowrap="nowrap"><a href="posting.php?mode=quote&amp;p={id}"><img src="templates/subSilver/images/lang_english/icon_quote.gif" alt="Reply with quote" border="0" /></a></td></tr>
+<tr><td colspan="2"><hr /></td></tr>
+<tr><td colspan="2"><span class="postbody">{body}</span><span class="gensmall"></span></td></tr>
+</table></td>
+</tr>
+<tr><td class="spaceRow" colspan="2" height="1"><img src="templates/subSilver/images/spacer.gif" alt="" width="1" height="1" /></td></tr>
+'''
+
+END_POSTS = '''<tr><td class="row1" colspan="2" align="center"><span class="gen">No posts exist for this topic</span></td></tr>'''
+
+
+def _random_date(rng):
+    hour = rng.randint(1, 12)
+    return (f'{rng.choice(DAYS)} {rng.choice(MONTHS)} {rng.randint(1, 28)}, '
+            f'{rng.randint(2003, 2020)} {hour}:{rng.randint(0, 59):02d} '
+            f'{rng.choice(["am", "pm"])}')
+
+
+def _random_body(rng, length):
+    '''Returns roughly `length` characters of words, with a line break now and then.'''
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        if rng.random() < 0.05:
+            word += '<br />'
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words)
+
+
+def render_page(page, num_pages, posts_per_page, body_length, rng):
+    '''Returns the html of page number `page`. Pages past the last show no posts.'''
+    subject = 'Austin A35 restoration'
+    navigation = ', '.join(f'<a href="viewtopic.php?t=1&amp;start={i * posts_per_page}">'
+                           f'{i + 1}</a>' for i in range(min(num_pages, 5)))
+    if page >= num_pages:
+        posts = END_POSTS
+    else:
+        posts = ''.join(POST_TEMPLATE.format(
+            row=1 + i % 2,
+            id=page * posts_per_page + i + 1,
+            name=rng.choice(NAMES),
+            joined=f'{rng.choice(MONTHS)} {rng.randint(1, 28)}, 2004',
+            num_posts=rng.randint(1, 3000),
+            date=_random_date(rng),
+            subject=subject,
+            body=_random_body(rng, body_length)) for i in range(posts_per_page))
+    return PAGE_TEMPLATE.format(subject=subject, navigation=navigation, posts=posts)
+
+
+def generate_forum(directory, pages=10, posts_per_page=15, body_length=400, seed=0):
+    '''Writes a forum of `pages` pages, plus the page past its end, to `directory`.
+
+    Pages are saved as page<N>.html. The same arguments always produce the same
+    forum.
+
+    Args:
+      directory: str. Created if needed.
+      pages: int. Number of pages with posts.
+      posts_per_page: int.
+      body_length: int. Approximate number of characters in each post body.
+      seed: int. Seed for the random names, dates and bodies.
+
+    Returns:
+      The list of paths written, ending with the end page.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for page in range(pages + 1):
+        path = os.path.join(directory, f'page{page}.html')
+        with open(path, 'w') as f:
+            f.write(render_page(page, pages, posts_per_page, body_length, rng))
+        paths.append(path)
+    return paths
+
+
+class _ForumHandler(BaseHTTPRequestHandler):
+    '''Serves viewtopic.php?t=1&start=K from the page holding post K.'''
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        parts = urlsplit(self.path)
+        if not parts.path.endswith('viewtopic.php'):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        start = int(parse_qs(parts.query).get('start', ['0'])[0])
+        page = min(start // self.server.posts_per_page, self.server.num_pages)
+        with open(os.path.join(self.server.directory, f'page{page}.html'), 'rb') as f:
+            body = f.read()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ForumServer:
+    '''Local http stand-in for a forum written by `generate_forum`.
+
+    Pages are addressed like phpBB, by the offset of their first post, so the
+    `ClassicCars` prospector can mine `url` unchanged.
+    '''
+    def __init__(self, directory, latency=0.0,
+                 posts_per_page=constants.ClassicCars.POSTS_PER_PAGE):
+        '''
+        Args:
+          directory: str. Holds the pages written by `generate_forum`.
+          latency: float. Seconds to wait before answering each request.
+          posts_per_page: int. Post offset between consecutive pages in urls.
+        '''
+        num_pages = len([name for name in os.listdir(directory)
+                         if name.startswith('page') and name.endswith('.html')]) - 1
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _ForumHandler)
+        self._server.daemon_threads = True
+        self._server.directory = os.path.abspath(directory)
+        self._server.latency = latency
+        self._server.posts_per_page = posts_per_page
+        self._server.num_pages = num_pages
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}/viewtopic.php?t=1'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('directory')
+    arg_parser.add_argument('--pages', type=int, default=10)
+    arg_parser.add_argument('--posts-per-page', type=int, default=15)
+    arg_parser.add_argument('--body-length', type=int, default=400)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--serve', action='store_true',
+                            help='serve the forum until interrupted')
+    arg_parser.add_argument('--latency', type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    paths = generate_forum(args.directory, args.pages, args.posts_per_page,
+                           args.body_length, args.seed)
+    print(f'Wrote {len(paths)} pages to {args.directory}')
+
+    if args.serve:
+        with ForumServer(args.directory, latency=args.latency) as server:
+            print(f'Serving {server.url}')
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == '__main__':
+    main()
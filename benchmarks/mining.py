@@ -0,0 +1,207 @@
+'''Measures mining and export throughput on a synthetic Classic Cars forum.
+
+Every export type is mined in a fresh process through `mine.mine_website`, against a
+local `ForumServer`, and reported as posts per second and peak RSS. Results are
+compared with a saved baseline so regressions show up between versions.
+
+Usage:
+    python -m benchmarks.mining [--pages N] [--posts-per-page N] [--body-length N]
+                                [--latency S] [--filetypes csv jsonl ...] [--repeat N]
+                                [--baseline FILE] [--save-baseline] [--tolerance F]
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+from yukon_cornelius import constants
+from yukon_cornelius import sinks
+from benchmarks.forum import ForumServer, generate_forum
+
+SITE_NAME = 'synthetic_forum'
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# Columnar exports are only benchmarked when pyarrow is installed
+SKIPPED_FILETYPES = [] if sinks.pyarrow is not None else ['parquet', 'feather']
+FILETYPES = [filetype for filetype in constants.VALID_ORE_EXPORT_TYPES
+             if filetype not in SKIPPED_FILETYPES]
+
+
+def peak_rss_mb():
+    '''Returns the peak resident set size of this process in megabytes.'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak / 1024
+
+
+def write_config(workspace, url):
+    '''Writes a website config for the synthetic forum served at `url`.'''
+    config = {SITE_NAME: {
+        'source': url,
+        'source_type': 'http_url',
+        'prospector_class': 'ClassicCars',
+        'attributes': ['id', 'name', 'date', 'body'],
+    }}
+    with open(os.path.join(workspace, constants.CONFIG_FILE), 'w') as f:
+        json.dump(config, f)
+
+
+def _run_export(workspace, export_filetype, results):
+    '''Mines the synthetic forum in `workspace` and reports to the `results` queue.'''
+    os.chdir(workspace)
+    sys.stdout = open(os.devnull, 'w')
+    import mine
+
+    start = time.perf_counter()
+    num_ore = mine.mine_website(SITE_NAME, export_filetype=export_filetype)
+    total = time.perf_counter() - start
+
+    stats_file = os.path.join(constants.EXPORT_DIR,
+                              f'{SITE_NAME}.{export_filetype}.stats.json')
+    with open(stats_file, 'r') as f:
+        mining = json.load(f)['elapsed']
+
+    results.put({
+        'posts': num_ore,
+        'mine_seconds': mining,
+        'export_seconds': total - mining,
+        'posts_per_second': num_ore / total,
+        'peak_rss_mb': peak_rss_mb(),
+    })
+
+
+def run_export(workspace, export_filetype):
+    '''Returns the measurements of mining and exporting one filetype.
+
+    A fresh process is used for every run so peak RSS is not shared between them.
+    '''
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_export,
+                              args=(workspace, export_filetype, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def run_benchmark(pages=20, posts_per_page=15, body_length=400, latency=0.0,
+                  filetypes=FILETYPES, repeat=3):
+    '''Generates and serves a forum, and returns {filetype: measurements}.
+
+    Each filetype is run `repeat` times and the fastest run is kept, which is far
+    less noisy than a single run.
+    '''
+    with tempfile.TemporaryDirectory() as workspace:
+        generate_forum(os.path.join(workspace, 'pages'), pages, posts_per_page,
+                       body_length)
+        with ForumServer(os.path.join(workspace, 'pages'), latency=latency) as server:
+            write_config(workspace, server.url)
+            results = {}
+            for filetype in filetypes:
+                runs = [run_export(workspace, filetype) for _ in range(repeat)]
+                results[filetype] = max(runs, key=lambda r: r['posts_per_second'])
+            return results
+
+
+def compare(results, baseline, tolerance):
+    '''Returns a list of regressions of `results` against `baseline`.
+
+    A regression is a throughput drop or peak RSS growth larger than `tolerance`
+    (a fraction) for a filetype present in both. Filetypes missing from the
+    baseline are reported by `main`.
+    '''
+    regressions = []
+    for filetype, result in results.items():
+        if filetype not in baseline:
+            continue
+        old = baseline[filetype]
+        if result['posts_per_second'] < old['posts_per_second'] * (1 - tolerance):
+            regressions.append(f'{filetype}: {result["posts_per_second"]:.0f} posts/s, '
+                               f'baseline {old["posts_per_second"]:.0f}')
+        if result['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f'{filetype}: {result["peak_rss_mb"]:.1f} MB peak RSS, '
+                               f'baseline {old["peak_rss_mb"]:.1f}')
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = [f'{"filetype":<10}{"posts":>8}{"posts/s":>10}{"mine (s)":>10}'
+             f'{"export (s)":>12}{"peak RSS (MB)":>15}{"vs baseline":>13}']
+    for filetype, r in results.items():
+        change = ''
+        if baseline and filetype in baseline:
+            ratio = r['posts_per_second'] / baseline[filetype]['posts_per_second']
+            change = f'{(ratio - 1) * 100:+.1f}%'
+        lines.append(f'{filetype:<10}{r["posts"]:>8}{r["posts_per_second"]:>10.0f}'
+                     f'{r["mine_seconds"]:>10.2f}{r["export_seconds"]:>12.2f}'
+                     f'{r["peak_rss_mb"]:>15.1f}{change:>13}')
+    return '\n'.join(lines)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--pages', type=int, default=20)
+    arg_parser.add_argument('--posts-per-page', type=int, default=15)
+    arg_parser.add_argument('--body-length', type=int, default=400)
+    arg_parser.add_argument('--latency', type=float, default=0.0,
+                            help='seconds the server waits before each page')
+    arg_parser.add_argument('--filetypes', nargs='*',
+                            default=FILETYPES,
+                            choices=constants.VALID_ORE_EXPORT_TYPES)
+    arg_parser.add_argument('--repeat', type=int, default=3,
+                            help='runs per filetype, of which the fastest is kept')
+    arg_parser.add_argument('--baseline', default=BASELINE_FILE)
+    arg_parser.add_argument('--save-baseline', action='store_true',
+                            help='replace the baseline with these results')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='fraction of slowdown or growth allowed before '
+                                 'reporting a regression')
+    args = arg_parser.parse_args()
+
+    skipped = [filetype for filetype in args.filetypes if filetype in SKIPPED_FILETYPES]
+    if skipped:
+        print(f'Skipping {", ".join(skipped)}: pyarrow is not installed')
+    filetypes = [filetype for filetype in args.filetypes if filetype not in skipped]
+
+    params = {'pages': args.pages, 'posts_per_page': args.posts_per_page,
+              'body_length': args.body_length, 'latency': args.latency}
+    results = run_benchmark(filetypes=filetypes, repeat=args.repeat, **params)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            saved = json.load(f)
+        # Numbers are only comparable for the same forum
+        if saved['params'] == params:
+            baseline = saved['results']
+
+    print(format_results(results, baseline))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'params': params,
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'results': results}, f, indent=2)
+        print(f'Saved baseline to {args.baseline}')
+    elif baseline is not None:
+        unchecked = [filetype for filetype in results if filetype not in baseline]
+        if unchecked:
+            print(f'Not in the baseline, so not checked: {", ".join(unchecked)}')
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
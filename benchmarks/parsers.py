@@ -0,0 +1,62 @@
+'''Compares the parsers supported by `utils.make_soup` on a saved page.
+
+Usage:
+    python -m benchmarks.parsers <html_file> [--repeat N] [--name div --class postbody]
+'''
+
+import argparse
+import statistics
+import time
+
+from yukon_cornelius import constants
+from yukon_cornelius import utils
+
+
+def time_parser(html, parser, parse_only=None, repeat=5):
+    '''Returns a list of `repeat` wall times (seconds) for parsing `html`.'''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        utils.parse_html(html, parser=parser, parse_only=parse_only)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def compare_parsers(html, parse_only=None, repeat=5):
+    '''Returns {label: [seconds, ...]} for every parser (and the strained soup).'''
+    results = {}
+    for parser in constants.VALID_PARSERS:
+        results[parser] = time_parser(html, parser, repeat=repeat)
+
+    if parse_only is not None:
+        for parser in ['lxml', 'html.parser']:
+            results[f'{parser} + parse_only'] = time_parser(
+                html, parser, parse_only=parse_only, repeat=repeat)
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('html_file')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--name', nargs='*', help='parse_only tag names')
+    arg_parser.add_argument('--class', dest='classname', nargs='*',
+                            help='parse_only classes')
+    args = arg_parser.parse_args()
+
+    with open(args.html_file, 'r') as f:
+        html = f.read()
+
+    parse_only = None
+    if args.name or args.classname:
+        parse_only = {'name': args.name, 'class': args.classname}
+
+    results = compare_parsers(html, parse_only=parse_only, repeat=args.repeat)
+    print(f'{"parser":<28}{"mean (ms)":>12}{"min (ms)":>12}')
+    for label, times in results.items():
+        print(f'{label:<28}{statistics.mean(times) * 1e3:>12.2f}'
+              f'{min(times) * 1e3:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
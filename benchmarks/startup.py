@@ -0,0 +1,94 @@
+'''Measures how long importing `mine.py` takes in a fresh interpreter.
+
+Every worker process that doesn't fork pays this before mining anything, so it is
+kept under a budget. Heavy dependencies (pandas, bs4, lxml, requests, ...) should
+only be imported once they are used, and the benchmark reports any that are
+imported at startup.
+
+Usage:
+    python -m benchmarks.startup [--repeat N] [--budget S] [--modules mine ...]
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ['mine']
+# Seconds the median import may take
+DEFAULT_BUDGET = 0.15
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'bs4', 'lxml', 'requests', 'aiohttp',
+                 'yaml']
+
+MEASURE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'seconds': elapsed,
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'heavy': [name for name in {heavy!r} if name in sys.modules],
+}}))
+'''
+
+
+def measure_import(module):
+    '''Imports `module` in a fresh interpreter and returns its measurements.'''
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output)
+    # macOS reports bytes, Linux kilobytes
+    if sys.platform == 'darwin':
+        result['peak_rss_mb'] /= 1024
+    return result
+
+
+def run_benchmark(modules=DEFAULT_MODULES, repeat=10):
+    '''Returns {module: measurements}, with the median import time of `repeat` runs.'''
+    results = {}
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        results[module] = {
+            'seconds': statistics.median(run['seconds'] for run in runs),
+            'peak_rss_mb': statistics.median(run['peak_rss_mb'] for run in runs),
+            'heavy': runs[-1]['heavy'],
+        }
+    return results
+
+
+def format_results(results):
+    lines = [f'{"module":<32}{"import (ms)":>12}{"peak RSS (MB)":>15}  heavy modules']
+    for module, r in results.items():
+        lines.append(f'{module:<32}{r["seconds"] * 1000:>12.1f}{r["peak_rss_mb"]:>15.1f}'
+                     f'  {", ".join(r["heavy"]) or "-"}')
+    return '\n'.join(lines)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--modules', nargs='*', default=DEFAULT_MODULES)
+    arg_parser.add_argument('--repeat', type=int, default=10,
+                            help='imports per module, of which the median is kept')
+    arg_parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                            help='seconds the median import of each module may take')
+    args = arg_parser.parse_args()
+
+    results = run_benchmark(args.modules, args.repeat)
+    print(format_results(results))
+
+    over_budget = [module for module, r in results.items()
+                   if r['seconds'] > args.budget]
+    for module in over_budget:
+        print(f'Over budget: importing {module} took '
+              f'{results[module]["seconds"]:.3f} s, budget {args.budget:.3f} s')
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,405 @@
 '''Factories to create Prospectors and mine websites.'''
 
+import argparse
+import asyncio
+import contextlib
+import functools
+import os
 import sys
-import yaml
-
-from multiprocessing import Process
 
 from yukon_cornelius import constants
-from yukon_cornelius.prospectors import sites
+from yukon_cornelius.checkpoint import Checkpoint
+from yukon_cornelius import instrumentation
+from yukon_cornelius import jobqueue
+from yukon_cornelius import lazy
+from yukon_cornelius import registry
+from yukon_cornelius import scheduler
+from yukon_cornelius import sharding
+from yukon_cornelius import sinks
 from yukon_cornelius import utils
 
-def mine_website(site_name, export_filetype='csv'):
-    config = utils.load_website_config(site_name)
-    prospector = getattr(sites, config['prospector_class'])(site_name)
-    prospector.mine()
-    utils.refine_ore(prospector.ore_cart, export_filetype=export_filetype)
+yaml = lazy.LazyModule('yaml')
+
+def mine_website(site_name, export_filetype='csv', shards=None, resume=False,
+                 incremental=False, profile=False, partition_by=None):
+    '''Mines `site_name`, exports its Ore and returns the number of Ore mined by
+    this run (not counting rows already in a resumed or incremental export).
+
+    If `shards` is given, the site's pages are split into that many ranges and
+    mined by a pool of processes (see `yukon_cornelius.sharding`). Sharded runs
+    can't be resumed, mined incrementally or profiled.
+
+    Streamed exports are checkpointed every page. If `resume` is True and a
+    checkpoint exists, mining continues from the last page that was started and
+    appends to the existing export.
+
+    Streamed exports also keep a watermark of the newest page and its post ids.
+    If `incremental` is True and a watermark exists, mining starts from that page,
+    skips posts that were already exported and appends only new ones.
+
+    Unsharded runs write the prospector's `stats` (counts and timings) to
+    `<export>.stats.json` in `constants.EXPORT_DIR`. If `profile` is True, every
+    tester and processor is timed as well, and the run is profiled with cProfile
+    into `<export>.prof`.
+
+    If `partition_by` is given, the export is a directory with one file per range
+    of pages ("page") or per month of a datetime attribute of the site's schema (see
+    `sinks.PartitionedSink`). Partitioned exports are always mined from the start.
+    '''
+    site_registry = registry.get_registry()
+    config = site_registry.config(site_name)
+    prospector_class = site_registry.prospector_class(site_name)
+    _check_partitioning(export_filetype, shards, partition_by)
+    _check_sharding(shards, resume, incremental, profile)
+
+    if shards:
+        return sharding.mine_sharded(prospector_class, site_name, export_filetype,
+                                     num_workers=shards, partition_by=partition_by)
+
+    export_name = os.path.join(constants.EXPORT_DIR, f'{site_name}.{export_filetype}')
+    profiler = contextlib.nullcontext()
+    if profile:
+        profiler = instrumentation.profiled(f'{export_name}.prof')
+    with profiler:
+        with _export_run(prospector_class, site_name, config, export_filetype, resume,
+                         incremental, profile, partition_by) as prospector:
+            # Resumed and incremental runs start counting at the rows of the export
+            start_ore = prospector.state['num_ore']
+            prospector.mine()
+    instrumentation.write_summary(f'{export_name}.stats.json', prospector.stats)
+    return prospector.state['num_ore'] - start_ore
+
+async def amine_website(site_name, export_filetype='csv', shards=None, resume=False,
+                        incremental=False, profile=False, partition_by=None,
+                        executor=None):
+    '''Same as `mine_website`, but mines on the running event loop with `amine`.
+
+    Many sites can be mined concurrently on one loop. Parsing and tag walking run in
+    `executor` (default: the loop's default executor), and sharded sites are handed
+    to `mine_website` there as well. Runs are not profiled with cProfile, but
+    `profile` still times every tester and processor.
+    '''
+    site_registry = registry.get_registry()
+    config = site_registry.config(site_name)
+    prospector_class = site_registry.prospector_class(site_name)
+    _check_partitioning(export_filetype, shards, partition_by)
+    _check_sharding(shards, resume, incremental, profile)
+
+    if shards:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(
+            mine_website, site_name, export_filetype, shards=shards,
+            partition_by=partition_by))
+
+    export_name = os.path.join(constants.EXPORT_DIR, f'{site_name}.{export_filetype}')
+    with _export_run(prospector_class, site_name, config, export_filetype, resume,
+                     incremental, profile, partition_by, load=False) as prospector:
+        start_ore = prospector.state['num_ore']
+        await prospector.amine(executor)
+    instrumentation.write_summary(f'{export_name}.stats.json', prospector.stats)
+    return prospector.state['num_ore'] - start_ore
+
+def _check_partitioning(export_filetype, shards, partition_by):
+    '''Raises ValueError if the export of a run can't be partitioned as asked.'''
+    if partition_by is None:
+        return
+    if export_filetype not in sinks.SINK_TYPES:
+        raise ValueError(f'{export_filetype} exports can not be partitioned')
+    if shards and partition_by == 'page':
+        raise ValueError('Sharded runs can not be partitioned by page')
+
+def _check_sharding(shards, resume, incremental, profile):
+    '''Raises ValueError if a sharded run is asked for what only unsharded runs do.'''
+    if not shards:
+        return
+    unsupported = [name for name, value in [('resumed', resume),
+                                            ('mined incrementally', incremental),
+                                            ('profiled', profile)] if value]
+    if unsupported:
+        raise ValueError(f'Sharded runs can not be {" or ".join(unsupported)}')
+
+@contextlib.contextmanager
+def _export_run(prospector_class, site_name, config, export_filetype, resume,
+                incremental, profile, partition_by=None, load=True):
+    '''Yields a prospector ready to mine `site_name`, and exports its Ore once the
+    block exits. See `mine_website` for the arguments.'''
+    streamed = export_filetype in sinks.SINK_TYPES
+    resumable = streamed and partition_by is None and \
+        sinks.SINK_TYPES[export_filetype].resumable
+
+    # Stream Ore straight to disk when the filetype allows it
+    if resumable:
+        checkpoint = Checkpoint.for_export(site_name, export_filetype)
+        watermark = Checkpoint.for_export(site_name, export_filetype, kind='watermark')
+        state = checkpoint.load() if resume else None
+        mark = watermark.load() if incremental else None
+
+        start = {}
+        sink_position = None
+        if state is not None:
+            print(f'{site_name}: Resuming from page {state["current_page"]}')
+            start = {'start_page': state['current_page'],
+                     'start_source': state['current_source']}
+            sink_position = state['sink']
+        elif mark is not None:
+            print(f'{site_name}: Mining posts after page {mark["current_page"]}')
+            start = {'start_page': mark['current_page'],
+                     'start_source': mark['current_source']}
+            sink_position = mark['sink']
+        known_ids = mark['ids'] if mark is not None else None
+
+        with sinks.open_sink(site_name, config['attributes'], export_filetype,
+                             resume=sink_position, schema=config.get('schema')) as sink:
+            prospector = prospector_class(site_name, sink=sink, keep_ore=False,
+                                          checkpoint=checkpoint, known_ids=known_ids,
+                                          profile=profile, load=load, **start)
+            yield prospector
+            new_mark = prospector.watermark()
+            if new_mark is not None:
+                new_mark['sink'] = sink.position()
+                watermark.save(new_mark)
+        checkpoint.clear()
+    elif streamed:
+        if resume or incremental:
+            kind = 'Partitioned' if partition_by else export_filetype
+            print(f'{site_name}: {kind} exports can not be resumed, mining from the start')
+        with sinks.open_sink(site_name, config['attributes'], export_filetype,
+                             partition_by=partition_by,
+                             schema=config.get('schema')) as sink:
+            prospector = prospector_class(site_name, sink=sink, keep_ore=False,
+                                          profile=profile, load=load)
+            yield prospector
+    else:
+        prospector = prospector_class(site_name, profile=profile, load=load)
+        yield prospector
+        utils.refine_ore(prospector.ore_cart, export_filetype=export_filetype,
+                         schema=config.get('schema'))
+
+class _LeasedSink:
+    '''Passes Ore on to `sink` while `lease` is held, and stops mining otherwise.'''
+    def __init__(self, sink, lease):
+        self._sink = sink
+        self._lease = lease
 
-def run_from_yaml_config(config_file):
+    def write(self, ore, page=None):
+        self._lease.check()
+        self._sink.write(ore, page=page)
+
+    def __getattr__(self, name):
+        return getattr(self._sink, name)
+
+def mine_job(job, lease):
+    '''Mines a `jobqueue.Job` held with `lease` and returns the number of Ore mined.
+
+    Jobs covering a whole site are mined with `mine_website`. Jobs covering a range
+    of pages write their Ore to
+    `<site_name>.<export_filetype>/pages=<start_page>-<last page>/part.<export_filetype>`
+    in `constants.EXPORT_DIR`, the layout of exports partitioned by page, so the
+    ranges of a site read back as one dataset. The partition is written to a hidden
+    file first and only replaces the old one if the lease is still held, so a
+    worker that lost its job stops at the next Ore and leaves the partition to the
+    worker that took the job over. Failed jobs are mined again from the start of
+    their range.
+    '''
+    if job.start_page == 0 and job.end_page is None:
+        rows = mine_website(job.site_name, export_filetype=job.export_filetype)
+        lease.check()
+        return rows
+
+    site_registry = registry.get_registry()
+    config = site_registry.config(job.site_name)
+    prospector_class = site_registry.prospector_class(job.site_name)
+    sink_type = sinks.SINK_TYPES[job.export_filetype]
+    last_page = '' if job.end_page is None else job.end_page - 1
+    directory = os.path.join(constants.EXPORT_DIR,
+                             f'{job.site_name}.{job.export_filetype}',
+                             f'pages={job.start_page}-{last_page}')
+    path = os.path.join(directory, f'part.{job.export_filetype}')
+    # Dataset readers skip hidden files
+    tmp_path = os.path.join(directory, f'.part.{job.export_filetype}.{job.id}.'
+                                       f'{os.getpid()}.tmp')
+    try:
+        with sink_type(tmp_path, config['attributes'],
+                       schema=config.get('schema')) as sink:
+            prospector = prospector_class(job.site_name, sink=_LeasedSink(sink, lease),
+                                          keep_ore=False, start_page=job.start_page,
+                                          end_page=job.end_page)
+            prospector.mine()
+        lease.check()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return prospector.state['num_ore']
+
+def queue_jobs(site_name, export_filetype='csv', pages=None, pages_per_job=None,
+               path=constants.QUEUE_FILE):
+    '''Adds jobs mining `site_name` to the queue at `path` and returns their ids.
+
+    Args:
+      site_name: str.
+      export_filetype: str.
+      pages: tuple. (start_page, end_page) to mine, end excluded. Defaults to the
+        whole site.
+      pages_per_job: int. If given, the pages are split into jobs of this many pages.
+        Without `pages`, the number of pages of the site is probed first (see
+        `sharding.find_page_count`).
+    '''
+    registry.get_registry().config(site_name)
+    if pages is None and pages_per_job is None:
+        return [jobqueue.JobQueue(path).add(site_name, export_filetype)]
+
+    if export_filetype not in sinks.SINK_TYPES:
+        raise ValueError(f'{export_filetype} exports can not be split into page ranges. '
+                         f'Valid types are: {list(sinks.SINK_TYPES)}')
+    if pages is None:
+        prospector_class = registry.get_registry().prospector_class(site_name)
+        # Only probes pages, so nothing needs loading
+        prospector = prospector_class(site_name, load=False, prefetch_pages=0)
+        pages = (0, sharding.find_page_count(prospector))
+    start_page, end_page = pages
+    if end_page <= start_page:
+        raise ValueError(f'The range of pages must end after it starts. Got '
+                         f'{start_page} to {end_page}')
+    if pages_per_job is not None and pages_per_job < 1:
+        raise ValueError(f'pages_per_job must be at least 1. Got {pages_per_job}')
+    step = pages_per_job or end_page - start_page
+
+    queue = jobqueue.JobQueue(path)
+    return [queue.add(site_name, export_filetype, start, min(start + step, end_page))
+            for start in range(start_page, end_page, step)]
+
+def _page_range(value):
+    start, _, end = value.partition('-')
+    return int(start), int(end)
+
+def queue_main(argv):
+    '''Runs `python mine.py queue <command>`.'''
+    parser = argparse.ArgumentParser(
+        prog='mine.py queue',
+        description='Mine websites through a job queue shared by a pool of workers.')
+    parser.add_argument('--queue', default=constants.QUEUE_FILE,
+                        help='queue file, which workers on other machines may share')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='add jobs mining a website')
+    add.add_argument('site_name', help='website name from website_config.json')
+    add.add_argument('--filetype', default='csv',
+                     choices=constants.VALID_ORE_EXPORT_TYPES)
+    add.add_argument('--pages', type=_page_range,
+                     help='range of pages START-END to mine, END excluded')
+    add.add_argument('--pages-per-job', type=int,
+                     help='split the pages into jobs of this many pages')
+
+    work = commands.add_parser('work', help='work through the queue until it is empty')
+    work.add_argument('--workers', type=int, default=constants.QUEUE_WORKERS)
+    work.add_argument('--wait', action='store_true',
+                      help='keep waiting for new jobs once the queue is empty')
+
+    commands.add_parser('status', help='show jobs and their status')
+    commands.add_parser('retry', help='make failed jobs pending again')
+    args = parser.parse_args(argv)
+
+    queue = jobqueue.JobQueue(args.queue)
+    if args.command == 'add':
+        job_ids = queue_jobs(args.site_name, args.filetype, args.pages,
+                             args.pages_per_job, args.queue)
+        print(f'Added {len(job_ids)} jobs for {args.site_name}')
+    elif args.command == 'work':
+        counts = jobqueue.run_workers(args.queue, mine_job, args.workers,
+                                      until_drained=not args.wait)
+        print(', '.join(f'{count} {status}' for status, count in counts.items()))
+        if counts['failed']:
+            sys.exit(1)
+    elif args.command == 'status':
+        for job in queue.jobs():
+            end_page = '' if job['end_page'] is None else job['end_page']
+            pages = f'{job["start_page"]}-{end_page}'
+            rows = '-' if job['rows'] is None else job['rows']
+            print(f'{job["id"]:>6}  {job["site_name"]:<32}{job["export_filetype"]:<8}'
+                  f'{pages:<14}{job["status"]:<9}attempts {job["attempts"]}/'
+                  f'{job["max_attempts"]}  rows {rows}')
+        counts = queue.counts()
+        print(', '.join(f'{count} {status}' for status, count in counts.items()))
+    elif args.command == 'retry':
+        print(f'{queue.retry_failed()} failed jobs are pending again')
+
+def run_from_yaml_config(config_file, resume=False, incremental=False, profile=False):
+    '''Mines every website in a yaml run config and returns a list of SiteResult.
+
+    Besides "websites", the run config may set "max_workers" (default
+    `constants.RUN_MAX_WORKERS`) and "mode" ("process", "thread" or "async", which
+    mines every website on one event loop with `amine_website`). Each website
+    may set a "timeout" in seconds, a number of "shards" to mine its pages with and
+    a "partition_by" for its export.
+    '''
     with open(config_file, 'r') as f:
         run_config = yaml.load(f, Loader=yaml.Loader)
 
+    # Fail before mining anything if any website is invalid
+    site_registry = registry.get_registry()
     for website in run_config['websites']:
-        p = Process(target=mine_website,
-                    args=(website, run_config['websites'][website]['filetype']))
-        p.start()
+        site_registry.config(website)
+
+    jobs = []
+    for website, options in run_config['websites'].items():
+        shards = options.get('shards')
+        if shards and (resume or incremental or profile):
+            print(f'{website}: Sharded runs can not be resumed, mined incrementally '
+                  f'or profiled, mining from the start')
+        jobs.append((website, {'export_filetype': options['filetype'],
+                               'shards': shards,
+                               'partition_by': options.get('partition_by'),
+                               'resume': resume and not shards,
+                               'incremental': incremental and not shards,
+                               'profile': profile and not shards},
+                     options.get('timeout')))
+
+    mode = run_config.get('mode', 'process')
+    run_scheduler = scheduler.RunScheduler(
+        amine_website if mode == 'async' else mine_website,
+        max_workers=run_config.get('max_workers', constants.RUN_MAX_WORKERS),
+        mode=mode)
+    results = run_scheduler.run(jobs)
+
+    print(scheduler.format_summary(results))
+    for result in results:
+        if not result.ok:
+            print(f'{result.site_name} {result.status}: {result.error}')
+    return results
 
 
 if __name__ == '__main__':
-    if not sys.argv[1]:
-        print('Must pass a website name or yaml config!')
+    if sys.argv[1:2] == ['queue']:
+        queue_main(sys.argv[2:])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(
+        description='Mine a website, or every website in a yaml run config.')
+    parser.add_argument('target', help='website name from website_config.json, or a '
+                                       'yaml run config')
+    parser.add_argument('--filetype', default='csv',
+                        choices=constants.VALID_ORE_EXPORT_TYPES,
+                        help='export filetype when mining a single website')
+    parser.add_argument('--partition-by',
+                        help='split the export of a single website by "page" ranges '
+                             'or by month of a datetime column of its schema')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue interrupted runs from their last checkpoint')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only mine posts that are new since the last run')
+    parser.add_argument('--profile', action='store_true',
+                        help='time every tester and processor, and save a cProfile '
+                             'of each website next to its export')
+    args = parser.parse_args()
+
+    if args.target.endswith('yml'):
+        results = run_from_yaml_config(args.target, resume=args.resume,
+                                       incremental=args.incremental,
+                                       profile=args.profile)
+        if not all(result.ok for result in results):
+            sys.exit(1)
     else:
-        arg = sys.argv[1]
-        if arg.endswith('yml'):
-            run_from_yaml_config(arg)
-        else:
-            mine_website(arg, export_filetype='csv')
\ No newline at end of file
+        mine_website(args.target, export_filetype=args.filetype, resume=args.resume,
+                     incremental=args.incremental, profile=args.profile,
+                     partition_by=args.partition_by)
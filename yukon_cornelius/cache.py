@@ -0,0 +1,100 @@
+'''Persistent, size-bounded cache of fetched pages.'''
+
+import os
+import sqlite3
+import time
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+
+from yukon_cornelius import constants
+
+
+CachedPage = namedtuple('CachedPage', ['text', 'etag', 'last_modified', 'fetched_at'])
+
+
+class ResponseCache:
+    '''On-disk cache of compressed page bodies keyed by url.
+
+    Entries keep the ETag and Last-Modified headers of the response they came from so
+    they can be revalidated with conditional requests. When the compressed bodies
+    take up more than `max_bytes`, the least recently used entries are evicted.
+
+    The cache is a single sqlite file, so it can be shared by all threads and
+    processes of a run.
+    '''
+    def __init__(self, path=constants.CACHE_FILE, max_bytes=constants.CACHE_MAX_BYTES):
+        '''Creates the cache file at `path` if it does not exist yet.'''
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS pages ('
+                       'url TEXT PRIMARY KEY, body BLOB, etag TEXT, '
+                       'last_modified TEXT, fetched_at REAL, accessed_at REAL, '
+                       'size INTEGER)')
+
+    @contextmanager
+    def _connect(self):
+        '''Yields a connection and commits (or rolls back) and closes it afterwards.'''
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def lookup(self, url):
+        '''Returns the CachedPage for `url`, or None if it is not cached.'''
+        with self._connect() as db:
+            row = db.execute('SELECT body, etag, last_modified, fetched_at FROM pages '
+                             'WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE pages SET accessed_at = ? WHERE url = ?',
+                       (time.time(), url))
+
+        body, etag, last_modified, fetched_at = row
+        return CachedPage(zlib.decompress(body).decode('utf-8'), etag, last_modified,
+                          fetched_at)
+
+    def store(self, url, text, etag=None, last_modified=None):
+        '''Adds or replaces the entry for `url` and evicts entries if needed.'''
+        body = zlib.compress(text.encode('utf-8'))
+        now = time.time()
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       (url, body, etag, last_modified, now, now, len(body)))
+            self._evict(db)
+
+    def refresh(self, url):
+        '''Marks the entry for `url` as freshly validated.'''
+        now = time.time()
+        with self._connect() as db:
+            db.execute('UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?',
+                       (now, now, url))
+
+    def size(self):
+        '''Returns the total size in bytes of all compressed bodies.'''
+        with self._connect() as db:
+            return db.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    def _evict(self, db):
+        '''Deletes least recently used entries until the cache fits in `max_bytes`.'''
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = db.execute('SELECT url, size FROM pages ORDER BY accessed_at').fetchall()
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            db.execute('DELETE FROM pages WHERE url = ?', (url,))
+            total -= size
+
+    def clear(self):
+        with self._connect() as db:
+            db.execute('DELETE FROM pages')
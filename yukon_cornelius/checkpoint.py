@@ -0,0 +1,48 @@
+'''Small on-disk records of mining progress, used to resume interrupted runs and to
+re-mine only what is new since the last run.'''
+
+import json
+import os
+
+from yukon_cornelius import constants
+
+
+class Checkpoint:
+    '''A json file holding the state needed to resume mining a site.
+
+    Files are replaced atomically, so a crash while saving leaves the previous
+    checkpoint intact.
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def for_export(cls, site_name, export_filetype, kind='checkpoint'):
+        '''Returns the file of `kind` kept next to the `export_filetype` export of a
+        site, e.g. "checkpoint" or "watermark".'''
+        return cls(os.path.join(constants.EXPORT_DIR,
+                                f'{site_name}.{export_filetype}.{kind}.json'))
+
+    def save(self, state):
+        '''Replaces the checkpoint with the json-serializable dict `state`.'''
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        '''Returns the saved state, or None if there is no checkpoint.'''
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
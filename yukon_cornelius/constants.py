@@ -1,24 +1,92 @@
 '''Collection of constants (urls, regex patterns, etc) used for scraping.'''
 
 # Names that apply across entire project
-PAGE_END_CLASS = 'page-end'
 CONFIG_FILE = 'website_config.json'
-VALID_SOURCE_TYPES = ['html_file', 'https_url']
+# Environment variable holding the path of the config file, if not CONFIG_FILE in the
+# working directory
+CONFIG_FILE_ENV = 'YUKON_CONFIG_FILE'
+# Modules searched, in order, for the "prospector_class" of a website config
+PROSPECTOR_MODULES = ['yukon_cornelius.prospectors.sites',
+                      'yukon_cornelius.prospectors.samples']
+VALID_SOURCE_TYPES = ['html_file', 'https_url', 'http_url']
 REQUIRED_CONFIG_KEYS = ['source', 'source_type', 'attributes']
 VALID_HTML = '^<!doctype html>.*'
 VALID_URL = '^(http|https)://www.*'
-VALID_ORE_EXPORT_TYPES = ['csv', 'json', 'html']
+VALID_ORE_EXPORT_TYPES = ['csv', 'json', 'jsonl', 'html', 'csv.gz', 'jsonl.gz', 'parquet',
+                          'feather']
+VALID_SCHEMA_TYPES = ['str', 'int', 'float', 'datetime', 'category']
 EXPORT_DIR = 'exports'
+SINK_FLUSH_EVERY = 100
+SINK_GZIP_LEVEL = 6
+DEFAULT_ID_ATTRIBUTE = 'id'
+RUN_MAX_WORKERS = 4
+SHARD_WORKERS = 4
+SHARD_MAX_PAGES = 100000
+DEFAULT_PREFETCH_PAGES = 0
+
+# Columnar exports. Rows are written in row groups (Parquet) or record batches
+# (Feather) of SINK_ROW_GROUP_SIZE rows
+SINK_ROW_GROUP_SIZE = 10000
+COLUMNAR_COMPRESSION = 'zstd'
+
+# Partitioned exports, split by "page" ranges or by month of a datetime column
+PARTITION_PAGES = 100
+
+VALID_PARSERS = ['lxml', 'html.parser', 'lxml-etree']
+DEFAULT_PARSER = 'lxml'
+# Html files mined with a "stream" config are read STREAM_CHUNK_BYTES at a time, and
+# parsed in segments of about STREAM_SEGMENT_BYTES
+STREAM_CHUNK_BYTES = 64 * 1024
+STREAM_SEGMENT_BYTES = 8 * 1024 ** 2
+
+# HTTP fetching. Per-site overrides go in the "fetch" key of the website config
+FETCH_TIMEOUT = 30
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 0.5
+FETCH_MAX_PER_HOST = 4
+FETCH_POOLED_HOSTS = 16
+FETCH_RETRY_STATUSES = (429, 500, 502, 503, 504)
+ASYNC_MAX_CONNECTIONS = 1000
+
+# Response cache, enabled per site with "cache_ttl" (seconds) in the "fetch" key
+CACHE_FILE = '.yukon_cache.sqlite'
+CACHE_MAX_BYTES = 512 * 1024 ** 2
+
+# Per-host rate limiting, enabled per site with "rate_limit" in the "fetch" key
+RATE_LIMIT_DIR = '.yukon_rate_limits'
+RATE_LIMIT_MAX_SLOWDOWN = 16
+RATE_LIMIT_STATUSES = (429, 503)
+
+# Repeated content. A page whose html was already mined in the same run is handled
+# as set by "on_repeated_page" in the website config. Sites with a "dedupe" config
+# drop Ore already seen, remembering up to SEEN_MAX_ENTRIES fingerprints, which are
+# kept in SEEN_DIR between runs if "persist" is set
+VALID_REPEATED_PAGE_ACTIONS = ['stop', 'skip', 'mine']
+DEFAULT_REPEATED_PAGE_ACTION = 'stop'
+MAX_REPEATED_PAGES = 3
+SEEN_DIR = '.yukon_seen'
+SEEN_MAX_ENTRIES = 100000
+
+# Job queue of `mine.py queue`. Workers lease a job for QUEUE_LEASE_SECONDS and renew
+# the lease while mining. A failed job is retried QUEUE_BACKOFF seconds later,
+# doubled every attempt, until it failed QUEUE_MAX_ATTEMPTS times
+QUEUE_FILE = '.yukon_queue.sqlite'
+QUEUE_WORKERS = 4
+QUEUE_LEASE_SECONDS = 300
+QUEUE_MAX_ATTEMPTS = 3
+QUEUE_BACKOFF = 30
+QUEUE_POLL_INTERVAL = 1.0
 
 
 # Website specific. Class name must match "prospector_class" attribute in config
 class ClassicCars:
-    POST_LINK_PATTERN = 'viewtopic.php\?p=(?P<post_id>[0-9]*)&.*'
+    POST_LINK_PATTERN = r'viewtopic.php\?p=(?P<post_id>[0-9]*)&.*'
     POST_DATE_PATTERN = (
         'Posted: [a-zA-Z]{3} (?P<month>[a-zA-Z]{3}) (?P<day>[0-9]{1,2}), '
         '(?P<year>[0-9]{4}) (?P<hour>[0-9]{1,2}):(?P<minute>[0-9]{1,2}) (?P<ampm>am|pm)')
     ID_TAG_PATTERN = '^[0-9]+$'
     POST_END_PATTERN = 'No posts exist for this topic'
+    POSTS_PER_PAGE = 15
     MONTHS = {
         'jan': 1,
         'january': 1,
@@ -43,4 +111,4 @@ class ClassicCars:
         'november': 11,
         'dec': 12,
         'december': 12,
-    }
\ No newline at end of file
+    }
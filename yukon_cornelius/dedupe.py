@@ -0,0 +1,107 @@
+'''Fingerprints of pages and Ore, to notice content that was already mined.'''
+
+import hashlib
+import os
+
+from yukon_cornelius import constants
+
+DIGEST_SIZE = 16
+
+
+def fingerprint(*values):
+    '''Returns a short digest of the string form of `values`.'''
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for value in values:
+        digest.update(str(value).encode('utf-8', 'surrogatepass'))
+        digest.update(b'\x1f')
+    return digest.digest()
+
+
+class SeenSet:
+    '''The fingerprints of the most recently seen records, at most `max_entries`.
+
+    When full, the fingerprint seen longest ago is forgotten, so memory stays bounded
+    however many records pass through. A set with a `path` can be saved and is
+    loaded again by the next run.
+    '''
+    def __init__(self, max_entries=constants.SEEN_MAX_ENTRIES, path=None, load=True):
+        '''
+        Args:
+          max_entries: int. Maximum number of fingerprints kept.
+          path: str. File the fingerprints are loaded from, if it exists, and saved
+            to.
+          load: bool. Whether to load the fingerprints saved at `path`. If False,
+            `save` replaces them with the fingerprints of this set only.
+        '''
+        if max_entries < 1:
+            raise ValueError(f'max_entries must be at least 1. Got {max_entries}')
+        self.max_entries = max_entries
+        self.path = path
+        self.loaded = load
+        # Dicts keep insertion order, oldest first
+        self._entries = {}
+        if path is not None and load:
+            for digest in self._read(path):
+                self._insert(digest)
+
+    @classmethod
+    def for_site(cls, site_name, max_entries=constants.SEEN_MAX_ENTRIES, load=True):
+        '''Returns the persisted set of `site_name` in `constants.SEEN_DIR`.'''
+        return cls(max_entries, os.path.join(constants.SEEN_DIR, f'{site_name}.seen'),
+                   load)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, digest):
+        return digest in self._entries
+
+    def _insert(self, digest):
+        self._entries[digest] = None
+        if len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    def add(self, digest):
+        '''Records `digest` and returns True if it was not seen before.'''
+        if digest in self._entries:
+            # Seen again, so forget it last
+            del self._entries[digest]
+            self._entries[digest] = None
+            return False
+        self._insert(digest)
+        return True
+
+    @staticmethod
+    def _read(path):
+        if not os.path.exists(path):
+            return []
+        with open(path, 'rb') as f:
+            data = f.read()
+        return [data[i:i + DIGEST_SIZE]
+                for i in range(0, len(data) - len(data) % DIGEST_SIZE, DIGEST_SIZE)]
+
+    def save(self):
+        '''Writes the fingerprints to `path`, keeping those saved there since loading
+        (unless the set was not loaded).
+
+        The file is replaced atomically.
+        '''
+        if self.path is None:
+            raise ValueError('Can not save a SeenSet without a path')
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Fingerprints saved by other runs in the meantime count as older
+        others = []
+        if self.loaded:
+            others = [digest for digest in self._read(self.path)
+                      if digest not in self._entries]
+        digests = (others + list(self._entries))[-self.max_entries:]
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(digests))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,383 @@
+'''Pooled, keep-alive HTTP fetching shared by all prospectors in a process.'''
+
+import asyncio
+import functools
+import os
+import threading
+import time
+import weakref
+from email.utils import formatdate
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from yukon_cornelius import constants
+from yukon_cornelius import instrumentation
+from yukon_cornelius import lazy
+from yukon_cornelius.cache import ResponseCache
+from yukon_cornelius.ratelimit import HostRateLimiter, parse_retry_after
+
+requests = lazy.LazyModule('requests', ['adapters'])
+aiohttp = lazy.optional('aiohttp')
+
+
+class FetchError(Exception):
+    '''Raised when a url can't be fetched, even after retrying.'''
+    pass
+
+
+def retry_delay(backoff, attempt, retry_after=None):
+    '''Returns the seconds to wait before retrying a request that failed.
+
+    Args:
+      backoff: float. Seconds to wait before the first retry. Doubles each retry.
+      attempt: int. Number of retries made so far.
+      retry_after: float. Seconds the server asked to wait with Retry-After, if
+        any. Honored when longer than the backoff.
+    '''
+    return max(backoff * 2 ** attempt, retry_after or 0)
+
+
+class HttpFetcher:
+    '''Fetches urls through one `requests.Session` with a connection pool per host.
+
+    Failed requests (connection errors, timeouts and the status codes listed in
+    `constants.FETCH_RETRY_STATUSES`) are retried with exponential backoff, and no
+    more than `max_per_host` requests are in flight to a single host at a time.
+    Time spent on the network is recorded in `timings` under "fetch".
+
+    `get_text` can additionally serve pages from an on-disk `ResponseCache`,
+    revalidating stale entries with conditional requests.
+
+    Requests given a `rate_limit` draw from a per-host token bucket shared with every
+    other process of the run (see `ratelimit.HostRateLimiter`). Time spent waiting
+    for a token is recorded under "rate_limit_wait".
+    '''
+    def __init__(self, timeout=constants.FETCH_TIMEOUT, retries=constants.FETCH_RETRIES,
+                 backoff=constants.FETCH_BACKOFF, max_per_host=constants.FETCH_MAX_PER_HOST,
+                 timings=None, cache=None, rate_limiter=None):
+        '''Creates the session and its connection pools.
+
+        Args:
+          timeout: float. Seconds to wait for a connection or a response.
+          retries: int. Number of retries after the first failed attempt.
+          backoff: float. Seconds to wait before the first retry. Doubles each retry.
+          max_per_host: int. Maximum concurrent requests (and pooled connections)
+            per host.
+          timings: instrumentation.Timings. Defaults to `instrumentation.TIMINGS`.
+          cache: cache.ResponseCache. Created at `constants.CACHE_FILE` the first time
+            a cached page is requested if not given.
+          rate_limiter: ratelimit.HostRateLimiter. Created in
+            `constants.RATE_LIMIT_DIR` the first time a rate limited page is
+            requested if not given.
+        '''
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self.timings = timings if timings is not None else instrumentation.TIMINGS
+
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=constants.FETCH_POOLED_HOSTS, pool_maxsize=max_per_host)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        self._cache = cache
+        self._rate_limiter = rate_limiter
+        self._crawl_delays = {}
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        with self._lock:
+            if self._cache is None:
+                self._cache = ResponseCache()
+            return self._cache
+
+    @property
+    def rate_limiter(self):
+        with self._lock:
+            if self._rate_limiter is None:
+                self._rate_limiter = HostRateLimiter()
+            return self._rate_limiter
+
+    def crawl_delay(self, url):
+        '''Returns the Crawl-delay the robots.txt of `url`'s host asks for, or None.
+
+        robots.txt is fetched once per host. A missing or unreachable robots.txt
+        asks for no delay.
+        '''
+        parts = urlsplit(url)
+        with self._lock:
+            if parts.netloc in self._crawl_delays:
+                return self._crawl_delays[parts.netloc]
+
+        try:
+            response = self._session.get(f'{parts.scheme}://{parts.netloc}/robots.txt',
+                                         timeout=self.timeout)
+            lines = response.text.splitlines() if response.status_code == 200 else []
+        except requests.RequestException:
+            lines = []
+        robots = RobotFileParser()
+        robots.parse(lines)
+        delay = robots.crawl_delay(self._session.headers.get('User-Agent', '*'))
+
+        with self._lock:
+            self._crawl_delays[parts.netloc] = delay
+        return delay
+
+    def _wait_for_turn(self, url, rate_limit):
+        '''Blocks until `rate_limit` allows a request to `url`'s host.
+
+        Returns the seconds waited.
+        '''
+        rate = rate_limit['requests_per_second']
+        if rate_limit.get('robots_txt', True):
+            delay = self.crawl_delay(url)
+            if delay:
+                rate = min(rate, 1 / delay)
+        return self.rate_limiter.acquire(urlsplit(url).netloc, rate,
+                                         rate_limit.get('burst', 1))
+
+    def _host_slot(self, host):
+        '''Returns the semaphore limiting concurrent requests to `host`.'''
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    def get(self, url, timeout=None, retries=None, backoff=None, headers=None,
+            timings=None, rate_limit=None):
+        '''Returns the `requests.Response` for `url`.
+
+        Keyword arguments override the fetcher's defaults for this request only.
+        Raises FetchError once all retries are used up.
+
+        Args:
+          rate_limit: dict. If given, requests to the host of `url` are limited to
+            "requests_per_second", allowing "burst" (default 1) back to back. The
+            rate is lowered to honor the host's robots.txt Crawl-delay unless
+            "robots_txt" is false, and slowed down further while the host answers
+            429 or 503.
+        '''
+        timings = self.timings if timings is None else timings
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        backoff = self.backoff if backoff is None else backoff
+        host = urlsplit(url).netloc
+        slot = self._host_slot(host)
+
+        attempt = 0
+        while True:
+            error = None
+            retry_after = None
+            if rate_limit:
+                timings.add('rate_limit_wait', self._wait_for_turn(url, rate_limit))
+            try:
+                with slot, timings.timer('fetch'):
+                    response = self._session.get(url, timeout=timeout, headers=headers)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if rate_limit:
+                    if response.status_code in constants.RATE_LIMIT_STATUSES:
+                        self.rate_limiter.penalize(host, retry_after)
+                    else:
+                        self.rate_limiter.reward(host)
+                if response.status_code not in constants.FETCH_RETRY_STATUSES:
+                    return response
+                error = f'status {response.status_code}'
+            except requests.RequestException as e:
+                error = repr(e)
+
+            if attempt >= retries:
+                raise FetchError(f'Could not fetch {url} after {attempt + 1} '
+                                 f'attempts. Last error: {error}')
+
+            with timings.timer('fetch_backoff'):
+                time.sleep(retry_delay(backoff, attempt, retry_after))
+            attempt += 1
+
+    def get_text(self, url, cache_ttl=None, timings=None, **kwargs):
+        '''Returns the decoded body of `url`. See `get` for other keyword arguments.
+
+        Args:
+          cache_ttl: float. If given, the page is served from the cache when it was
+            fetched or validated less than `cache_ttl` seconds ago. Older entries are
+            revalidated with a conditional request. If None, the cache is not used.
+        '''
+        timings = self.timings if timings is None else timings
+        if cache_ttl is None:
+            return self.get(url, timings=timings, **kwargs).text
+
+        cached = self.cache.lookup(url)
+        if cached is not None and time.time() - cached.fetched_at < cache_ttl:
+            timings.add('cache_hit', 0.0)
+            return cached.text
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+            elif not cached.etag:
+                headers['If-Modified-Since'] = formatdate(cached.fetched_at, usegmt=True)
+
+        response = self.get(url, headers=headers, timings=timings, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            timings.add('cache_revalidated', 0.0)
+            self.cache.refresh(url)
+            return cached.text
+
+        if response.status_code == 200:
+            self.cache.store(url, response.text, response.headers.get('ETag'),
+                             response.headers.get('Last-Modified'))
+        return response.text
+
+    def close(self):
+        self._session.close()
+
+
+_shared_fetcher = None
+_shared_pid = None
+_shared_lock = threading.Lock()
+
+
+def get_fetcher():
+    '''Returns the fetcher shared by every prospector in this process.
+
+    Each process gets its own fetcher, so connections are never shared across a fork.
+    '''
+    global _shared_fetcher, _shared_pid
+    with _shared_lock:
+        if _shared_fetcher is None or _shared_pid != os.getpid():
+            _shared_fetcher = HttpFetcher()
+            _shared_pid = os.getpid()
+        return _shared_fetcher
+
+
+def configure(**kwargs):
+    '''Replaces the shared fetcher with one created from `kwargs`.
+
+    Accepts the same arguments as `HttpFetcher`.
+    '''
+    global _shared_fetcher, _shared_pid
+    with _shared_lock:
+        if _shared_fetcher is not None and _shared_pid == os.getpid():
+            _shared_fetcher.close()
+        _shared_fetcher = HttpFetcher(**kwargs)
+        _shared_pid = os.getpid()
+        return _shared_fetcher
+
+
+class AsyncFetcher:
+    '''Fetches urls from an event loop, for `ProspectorBase.amine`.
+
+    With aiohttp installed, every request of the loop goes through one
+    `aiohttp.ClientSession`, so thousands of requests can be in flight at once.
+    Otherwise, and for requests using the response cache or a rate limit (which wait
+    on disk), requests are sent by the shared `HttpFetcher` in the loop's default
+    executor. Retries, backoff and timings behave like `HttpFetcher.get`.
+    '''
+    def __init__(self, timeout=constants.FETCH_TIMEOUT, retries=constants.FETCH_RETRIES,
+                 backoff=constants.FETCH_BACKOFF, max_per_host=constants.FETCH_MAX_PER_HOST,
+                 max_connections=constants.ASYNC_MAX_CONNECTIONS, timings=None):
+        '''
+        Args:
+          timeout: float. Seconds to wait for a complete response.
+          retries: int. Number of retries after the first failed attempt.
+          backoff: float. Seconds to wait before the first retry. Doubles each retry.
+          max_per_host: int. Maximum concurrent connections per host.
+          max_connections: int. Maximum concurrent connections in total.
+          timings: instrumentation.Timings. Defaults to `instrumentation.TIMINGS`.
+        '''
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self.max_connections = max_connections
+        self.timings = timings if timings is not None else instrumentation.TIMINGS
+        self._session = None
+
+    @property
+    def native(self):
+        '''Whether requests are sent by aiohttp rather than in an executor.'''
+        return aiohttp is not None
+
+    async def get_text(self, url, timings=None, cache_ttl=None, rate_limit=None,
+                       **kwargs):
+        '''Returns the decoded body of `url`. Accepts the arguments of
+        `HttpFetcher.get_text`.'''
+        timings = self.timings if timings is None else timings
+        if not self.native or cache_ttl is not None or rate_limit:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(
+                get_fetcher().get_text, url, timings=timings, cache_ttl=cache_ttl,
+                rate_limit=rate_limit, **kwargs))
+        return await self._get_text(url, timings, **kwargs)
+
+    async def _get_text(self, url, timings, timeout=None, retries=None, backoff=None,
+                        headers=None):
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        backoff = self.backoff if backoff is None else backoff
+        session = self._get_session()
+
+        attempt = 0
+        while True:
+            error = None
+            retry_after = None
+            start = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers,
+                                       timeout=aiohttp.ClientTimeout(total=timeout)) \
+                        as response:
+                    text = await response.text()
+                timings.add('fetch', time.perf_counter() - start)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if response.status not in constants.FETCH_RETRY_STATUSES:
+                    return text
+                error = f'status {response.status}'
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                timings.add('fetch', time.perf_counter() - start)
+                error = repr(e)
+
+            if attempt >= retries:
+                raise FetchError(f'Could not fetch {url} after {attempt + 1} '
+                                 f'attempts. Last error: {error}')
+
+            delay = retry_delay(backoff, attempt, retry_after)
+            timings.add('fetch_backoff', delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             limit_per_host=self.max_per_host)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+# aiohttp sessions belong to one event loop, so each loop gets its own fetcher
+_async_fetchers = weakref.WeakKeyDictionary()
+
+
+def get_async_fetcher():
+    '''Returns the fetcher shared by every prospector on the running event loop.'''
+    loop = asyncio.get_running_loop()
+    if loop not in _async_fetchers:
+        _async_fetchers[loop] = AsyncFetcher()
+    return _async_fetchers[loop]
+
+
+async def close_async_fetcher():
+    '''Closes the fetcher of the running event loop. Call before the loop ends.'''
+    fetcher = _async_fetchers.pop(asyncio.get_running_loop(), None)
+    if fetcher is not None:
+        await fetcher.close()
@@ -0,0 +1,100 @@
+'''Lightweight timers used to see where the time in a mining run goes.'''
+
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Timings:
+    '''Thread-safe accumulator of elapsed seconds and call counts by name.'''
+    def __init__(self):
+        self._seconds = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        '''Adds one call of `name` that took `seconds`.'''
+        with self._lock:
+            self._seconds[name] = self._seconds.get(name, 0.0) + seconds
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    @contextmanager
+    def timer(self, name):
+        '''Context manager that adds the time spent inside it to `name`.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def timed(self, name, func):
+        '''Returns `func` wrapped to add the time of every call to `name`.
+
+        None is returned unchanged, so optional hooks can be wrapped blindly.
+        '''
+        if func is None:
+            return None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return wrapper
+
+    def seconds(self, name):
+        return self._seconds.get(name, 0.0)
+
+    def count(self, name):
+        return self._counts.get(name, 0)
+
+    def summary(self):
+        '''Returns a dictionary of {name: {'seconds': float, 'count': int}}.'''
+        with self._lock:
+            return {name: {'seconds': self._seconds[name], 'count': self._counts[name]}
+                    for name in self._seconds}
+
+    def reset(self):
+        with self._lock:
+            self._seconds = {}
+            self._counts = {}
+
+
+def write_summary(path, summary):
+    '''Writes the json-serializable `summary` of a run to `path`.'''
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+@contextmanager
+def profiled(path, top=20):
+    '''Context manager that runs its body under cProfile.
+
+    The raw stats are saved to `path` (readable with `pstats` or snakeviz) and the
+    `top` functions by cumulative time are printed.
+    '''
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+
+
+# Process-wide timings shared by the fetcher and `utils.make_soup`
+TIMINGS = Timings()
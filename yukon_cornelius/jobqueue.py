@@ -0,0 +1,329 @@
+'''A durable queue of mining jobs, worked through by a fixed pool of workers.
+
+Jobs (a site, a range of pages and an export filetype) are rows of a sqlite file.
+Workers claim one job at a time with a lease, which they renew while mining. A job
+whose worker died is claimed again once its lease expires, and a failed job is
+retried after an exponentially growing delay until it runs out of attempts.
+
+Workers only share the queue file, so they can run in any number of processes,
+and on several machines as long as the file is on a filesystem with working
+locks (sqlite's rollback journal is used, not WAL, for that reason).
+'''
+
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+
+from yukon_cornelius import constants
+from yukon_cornelius import registry
+
+Job = namedtuple('Job', ['id', 'site_name', 'export_filetype', 'start_page', 'end_page',
+                         'attempts', 'max_attempts'])
+
+STATUSES = ['pending', 'running', 'done', 'failed']
+
+
+class JobQueue:
+    '''Mining jobs kept in a sqlite file.
+
+    Statuses move from "pending" to "running" when claimed, and on to "done", or
+    back to "pending" after a failure, or to "failed" after the last attempt.
+    '''
+    def __init__(self, path=constants.QUEUE_FILE, backoff=constants.QUEUE_BACKOFF):
+        '''Creates the queue file at `path` if it does not exist yet.
+
+        Args:
+          path: str.
+          backoff: float. Seconds before the first retry of a failed job, doubled
+            for every further attempt.
+        '''
+        self.path = path
+        self.backoff = backoff
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                       'id INTEGER PRIMARY KEY AUTOINCREMENT, site_name TEXT, '
+                       'export_filetype TEXT, start_page INTEGER, end_page INTEGER, '
+                       'status TEXT, attempts INTEGER, max_attempts INTEGER, '
+                       'available_at REAL, lease_owner TEXT, lease_expires REAL, '
+                       'rows INTEGER, error TEXT, updated_at REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_by_status '
+                       'ON jobs (status, available_at)')
+
+    @contextmanager
+    def _connect(self):
+        '''Yields a connection and commits (or rolls back) and closes it afterwards.'''
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def add(self, site_name, export_filetype='csv', start_page=0, end_page=None,
+            max_attempts=constants.QUEUE_MAX_ATTEMPTS):
+        '''Adds a pending job and returns its id.
+
+        Args:
+          site_name: str.
+          export_filetype: str. One of `constants.VALID_ORE_EXPORT_TYPES`.
+          start_page: int. First page to mine.
+          end_page: int. Page to stop before, or None to mine to the end of the site.
+          max_attempts: int. Number of times the job is tried before it fails.
+        '''
+        if export_filetype not in constants.VALID_ORE_EXPORT_TYPES:
+            raise ValueError(f'{export_filetype} is not a valid export filetype. Valid '
+                             f'types are: {constants.VALID_ORE_EXPORT_TYPES}')
+        if end_page is not None and end_page <= start_page:
+            raise ValueError(f'end_page must be after start_page. Got {start_page} to '
+                             f'{end_page}')
+
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                'INSERT INTO jobs (site_name, export_filetype, start_page, end_page, '
+                'status, attempts, max_attempts, available_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?)',
+                (site_name, export_filetype, start_page, end_page, 'pending',
+                 max_attempts, now, now))
+            return cursor.lastrowid
+
+    def claim(self, worker_id, lease_seconds=constants.QUEUE_LEASE_SECONDS):
+        '''Leases the oldest available job to `worker_id` and returns it.
+
+        Pending jobs whose retry delay has passed are available, and so are running
+        jobs whose lease expired. A job whose lease expired on its last attempt
+        (e.g. because it keeps killing its worker) is marked as failed instead.
+        Returns None if no job is available.
+        '''
+        while True:
+            now = time.time()
+            with self._connect() as db:
+                row = db.execute(
+                    'SELECT id, site_name, export_filetype, start_page, end_page, '
+                    'attempts, max_attempts, status, lease_expires FROM jobs '
+                    'WHERE (status = ? AND available_at <= ?) '
+                    'OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT 1',
+                    ('pending', now, 'running', now)).fetchone()
+                if row is None:
+                    return None
+
+                # Only one worker wins the job if several picked it
+                attempts, max_attempts, status, lease_expires = row[5:]
+                if status == 'running' and attempts >= max_attempts:
+                    db.execute('UPDATE jobs SET status = ?, error = ?, '
+                               'lease_expires = NULL, updated_at = ? '
+                               'WHERE id = ? AND status = ? AND lease_expires IS ?',
+                               ('failed', 'Lease expired on the last attempt', now,
+                                row[0], status, lease_expires))
+                    continue
+                updated = db.execute(
+                    'UPDATE jobs SET status = ?, attempts = attempts + 1, '
+                    'lease_owner = ?, lease_expires = ?, updated_at = ? '
+                    'WHERE id = ? AND status = ? AND lease_expires IS ?',
+                    ('running', worker_id, now + lease_seconds, now, row[0], status,
+                     lease_expires)).rowcount
+            if updated:
+                return Job(*row[:5], attempts=attempts + 1, max_attempts=max_attempts)
+
+    def renew(self, job_id, worker_id, lease_seconds=constants.QUEUE_LEASE_SECONDS):
+        '''Extends the lease of `worker_id` on a job. Returns False if it was lost.'''
+        now = time.time()
+        with self._connect() as db:
+            return db.execute(
+                'UPDATE jobs SET lease_expires = ?, updated_at = ? '
+                'WHERE id = ? AND status = ? AND lease_owner = ?',
+                (now + lease_seconds, now, job_id, 'running', worker_id)).rowcount == 1
+
+    def complete(self, job_id, worker_id, rows=None):
+        '''Marks a job leased to `worker_id` as done. Returns False if it was lost.'''
+        with self._connect() as db:
+            return db.execute(
+                'UPDATE jobs SET status = ?, rows = ?, error = NULL, '
+                'lease_expires = NULL, updated_at = ? '
+                'WHERE id = ? AND status = ? AND lease_owner = ?',
+                ('done', rows, time.time(), job_id, 'running', worker_id)).rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        '''Records a failed attempt of a job leased to `worker_id`.
+
+        The job is retried after `backoff * 2 ** (attempts - 1)` seconds, or marked
+        as failed if it used up its attempts. Returns False if the lease was lost.
+        '''
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute('SELECT attempts, max_attempts FROM jobs '
+                             'WHERE id = ? AND status = ? AND lease_owner = ?',
+                             (job_id, 'running', worker_id)).fetchone()
+            if row is None:
+                return False
+            attempts, max_attempts = row
+            status = 'failed' if attempts >= max_attempts else 'pending'
+            delay = self.backoff * 2 ** (attempts - 1)
+            db.execute('UPDATE jobs SET status = ?, error = ?, available_at = ?, '
+                       'lease_expires = NULL, updated_at = ? WHERE id = ?',
+                       (status, error, now + delay, now, job_id))
+            return True
+
+    def retry_failed(self):
+        '''Makes every failed job pending again, with all its attempts. Returns how
+        many there were.'''
+        now = time.time()
+        with self._connect() as db:
+            return db.execute('UPDATE jobs SET status = ?, attempts = 0, '
+                              'available_at = ?, updated_at = ? WHERE status = ?',
+                              ('pending', now, now, 'failed')).rowcount
+
+    def counts(self):
+        '''Returns the number of jobs of every status.'''
+        counts = dict.fromkeys(STATUSES, 0)
+        with self._connect() as db:
+            for status, count in db.execute('SELECT status, COUNT(*) FROM jobs '
+                                            'GROUP BY status'):
+                counts[status] = count
+        return counts
+
+    def jobs(self, status=None):
+        '''Returns every job (of `status`, if given) as a dict, oldest first.'''
+        query = ('SELECT id, site_name, export_filetype, start_page, end_page, status, '
+                 'attempts, max_attempts, lease_owner, rows, error FROM jobs')
+        args = ()
+        if status is not None:
+            query += ' WHERE status = ?'
+            args = (status,)
+        with self._connect() as db:
+            cursor = db.execute(query + ' ORDER BY id', args)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def is_drained(self):
+        '''Returns True if no job is pending or running.'''
+        counts = self.counts()
+        return counts['pending'] == 0 and counts['running'] == 0
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+class LeaseLostError(Exception):
+    '''Raised when a worker finds that another worker took over its job.'''
+    pass
+
+
+class Lease:
+    '''The lease of a worker on a job, renewed in the background while it runs.
+
+    Targets should call `check` regularly, and before making their result
+    visible, so that a worker that lost its job stops instead of writing the same
+    output as the worker that took it over.
+    '''
+    def __init__(self, queue, job, worker_id, lease_seconds):
+        self.job = job
+        self.worker_id = worker_id
+        self.lost = False
+        self._stop = threading.Event()
+        interval = lease_seconds / 3
+
+        def renew():
+            while not self._stop.wait(interval):
+                if not queue.renew(job.id, worker_id, lease_seconds):
+                    self.lost = True
+                    return
+
+        self._thread = threading.Thread(target=renew, daemon=True,
+                                        name=f'lease-{job.id}')
+        self._thread.start()
+
+    def check(self):
+        '''Raises LeaseLostError if another worker took over the job.'''
+        if self.lost:
+            raise LeaseLostError(f'Job {self.job.id} was taken over by another '
+                                       f'worker')
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(path, target, worker_id=None, lease_seconds=constants.QUEUE_LEASE_SECONDS,
+               poll_interval=constants.QUEUE_POLL_INTERVAL, until_drained=True,
+               backoff=constants.QUEUE_BACKOFF):
+    '''Claims and runs jobs from the queue at `path` and returns how many it finished.
+
+    Jobs whose lease was lost while they ran are left to the worker that took them
+    over, and are not counted.
+
+    Args:
+      path: str. Queue file.
+      target: callable. Accepts a Job and its Lease, and returns the number of Ore
+        mined. Any exception other than LeaseLostError fails the attempt.
+      worker_id: str. Name of this worker in leases. Defaults to host, process and
+        thread.
+      lease_seconds: float. Length of leases, renewed every third of it.
+      poll_interval: float. Seconds to wait when no job is available.
+      until_drained: bool. Whether to return once no job is pending or running.
+        Otherwise the worker waits for new jobs forever.
+      backoff: float. See `JobQueue`.
+    '''
+    queue = JobQueue(path, backoff=backoff)
+    worker_id = worker_id or default_worker_id()
+    num_jobs = 0
+    while True:
+        job = queue.claim(worker_id, lease_seconds)
+        if job is None:
+            if until_drained and queue.is_drained():
+                return num_jobs
+            time.sleep(poll_interval)
+            continue
+
+        lease = Lease(queue, job, worker_id, lease_seconds)
+        try:
+            rows = target(job, lease)
+        except LeaseLostError:
+            lease.stop()
+            continue
+        except Exception:
+            lease.stop()
+            finished = queue.fail(job.id, worker_id, traceback.format_exc())
+        else:
+            lease.stop()
+            finished = queue.complete(job.id, worker_id, rows)
+        if finished:
+            num_jobs += 1
+
+
+def _work(path, target, registries, kwargs):
+    registry.install(registries)
+    run_worker(path, target, **kwargs)
+
+
+def run_workers(path, target, num_workers=constants.QUEUE_WORKERS, **kwargs):
+    '''Works through the queue at `path` with `num_workers` processes.
+
+    Each process keeps claiming jobs until the queue is drained, so it is started
+    once per run rather than once per job. Returns the job counts afterwards.
+
+    Args:
+      path: str. Queue file.
+      target: callable. See `run_worker`. Must be picklable.
+      num_workers: int.
+      kwargs: Passed on to `run_worker`.
+    '''
+    workers = [multiprocessing.Process(target=_work, name=f'queue-worker-{i}',
+                                       args=(path, target, registry.snapshot(), kwargs))
+               for i in range(num_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return JobQueue(path).counts()
@@ -0,0 +1,58 @@
+'''Stand-ins for heavy modules, imported the first time they are used.
+
+Importing pandas, requests or bs4 takes a large part of the startup time of
+`mine.py` and of every worker process, while many runs never need some of them
+(e.g. csv exports without a schema never need pandas). Modules use
+
+    pd = lazy.LazyModule('pandas')
+
+in place of `import pandas as pd`, and `pd.DataFrame` imports pandas on first use.
+'''
+
+import importlib
+import importlib.util
+
+
+class LazyModule:
+    '''Imports module `name` when one of its attributes is first looked up.'''
+
+    def __init__(self, name, submodules=()):
+        '''
+        Args:
+          name: str. Module to import, e.g. "pandas".
+          submodules: iterable of str. Submodules imported along with it, for
+            packages that don't import them on their own, e.g. ["parquet"].
+        '''
+        self._name = name
+        self._submodules = tuple(submodules)
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            module = importlib.import_module(self._name)
+            for submodule in self._submodules:
+                importlib.import_module(f'{self._name}.{submodule}')
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attribute):
+        value = getattr(self._load(), attribute)
+        # Later lookups don't come through here
+        setattr(self, attribute, value)
+        return value
+
+    @property
+    def loaded(self):
+        '''Whether the module was imported yet.'''
+        return self._module is not None
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f'<LazyModule {self._name} ({state})>'
+
+
+def optional(name, submodules=()):
+    '''Returns a LazyModule for `name`, or None if it is not installed.'''
+    if importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name, submodules)
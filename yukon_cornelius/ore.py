@@ -0,0 +1,124 @@
+'''Records that hold "mined" attributes, one per post, and columnar batches of them.'''
+
+from functools import lru_cache
+
+from yukon_cornelius import lazy
+
+pd = lazy.LazyModule('pandas')
+
+
+class Ore:
+    '''Data structure for holding "mined" attributes.
+
+    Values live in a fixed-length list indexed by attribute position, and the number
+    of filled (truthy) values is tracked as values are set, so `complete` and `bare`
+    are constant time. Use `make_ore_type` to get a subclass for a site's attributes,
+    which also exposes every attribute as a property (e.g. `ore.id`).
+    '''
+    __slots__ = ('_values', '_num_filled', 'site_name')
+    _attr_names = ()
+
+    def __init__(self, site_name, attr_default=None):
+        '''Sets every attribute to `attr_default`.'''
+        self._values = [attr_default] * len(self._attr_names)
+        self._num_filled = len(self._attr_names) if attr_default else 0
+        self.site_name = site_name
+
+    def set(self, index, value):
+        '''Sets the attribute at position `index` to `value`.'''
+        self._num_filled += bool(value) - bool(self._values[index])
+        self._values[index] = value
+
+    @property
+    def values(self):
+        '''Returns a tuple of the current values, in attribute order.'''
+        return tuple(self._values)
+
+    @property
+    def attributes(self):
+        '''Returns a dictionary of the current attributes and values.'''
+        return dict(zip(self._attr_names, self._values))
+
+    @property
+    def complete(self):
+        '''Returns True if all attributes have a non-None value.'''
+        return self._num_filled == len(self._attr_names)
+
+    @property
+    def bare(self):
+        '''Returns true if all attributes are None.'''
+        return self._num_filled == 0
+
+    def __reduce__(self):
+        return (_rebuild_ore, (self._attr_names, self.site_name, self._values))
+
+    def __repr__(self):
+        val_list = ', '.join([f'{name}={value}'
+                              for name, value in zip(self._attr_names, self._values)])
+        return f'Ore({val_list})'
+
+
+def _ore_property(index):
+    def fget(self):
+        return self._values[index]
+
+    def fset(self, value):
+        self.set(index, value)
+
+    return property(fget, fset)
+
+
+@lru_cache(maxsize=None)
+def make_ore_type(attrs):
+    '''Returns the Ore subclass holding the attributes in the tuple `attrs`.'''
+    reserved = [name for name in attrs if hasattr(Ore, name)]
+    if reserved:
+        raise ValueError(f'Attribute names {reserved} are reserved by Ore')
+
+    namespace = {'__slots__': (), '_attr_names': attrs}
+    for i, name in enumerate(attrs):
+        namespace[name] = _ore_property(i)
+    return type('Ore', (Ore,), namespace)
+
+
+def _rebuild_ore(attrs, site_name, values):
+    ore = make_ore_type(attrs)(site_name)
+    for i, value in enumerate(values):
+        ore.set(i, value)
+    return ore
+
+
+class OreBatch:
+    '''Columnar container of Ore from a single site.
+
+    Keeps one list per attribute instead of one object per post, and can be turned
+    into a DataFrame without building a dictionary for every row.
+    '''
+    def __init__(self, attributes, site_name):
+        self.attributes = tuple(attributes)
+        self.site_name = site_name
+        self.columns = {name: [] for name in self.attributes}
+        self._column_list = [self.columns[name] for name in self.attributes]
+
+    def append(self, ore):
+        '''Adds the values of `ore` as the next row.'''
+        if ore.site_name != self.site_name:
+            raise ValueError(f'All Ore should come from {self.site_name}. Found Ore '
+                             f'from {ore.site_name}')
+        for column, value in zip(self._column_list, ore._values):
+            column.append(value)
+
+    def extend(self, ore_list):
+        for ore in ore_list:
+            self.append(ore)
+
+    def clear(self):
+        for column in self._column_list:
+            column.clear()
+
+    def __len__(self):
+        return len(self._column_list[0]) if self._column_list else 0
+
+    def to_frame(self):
+        '''Returns a DataFrame with one column per attribute.'''
+        return pd.DataFrame(self.columns, columns=list(self.attributes))
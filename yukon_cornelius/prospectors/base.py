@@ -1,51 +1,74 @@
-import requests
-import bs4
+import asyncio
+import functools
+import itertools
 import re
+import time
+import types
+from collections import namedtuple
 from datetime import datetime
 
 from .. import constants
+from .. import dedupe
+from .. import instrumentation
+from .. import lazy
 from .. import utils
+from ..ore import make_ore_type
+from .prefetch import PagePrefetcher
+
+bs4 = lazy.LazyModule('bs4')
+lxml = lazy.LazyModule('lxml', ['etree', 'html'])
 
 class InvalidSourceError(Exception):
     '''Raised when an invalid html or url string is passed to Propectors.'''
     pass
 
-class _Ore:
-    '''Data structure for holding "mined" attributes.'''
-    def __init__(self, attrs, site_name, attr_default=None):
-        '''Create instance attributes from `attrs` and defaults to `default`.'''
-        for attr in attrs:
-            setattr(self, attr, attr_default)
-        self._attr_names = attrs
-        self.site_name = site_name
+# Resolved tester and processor for one attribute. Either may be None. Followers are
+# the entries of attributes found in the same tag (see `SAME_TAG`)
+_Dispatch = namedtuple('_Dispatch', ['index', 'attribute', 'tester', 'processor',
+                                     'followers'])
 
-    @property
-    def attributes(self):
-        '''Returns a dictionary of the current attributes and values.'''
-        return {name: getattr(self, name) for name in self._attr_names}
 
-    @property
-    def complete(self):
-        '''Returns True if all attributes have a non-None value.'''
-        if all(self.attributes.values()):
-            return True
-        else:
-            return False
+def per_tag(method):
+    '''Makes a prospector method taking a tag compute its result once per visited tag.
 
-    @property
-    def bare(self):
-        '''Returns true if all attributes are None.'''
-        if not any(self.attributes.values()):
-            return True
-        else:
-            return False
+    Testers and processors of several attributes can share the work of parsing a tag
+    through a `per_tag` method, e.g.
+
+        @per_tag
+        def _poster(self, tag):
+            return tag.find('a').attrs['name'], tag.find('b').text
+
+    Results are kept until the walk moves on to the next tag.
+    '''
+    name = method.__name__
+
+    @functools.wraps(method)
+    def memoized(self, tag):
+        key = (name, id(tag))
+        cached = self._tag_memo.get(key)
+        if cached is not None and cached[0] is tag:
+            return cached[1]
+        value = method(self, tag)
+        self._tag_memo[key] = (tag, value)
+        return value
+    return memoized
+
+
+@functools.lru_cache(maxsize=None)
+def compile_patterns(class_constants):
+    '''Returns every `*_PATTERN` string of a class in `constants`, compiled.
+
+    The result has an attribute of the same name for each pattern. Patterns are only
+    compiled once per class, however many prospectors use them.
+    '''
+    patterns = {}
+    if class_constants is not None:
+        for name, value in vars(class_constants).items():
+            if name.endswith('_PATTERN') and isinstance(value, str):
+                patterns[name] = re.compile(value)
+    return types.SimpleNamespace(**patterns)
 
-    def __repr__(self):
-        val_list = ', '.join([f'{name}={self.attributes[name]}'
-                              for name in self.attributes]) 
-        return f'Ore({val_list})'
 
-        
 class ProspectorBase: 
     '''Base class for all prospectors.
     
@@ -83,8 +106,100 @@ class ProspectorBase:
         def _is_poster_age_tag(self, tag):
             # Do some checks
             return <True | False
+
+    Multi-page sites whose pages can be addressed by index should also implement
+
+        def _page_source(self, page: int) -> str
+
+    which allows the default `_turn_page` to move through the site and enables
+    prefetching of upcoming pages (see `prefetch_pages` below).
+
+    Attributes that can be recognized by tag name and class alone can instead be
+    declared in `SELECTORS`, which maps an attribute to a (name, class) tuple where
+    either item may be None to match anything:
+
+    class MySite(ProspectorBase):
+        SELECTORS = {'id': ('span', 'postid')}
+
+    Selected tags are found with a single dictionary lookup per tag. If a tester is
+    also defined for a selected attribute, it is only called on tags that match the
+    selector. In the same way, `_is_forum_end` is only called on tags matching
+    `FORUM_END_SELECTOR`, if it is set.
+
+    Tags of a page are visited in document order, and the page is turned once they
+    run out. Parts of a page known to hold nothing of interest, like signatures or
+    navigation, can be listed in `SKIP_SELECTORS` as (name, class) tuples. Matching
+    tags are checked for the forum end only, and the tags inside them are not
+    visited at all.
+
+    Attributes found in the same tag can be grouped in `SAME_TAG`:
+
+    class MySite(ProspectorBase):
+        SELECTORS = {'id': ('span', 'poster')}
+        SAME_TAG = [('id', 'name')]
+
+    Only the first attribute of a group needs a tester or selector, and every tag it
+    matches fills the other attributes of the group as well, through their
+    processors.
+
+    Every `*_PATTERN` of the class's constants is compiled once into `patterns`, e.g.
+    `self.patterns.POST_DATE_PATTERN.search(...)`. Testers and processors should get
+    the text of a tag with `tag_text`, which only joins the text of a tag once
+    however many of them need it. Other work shared by several of them can be done
+    in a method decorated with `per_tag`. Attributes with the same tester method
+    and selector as an earlier attribute (e.g. `_is_name_tag = _is_id_tag`) are
+    grouped with it automatically.
+
+    Sites configured with the "lxml-etree" parser are walked as lxml elements, so
+    their testers and processors receive `lxml.html.HtmlElement` instead of bs4 tags.
+    `utils.check_class` works with both.
+
+    Very large local files can be mined without loading them whole by adding a
+    "stream" to the config of an "lxml-etree" site, e.g.
+
+        "stream": {"name": "div", "class": "post"}
+
+    The file is then parsed while it is walked (see `utils.HtmlFileStream`). Testers
+    and processors see every selected tag and everything inside it, in order, and
+    the tags outside of them once they have been parsed.
+
+    Time spent fetching and parsing pages is always recorded, along with the number of
+    tags visited, pages loaded and Ore mined (see `stats`). Prospectors created with
+    `profile=True` also time the tag walk and every tester and processor, under
+    "walk", "test_<attribute>" and "process_<attribute>".
     '''
-    def __init__(self, site_name):
+    SELECTORS = {}
+    FORUM_END_SELECTOR = None
+    SKIP_SELECTORS = ()
+    SAME_TAG = ()
+
+    def __init__(self, site_name, prefetch_pages=None, sink=None, keep_ore=True,
+                 start_page=0, end_page=None, start_source=None, checkpoint=None,
+                 known_ids=None, profile=None, load=True):
+        '''Loads the configuration for `site_name` and makes the first soup.
+
+        Args:
+          site_name: str. A website defined in the config file `constants.CONFIG_FILE`.
+          prefetch_pages: int. Number of upcoming pages to load in the background
+            while the current page is mined. Defaults to the "prefetch_pages" value
+            in the website config, or `constants.DEFAULT_PREFETCH_PAGES`.
+          sink: sinks.OreSink. If given, every Ore is written to it as soon as it is
+            complete. The caller is responsible for closing it.
+          keep_ore: bool. Whether to also keep every Ore in `ore_cart`.
+          start_page: int. Page to start mining from. Pages other than 0 require
+            `_page_source`.
+          end_page: int. If given, mining stops before turning to this page.
+          start_source: str. Source of `start_page`, for sites whose pages can't be
+            addressed with `_page_source` (e.g. when resuming from a checkpoint).
+          checkpoint: checkpoint.Checkpoint. If given, the mining state is saved to
+            it every time a page is turned.
+          known_ids: iterable. Ore whose id (see `ore_id`) is in `known_ids` was
+            exported by an earlier run and is skipped.
+          profile: bool. Whether to time every tester, processor and step of the tag
+            walk. Defaults to the "profile" value in the website config, or False.
+          load: bool. Whether to make the first soup now. If False, it is made when
+            mining starts, which lets `amine` load it without blocking.
+        '''
         config = utils.load_website_config(site_name)
 
         # Load class specific constants if defined in `constants.py`
@@ -93,28 +208,250 @@ class ProspectorBase:
             self.constants = getattr(constants, config['prospector_class'])
         else:
             self.constants = None
+        self.patterns = compile_patterns(self.constants)
 
         # Class-specific attributes
         self.config = config
         self.site_name = site_name
         self.root_source = self.config['source']
         self.attributes = self.config['attributes']
+        self.schema = self.config.get('schema', {})
+        self._ore_type = make_ore_type(tuple(self.attributes))
+        self._parser = self.config.get('parser', constants.DEFAULT_PARSER)
+        self._uses_etree = self._parser == 'lxml-etree'
+        self._timings = instrumentation.Timings()
+        self._profile = profile if profile is not None else config.get('profile', False)
+        self._ends_pages_early = type(self)._is_page_end is not ProspectorBase._is_page_end
+        if self._profile:
+            self._instrument_hooks()
+        if self.FORUM_END_SELECTOR is not None:
+            self._is_forum_end = self._only_selected(self.FORUM_END_SELECTOR,
+                                                     self._is_forum_end)
+        self._build_dispatch()
+        self._skipped = set(self.SKIP_SELECTORS)
+        if (None, None) in self._skipped:
+            raise ValueError('Skip selectors must have a tag name or a class')
+        # Results of `tag_text` and `per_tag` methods for the tag visited at the moment
+        self._tag_memo = {}
 
         # State variables
         self._current_source = self.config['source']
+        if start_source is not None:
+            self._current_source = start_source
+        elif start_page != 0:
+            self._current_source = self._page_source(start_page)
+            if self._current_source is None:
+                raise ValueError(f'Can not start "{site_name}" at page {start_page}: '
+                                 f'{type(self).__name__} does not define `_page_source`')
         self._current_tag = None
-        self._current_ore = _Ore(self.attributes, self.site_name)
+        self._current_ore = self._ore_type(self.site_name)
         self._soup = None
         self._is_finished = False
-        self._current_page = 0
+        self._current_page = start_page
+        self._end_page = end_page
+        self._num_tags = 0
+        self._num_pages = 0
+        self._started = None
+
+        # Repeated pages and Ore
+        self._repeated_page_action = config.get('on_repeated_page',
+                                                constants.DEFAULT_REPEATED_PAGE_ACTION)
+        self._page_digests = set()
+        self._prefetched_digests = {}
+        self._repeated_in_a_row = 0
+        self._num_repeated_pages = 0
+        self._num_duplicates = 0
+        self._seen = None
+        dedupe_config = config.get('dedupe')
+        if dedupe_config is not None:
+            key_attributes = dedupe_config.get('attributes', self.attributes)
+            self._dedupe_indexes = [self.attributes.index(attribute)
+                                    for attribute in key_attributes]
+            max_entries = dedupe_config.get('max_entries', constants.SEEN_MAX_ENTRIES)
+            if dedupe_config.get('persist', False):
+                # Only Ore already in the export may be dropped, so the saved
+                # fingerprints are only loaded when appending to it
+                appending = sink is not None and sink.num_rows > 0
+                self._seen = dedupe.SeenSet.for_site(site_name, max_entries,
+                                                     load=appending)
+            else:
+                self._seen = dedupe.SeenSet(max_entries)
+
+        # Optional background loading of upcoming pages
+        if prefetch_pages is None:
+            prefetch_pages = config.get('prefetch_pages',
+                                        constants.DEFAULT_PREFETCH_PAGES)
+        self._prefetcher = None
+        if prefetch_pages > 0:
+            self._prefetcher = PagePrefetcher(self._prefetch_soup, prefetch_pages)
 
         # make the first soup
-        self.make_soup()
-        self._move_to_next_tag()
+        if load:
+            self.make_soup()
 
         # List to hold Ore objects
         self._ore_cart = []
         self._num_mines = 0
+        self._num_ore = 0
+        if sink is not None:
+            self._num_ore = sink.num_rows
+        self._sink = sink
+        self._keep_ore = keep_ore
+        self._checkpoint = checkpoint
+
+        # Ids of the newest page with Ore, for incremental re-mining
+        self._known_ids = set(known_ids or ())
+        id_attribute = self.config.get('id_attribute', constants.DEFAULT_ID_ATTRIBUTE)
+        self._id_index = None
+        if id_attribute in self.attributes:
+            self._id_index = self.attributes.index(id_attribute)
+        self._last_ore_page = None
+        self._last_ore_source = None
+        self._last_page_ids = []
+
+    def _instrument_hooks(self):
+        '''Replaces the page-level hooks of this instance with timed versions.'''
+        timings = self._timings
+        self._move_to_next_tag = timings.timed('walk', self._move_to_next_tag)
+        self._page_tags = timings.timed('walk', self._page_tags)
+        if self._ends_pages_early:
+            self._is_page_end = timings.timed('test_page_end', self._is_page_end)
+        self._is_forum_end = timings.timed('test_forum_end', self._is_forum_end)
+
+    def _build_dispatch(self):
+        '''Resolves the tester, processor and selector of every attribute once.
+
+        Attributes without a tester or selector are recorded in `_missing_testers`
+        and reported by `mine`. Attributes filled from the tag of another one become
+        its followers, and are not tested on their own. These are the attributes
+        grouped in `SAME_TAG`, and those with the same tester method and selector as
+        an earlier attribute.
+        '''
+        self._selected = {}
+        self._unselected = []
+        self._missing_testers = []
+        followers = self.same_tag_followers(self.attributes)
+        # First attribute with each (tester method, selector)
+        leaders = {}
+        entries = {}
+        for i, attribute in enumerate(self.attributes):
+
+            # Function that accepts a tag and returns a boolean
+            tester = getattr(self, f'_is_{attribute}_tag', None)
+
+            # Function that accepts a tag and returns a string
+            processor = getattr(self, f'_process_{attribute}', None)
+
+            key = (getattr(tester, '__func__', tester), self.SELECTORS.get(attribute))
+            if attribute not in followers and key != (None, None):
+                if key in leaders:
+                    followers[attribute] = leaders[key]
+                else:
+                    leaders[key] = attribute
+
+            if self._profile:
+                tester = self._timings.timed(f'test_{attribute}', tester)
+                processor = self._timings.timed(f'process_{attribute}', processor)
+
+            entries[attribute] = _Dispatch(i, attribute, tester, processor, [])
+
+        self._has_followers = bool(followers)
+        for follower, leader in followers.items():
+            while leader in followers:
+                leader = followers[leader]
+            entries[leader].followers.append(entries.pop(follower))
+
+        for attribute, entry in entries.items():
+            selector = self.SELECTORS.get(attribute)
+            if selector is not None:
+                name, classname = selector
+                if name is None and classname is None:
+                    raise ValueError(f'Selector for "{attribute}" must have a tag name '
+                                     f'or a class')
+                self._selected.setdefault((name, classname), []).append(entry)
+            elif entry.tester is not None:
+                self._unselected.append(entry)
+            else:
+                self._missing_testers.append(f'_is_{attribute}_tag')
+
+    @classmethod
+    def same_tag_followers(cls, attributes):
+        '''Returns {attribute: first attribute of its group} for the attributes of
+        `attributes` that are filled from the tag of another one (see `SAME_TAG`).'''
+        followers = {}
+        for group in cls.SAME_TAG:
+            present = [attribute for attribute in group if attribute in attributes]
+            for attribute in present[1:]:
+                followers[attribute] = present[0]
+        return followers
+
+    def _tag_classes(self, tag):
+        '''Returns the name and the classes of `tag`.'''
+        if self._uses_etree:
+            return tag.tag, tag.get('class', '').split()
+        return tag.name, tag.attrs.get('class', ())
+
+    def _only_selected(self, selector, tester):
+        '''Returns `tester`, skipped for tags not matching `selector`.
+
+        Tag names are compared first, as they are the cheapest to get.
+        '''
+        name, classname = selector
+        if name is None and classname is None:
+            raise ValueError('Selectors must have a tag name or a class')
+
+        if self._uses_etree:
+            def selected_tester(tag):
+                return (name is None or tag.tag == name) and \
+                    (classname is None or classname in tag.get('class', '').split()) \
+                    and tester(tag)
+        else:
+            def selected_tester(tag):
+                return (name is None or tag.name == name) and \
+                    (classname is None or classname in tag.attrs.get('class', ())) \
+                    and tester(tag)
+        return selected_tester
+
+    def tag_text(self, tag):
+        '''Returns the text of `tag` and everything inside it.
+
+        The text is kept until the walk moves on to the next tag, so testers and
+        processors of the same tag don't join it again.
+        '''
+        cached = self._tag_memo.get(id(tag))
+        if cached is not None and cached[0] is tag:
+            return cached[1]
+        if self._uses_etree:
+            text = tag.text_content()
+        else:
+            text = tag.text
+        self._tag_memo[id(tag)] = (tag, text)
+        return text
+
+    def _matching_attributes(self, tag):
+        '''Returns the dispatch entries of all attributes found in `tag`, in order.'''
+        candidates = list(self._unselected)
+        if self._selected:
+            name, classes = self._tag_classes(tag)
+            keys = [(name, None)]
+            for classname in classes:
+                keys.append((name, classname))
+                keys.append((None, classname))
+            for key in keys:
+                candidates.extend(self._selected.get(key, ()))
+            if len(candidates) > 1:
+                candidates.sort()
+
+        return [entry for entry in candidates
+                if entry.tester is None or entry.tester(tag)]
+
+    @staticmethod
+    def _with_followers(matches):
+        '''Returns the dispatch entries of `matches` and of their followers, in order.'''
+        matches = matches + [follower for entry in matches
+                             for follower in entry.followers]
+        matches.sort()
+        return matches
 
     @property
     def state(self):
@@ -127,7 +464,24 @@ class ProspectorBase:
             'soup': self._soup,
             'is_finished': self._is_finished,
             'num_mines': self._num_mines,
-            'num_ore': len(self.ore_cart),
+            'num_ore': self._num_ore,
+            'num_tags': self._num_tags,
+            'num_pages': self._num_pages,
+            'timings': self._timings.summary(),
+        }
+
+    @property
+    def stats(self):
+        '''Returns a json-serializable summary of the work done so far.'''
+        return {
+            'site_name': self.site_name,
+            'elapsed': self._timings.seconds('mine'),
+            'num_tags': self._num_tags,
+            'num_pages': self._num_pages,
+            'num_ore': self._num_ore,
+            'num_duplicates': self._num_duplicates,
+            'num_repeated_pages': self._num_repeated_pages,
+            'timings': self._timings.summary(),
         }
     
     def set_state(self, var_name, value):
@@ -160,92 +514,427 @@ class ProspectorBase:
         print(f'{self.site_name}: {s}')
     
     def mine(self):
-        '''Walks through the forum and extracts post information.'''
-        self.log('Mining started')
-        while True:
-            #self._num_mines += 1
-            # End condition
-            if self._is_finished:
-                return
-
-            if self._current_tag is None or self._is_forum_end(self._current_tag):
-                self._is_finished = True
-                return
+        '''Walks through the forum and extracts post information.
 
-            # Turn the page
-            elif self._is_page_end(self._current_tag):
-                self._turn_page()
+        Resources are released (see `_finish`) even if mining fails.
+        '''
+        succeeded = False
+        try:
+            self._start_mining()
+            if self._soup is None:
                 self.make_soup()
 
-            for i, attribute in enumerate(self.attributes):
-
-                # Function that accepts a tag and returns a boolean
-                tester = f'_is_{attribute}_tag'
+            while self._mine_page():
+                self.make_soup()
+            succeeded = True
+        finally:
+            self._finish(succeeded)
 
-                # Function that accedpts a tag and returns a string
-                processor = f'_process_{attribute}'
+    async def amine(self, executor=None):
+        '''Same as `mine`, without blocking the running event loop.
 
-                # Ensure proper methods are defined for tag testing
-                if not hasattr(self, tester):
-                    raise NotImplementedError(
-                        f'Must implement `{tester}` for "{self.site_name}" website')
+        Pages are fetched asynchronously (see `fetchers.AsyncFetcher`), while parsing
+        and walking each page run in `executor`, so many prospectors can mine
+        concurrently on one loop. Testers and processors only ever see one page at a
+        time, exactly as with `mine`.
 
-                tester = getattr(self, tester)
+        Args:
+          executor: concurrent.futures.Executor. Runs parsing and the tag walk.
+            Defaults to the loop's default executor.
+        '''
+        loop = asyncio.get_running_loop()
+        succeeded = False
+        try:
+            self._start_mining()
+            if self._soup is None:
+                await self.amake_soup(executor)
+
+            while await loop.run_in_executor(executor, self._mine_page):
+                await self.amake_soup(executor)
+            succeeded = True
+        finally:
+            self._finish(succeeded)
+
+    def _start_mining(self):
+        # Ensure proper methods are defined for tag testing
+        if self._missing_testers:
+            raise NotImplementedError(
+                f'Must implement {", ".join(self._missing_testers)} (or add '
+                f'SELECTORS) for "{self.site_name}" website')
 
-                if(tester(self._current_tag)):
-                    if i == 0 and not self._current_ore.bare:
-                        self._dump_ore
+        self.log('Mining started')
+        self._started = time.perf_counter()
+        if self._seen is not None and self._seen.path is not None and \
+                not self._seen.loaded:
+            # The export is written from scratch, so the saved fingerprints no
+            # longer match it, even if this run fails
+            self._seen.save()
+
+    def _mine_page(self):
+        '''Extracts Ore from tags until the current page ends.
+
+        Returns True if the page was turned and the next page must be loaded, or
+        False once mining is finished.
+        '''
+        while True:
+            #self._num_mines += 1
+            # End condition
+            if self._is_finished:
+                return False
 
-                    # Uses a processor if exists
-                    if hasattr(self, processor):
-                        processor = getattr(self, processor)
-                        this_attribute = processor(self._current_tag)
-                    else:
-                        this_attribute = str(self._current_tag)
-                        
-                    setattr(self._current_ore, attribute, this_attribute)
+            if self._current_tag is not None and \
+                self._is_forum_end(self._current_tag):
+                self._is_finished = True
+                return False
+
+            # Turn the page once its tags run out
+            if self._current_tag is None or \
+                (self._ends_pages_early and self._is_page_end(self._current_tag)):
+                if not self._advance_page():
+                    continue
+                self._save_checkpoint()
+                return True
+
+            if self._skipped and self._is_skipped(self._current_tag):
+                if self._tag_memo:
+                    self._tag_memo.clear()
+                self._num_tags += 1
+                self._skip_subtree()
+                continue
+
+            matches = self._matching_attributes(self._current_tag)
+            if matches and self._has_followers:
+                matches = self._with_followers(matches)
+            for i, attribute, _, processor, _ in matches:
+                if i == 0 and not self._current_ore.bare:
+                    self._dump_ore()
+
+                # Uses a processor if exists
+                if processor is not None:
+                    this_attribute = processor(self._current_tag)
+                elif self._uses_etree:
+                    this_attribute = lxml.html.tostring(
+                        self._current_tag, encoding='unicode', with_tail=False)
+                else:
+                    this_attribute = str(self._current_tag)
+
+                self._current_ore.set(i, this_attribute)
 
             # Move on
             if self._current_ore.complete:
                 self._dump_ore()
+            if self._tag_memo:
+                self._tag_memo.clear()
+            self._num_tags += 1
             self._move_to_next_tag()
 
+    def ore_id(self, ore):
+        '''Returns the value identifying `ore` across runs.
+
+        This is the value of the "id_attribute" from the website config (default
+        `constants.DEFAULT_ID_ATTRIBUTE`), or all values joined if the site has no
+        such attribute.
+        '''
+        if self._id_index is not None:
+            return ore.values[self._id_index]
+        return '\x1f'.join(str(value) for value in ore.values)
+
+    def watermark(self):
+        '''Returns the page and ids of the newest Ore, or None if nothing was mined.'''
+        if self._last_ore_page is None:
+            return None
+        return {
+            'current_page': self._last_ore_page,
+            'current_source': self._last_ore_source,
+            'ids': self._last_page_ids,
+        }
+
     def _dump_ore(self):
         '''Adds the current ore (post) to the ore cart and creates a bare ore.'''
-        if not self._current_ore.bare:
+        if self._current_ore.bare:
+            return
+
+        ore_id = self.ore_id(self._current_ore)
+        if self._current_page != self._last_ore_page:
+            self._last_ore_page = self._current_page
+            self._last_ore_source = self._current_source
+            self._last_page_ids = []
+        self._last_page_ids.append(ore_id)
+
+        if ore_id in self._known_ids or not self._is_new(self._current_ore):
+            self._current_ore = self._ore_type(self.site_name)
+            return
+
+        if self._sink is not None:
+            self._sink.write(self._current_ore, page=self._current_page)
+        if self._keep_ore:
             self._ore_cart.append(self._current_ore)
-            self._current_ore = _Ore(self.attributes, self.site_name)
+        self._num_ore += 1
+        self._current_ore = self._ore_type(self.site_name)
 
     def make_soup(self):
-        '''Makes new soup from the current source.'''
-        self._soup = utils.make_soup(self._current_source, self.config['source_type'])
+        '''Makes new soup from the current source.
 
-        # Make tag to mark the end of this page
-        new_soup = bs4.BeautifulSoup()
-        end_tag = new_soup.new_tag('div', attrs={'class': constants.PAGE_END_CLASS})
-        self._soup.insert(-1, end_tag)
-        
-        self._current_tag = self._soup.find('html')
+        Pages whose html was already mined are handled as set by "on_repeated_page"
+        in the website config (see `_on_repeated_page`).
+        '''
+        while True:
+            try:
+                if self._prefetcher is not None:
+                    # Pages from `end_page` on belong to another range
+                    last_page = self._current_page + 1 + self._prefetcher.depth
+                    if self._end_page is not None:
+                        last_page = min(last_page, self._end_page)
+                    upcoming = [self._page_source(page) for page in range(
+                        self._current_page + 1, last_page)]
+                    self._prefetcher.schedule([self._current_source] + upcoming)
+                    self._soup = self._prefetcher.get(self._current_source)
+                    digest = self._prefetched_digests.pop(self._current_source, None)
+                    if digest is not None:
+                        self._check_page(digest)
+                else:
+                    self._soup = self._load_soup(self._current_source,
+                                                 self._page_checker())
+            except utils.RepeatedPageError:
+                if self._on_repeated_page():
+                    continue
+                return
+            self._start_page()
+            return
+
+    async def amake_soup(self, executor=None):
+        '''Makes new soup from the current source without blocking the event loop.
+
+        The prefetcher is not used: pages of many prospectors are already fetched
+        concurrently on the loop.
+        '''
+        while True:
+            try:
+                self._soup = await utils.amake_soup(
+                    self._current_source, self.config['source_type'],
+                    fetch_options=self.config.get('fetch'),
+                    timings=self._timings,
+                    parser=self._parser,
+                    parse_only=self.config.get('parse_only'),
+                    stream=self.config.get('stream'),
+                    check_page=self._page_checker(),
+                    executor=executor)
+            except utils.RepeatedPageError:
+                if self._on_repeated_page():
+                    continue
+                return
+            self._start_page()
+            return
+
+    def _page_checker(self):
+        if self._repeated_page_action == 'mine':
+            return None
+        return self._check_page
+
+    def _check_page(self, digest):
+        '''Raises RepeatedPageError if a page with fingerprint `digest` was mined.'''
+        if digest in self._page_digests:
+            raise utils.RepeatedPageError(f'{self._current_source} repeats an earlier '
+                                          f'page')
+        self._page_digests.add(digest)
+
+    def _on_repeated_page(self):
+        '''Handles a current page that repeats an earlier one.
+
+        With "skip", the page is passed over, up to `constants.MAX_REPEATED_PAGES`
+        times in a row. Otherwise mining is finished.
+
+        Returns:
+          True if the next page must be loaded instead.
+        '''
+        self._num_repeated_pages += 1
+        self._repeated_in_a_row += 1
+        self.log(f'Page {self._current_page} repeats an earlier page')
+        if self._repeated_page_action == 'skip' and \
+            self._repeated_in_a_row < constants.MAX_REPEATED_PAGES and \
+            self._advance_page():
+            return True
+        self._soup = None
+        self._current_tag = None
+        self._is_finished = True
+        return False
+
+    def _advance_page(self):
+        '''Turns the page. Returns False if mining is finished instead.'''
+        if self._end_page is not None and self._current_page + 1 >= self._end_page:
+            self._is_finished = True
+            return False
+        self._turn_page()
+        return not self._is_finished
+
+    def _is_new(self, ore):
+        '''Returns False if Ore with the same "dedupe" attributes was already seen.'''
+        if self._seen is None:
+            return True
+        values = ore.values
+        if self._seen.add(dedupe.fingerprint(*[values[i] for i in self._dedupe_indexes])):
+            return True
+        self._num_duplicates += 1
+        return False
 
+    def _start_page(self):
+        '''Points at the first tag of the fresh soup.
+
+        All tags of the page are collected in document order in one pass (lazily
+        for streams), and the page ends when they run out.
+        '''
+        self._num_pages += 1
+        self._repeated_in_a_row = 0
+        self._tag_memo.clear()
+        self._tag_iter = self._page_tags()
+        self._move_to_next_tag()
+
+    def _page_tags(self):
+        '''Returns an iterator over every tag of the soup, in document order.'''
+        if isinstance(self._soup, utils.HtmlFileStream):
+            return iter(self._soup)
+        if self._uses_etree:
+            return self._soup.iter(lxml.etree.Element)
+        return iter(self._soup.find_all(True))
+
+    def _load_soup(self, source, check_page=None):
+        '''Makes a fresh soup from `source`. May be called from prefetch threads.'''
+        return utils.make_soup(source, self.config['source_type'],
+                               fetch_options=self.config.get('fetch'),
+                               timings=self._timings,
+                               parser=self._parser,
+                               parse_only=self.config.get('parse_only'),
+                               stream=self.config.get('stream'),
+                               check_page=check_page)
+
+    def _prefetch_soup(self, source):
+        '''Loads `source` in a prefetch thread, keeping its fingerprint.
+
+        Fingerprints are checked when the page is used, in page order.
+        '''
+        record = None
+        if self._repeated_page_action != 'mine':
+            record = functools.partial(self._prefetched_digests.__setitem__, source)
+        return self._load_soup(source, record)
+
+    def _save_checkpoint(self):
+        '''Records the page about to be mined and everything exported before it.'''
+        if self._checkpoint is None:
+            return
+        self._checkpoint.save({
+            'site_name': self.site_name,
+            'current_page': self._current_page,
+            'current_source': self._current_source,
+            'num_ore': self._num_ore,
+            'sink': self._sink.position() if self._sink is not None else None,
+        })
+
+    def _finish(self, succeeded):
+        '''Releases resources held while mining, whether it succeeded or not.
+
+        Stops prefetching and flushes the sink. The persisted fingerprints are only
+        saved if mining `succeeded`, as a resumed run mines the Ore after its
+        checkpoint again.
+        '''
+        if self._started is not None:
+            self._timings.add('mine', time.perf_counter() - self._started)
+            self._started = None
+        self._close_prefetcher()
+        if self._sink is not None:
+            self._sink.flush()
+        if succeeded and self._seen is not None and self._seen.path is not None:
+            self._seen.save()
+
+    def _close_prefetcher(self):
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
 
     def _move_to_next_tag(self):
-        '''Moves forward until another Tag or None is found.'''
-        self._current_tag = self._current_tag.next
-        while not isinstance(self._current_tag, bs4.element.Tag):
-            self._current_tag = self._current_tag.next
-            if self._current_tag is None:
-                break
-                
+        '''Moves to the next tag of the page, or None at the end of the page.'''
+        self._current_tag = next(self._tag_iter, None)
+
+    def _is_skipped(self, tag):
+        '''Returns True if `tag` matches one of the `SKIP_SELECTORS`.'''
+        name, classes = self._tag_classes(tag)
+        if (name, None) in self._skipped:
+            return True
+        return any((name, classname) in self._skipped or
+                   (None, classname) in self._skipped for classname in classes)
+
+    def _skip_subtree(self):
+        '''Moves past the current tag and everything inside it.'''
+        tag = self._current_tag
+        if isinstance(self._soup, utils.HtmlFileStream):
+            # Streams yield selected tags before the tags inside them, and other
+            # tags after them
+            self._move_to_next_tag()
+            while self._current_tag is not None and \
+                    any(parent is tag for parent in self._current_tag.iterancestors()):
+                self._move_to_next_tag()
+            return
+
+        if self._uses_etree:
+            inside = sum(1 for _ in tag.iterdescendants(lxml.etree.Element))
+        else:
+            inside = len(tag.find_all(True))
+        # Drops the tags inside without looking at them
+        next(itertools.islice(self._tag_iter, inside, inside), None)
+        self._move_to_next_tag()
+
     def _is_forum_end(self, tag):
         raise NotImplementedError
 
+    def is_forum_end_page(self, page):
+        '''Returns True if page number `page` is past the end of the forum.
+
+        The page is loaded on its own, without changing the mining state, and counts
+        as the end if any of its tags passes `_is_forum_end`. Missing local files
+        also count as the end.
+        '''
+        source = self._page_source(page)
+        if source is None:
+            raise ValueError(f'{type(self).__name__} does not define `_page_source`')
+
+        try:
+            soup = self._load_soup(source)
+        except FileNotFoundError:
+            return True
+
+        if isinstance(soup, utils.HtmlFileStream):
+            tags = iter(soup)
+        elif self._uses_etree:
+            tags = soup.iter(lxml.etree.Element)
+        else:
+            tags = soup.find_all(True)
+        return any(self._is_forum_end(tag) for tag in tags)
+
     def _is_page_end(self, tag):
-        '''Returns True if `tag` signals the end of the page.'''
-        return utils.check_class(tag, constants.PAGE_END_CLASS)
+        '''Returns True if `tag` ends the page before its tags run out.
+
+        Only called for sites that override it.
+        '''
+        return False
+
+    def _page_source(self, page):
+        '''Returns the source of page number `page`, or None if not addressable.'''
+        return None
 
     def _turn_page(self):
-        '''Modifies url or html to point to the next page. Default is no effect.'''
-        pass
+        '''Modifies url or html to point to the next page.
+
+        The default moves to `_page_source(current_page + 1)`, and finishes mining
+        if the site does not define any further pages.
+        '''
+        next_page = self._current_page + 1
+        next_source = self._page_source(next_page)
+        if next_source is None:
+            self._is_finished = True
+            return
+
+        self.log(f'Starting page {next_page}')
+        self.set_state('current_page', next_page)
+        self.set_state('current_source', next_source)
 
 
         
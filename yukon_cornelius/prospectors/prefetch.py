@@ -0,0 +1,55 @@
+'''Background fetching of upcoming pages for multi-page prospectors.'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PagePrefetcher:
+    '''Loads upcoming pages in a bounded thread pool while the current page is mined.
+
+    Pages are keyed by their source, so the order in which a prospector consumes
+    them (and therefore the order of its Ore) is unaffected by the order in which
+    downloads finish.
+    '''
+    def __init__(self, loader, depth):
+        '''Creates a pool of `depth` workers that call `loader(source)`.
+
+        Args:
+          loader: callable. Accepts a source and returns its soup.
+          depth: int. Maximum number of pages loaded ahead of the current page.
+        '''
+        if depth < 1:
+            raise ValueError(f'Prefetch depth must be at least 1. Got {depth}')
+        self._loader = loader
+        self._depth = depth
+        self._pool = ThreadPoolExecutor(max_workers=depth,
+                                        thread_name_prefix='prefetch')
+        self._pending = {}
+
+    @property
+    def depth(self):
+        return self._depth
+
+    def schedule(self, sources):
+        '''Makes sure every source in `sources` is loading and drops all others.'''
+        sources = [s for s in sources if s is not None][:self._depth + 1]
+        for source in list(self._pending):
+            if source not in sources:
+                self._pending.pop(source).cancel()
+
+        for source in sources:
+            if source not in self._pending:
+                self._pending[source] = self._pool.submit(self._loader, source)
+
+    def get(self, source):
+        '''Returns the soup for `source`, waiting for it if it is still loading.'''
+        future = self._pending.pop(source, None)
+        if future is None:
+            return self._loader(source)
+        return future.result()
+
+    def close(self):
+        '''Abandons all pending pages and shuts down the pool.'''
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = {}
+        self._pool.shutdown(wait=False, cancel_futures=True)
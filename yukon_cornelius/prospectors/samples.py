@@ -1,5 +1,7 @@
 '''Sample Prospectors used for testing.'''
 
+import os
+
 from .. import utils
 from .base import ProspectorBase
 
@@ -28,4 +30,33 @@ class SampleNoProcessors(ProspectorBase):
 
 class SampleWithDateProcessor(SampleNoProcessors):
     def _process_date(self, tag):
-        return tag.text
\ No newline at end of file
+        return tag.text
+
+
+class SampleWithSelectors(ProspectorBase):
+    '''Prospector for sample_forum.html using SELECTORS instead of testers.'''
+    SELECTORS = {
+        'id': ('div', 'id'),
+        'name': ('div', 'name'),
+        'date': (None, 'date'),
+        'body': ('p', 'postbody'),
+    }
+
+    def _is_forum_end(self, tag):
+        return utils.check_class(tag, 'forumend')
+
+    def _turn_page(self):
+        self._is_finished = True
+
+
+class SamplePaged(SampleNoProcessors):
+    '''Prospector used for testing of sample_forum.html followed by numbered pages.'''
+
+    def _page_source(self, page):
+        if page == 0:
+            return self.root_source
+        directory = os.path.dirname(self.root_source)
+        return os.path.join(directory, f'sample_forum_page{page}.html')
+
+    def _turn_page(self):
+        ProspectorBase._turn_page(self)
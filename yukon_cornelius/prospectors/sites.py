@@ -1,68 +1,66 @@
 '''Sites-specific Prospectors.'''
 
-import re
 from datetime import datetime
 
-from .. import utils
 from ..prospectors.base import ProspectorBase
 
 class ClassicCars(ProspectorBase):
-    def _is_id_tag(self, tag):
-        condition1 = tag.name == 'span'
-        condition2 = utils.check_class(tag, 'name')
-        return (condition1 and condition2)
+    SELECTORS = {
+        'id': ('span', 'name'),
+        'name': ('span', 'name'),
+        'date': ('span', 'postdetails'),
+        'body': ('span', 'postbody'),
+    }
+    # The poster's name and the id of the post are in one span, which is only
+    # matched once
+    SAME_TAG = [('id', 'name')]
+    FORUM_END_SELECTOR = ('span', 'gen')
 
     def _process_id(self, id_tag):
         return id_tag.find('a').attrs['name']
 
-    def _is_name_tag(self, tag):
-        # Same tag as id tag
-        return self._is_id_tag(tag)
-
     def _process_name(self, name_tag):
         #return str(name_tag)
         return name_tag.find('b').text
 
     def _is_date_tag(self, tag):
-        condition1 = tag.text.startswith('Posted')
-        condition2 = tag.name == 'span'
-        condition3 = utils.check_class(tag, 'postdetails')
-        return (condition1 and condition2 and condition3)
+        # Only called on tags matching SELECTORS['date']
+        return self.tag_text(tag).startswith('Posted')
 
     def _process_date(self, date_tag):
-        '''Converts to datetime object and saves as iso format.'''
-        try:
-            s = re.search(self.constants.POST_DATE_PATTERN, date_tag.text)
-            year = int(s['year'])
-        except TypeError:
-            breakpoint()
+        '''Converts to datetime object and saves as iso format.
+
+        Sites with a "date" column in their schema get the raw text instead, and
+        convert all dates at once when exporting.
+        '''
+        if 'date' in self.schema:
+            return self.tag_text(date_tag)
+
+        s = self.patterns.POST_DATE_PATTERN.search(self.tag_text(date_tag))
+        if s is None:
+            # Left empty, as dates the schema can't convert are
+            return ''
 
         month = self.constants.MONTHS[s['month'].lower()]
-        hour = int(s['hour']) - 1
+        # 12 am is midnight and 12 pm is noon
+        hour = int(s['hour']) % 12
         if s['ampm'] == 'pm':
             hour += 12
         date = datetime(int(s['year']), month, int(s['day']), hour, int(s['minute']))
         return date.isoformat()
 
     def _is_body_tag(self, tag):
-        condition1 = tag.name == 'span'
-        condition2 = utils.check_class(tag, 'postbody')
-        condition3 = tag.text != ''
-        return (condition1 and condition2 and condition3)
+        # Only called on tags matching SELECTORS['body']
+        return self.tag_text(tag) != ''
 
     def _process_body(self, body_tag):
-        return body_tag.text
+        return self.tag_text(body_tag)
 
     def _is_forum_end(self, tag):
-        condition1 = re.search(self.constants.POST_END_PATTERN, tag.text)
-        condition2 = tag.name == 'span'
-        condition3 = utils.check_class(tag, 'gen')
-        return (condition1 and condition2 and condition3)
+        # Only called on tags matching FORUM_END_SELECTOR
+        return self.patterns.POST_END_PATTERN.search(self.tag_text(tag)) is not None
     
-    def _turn_page(self):
-        current_page = self.state['current_page']
-        self.log(f'Starting page {current_page + 1}')
-        self.set_state('current_page', current_page + 1)
-        self.set_state('current_source',
-                       f'{self.root_source}&start={current_page * 15}')
-        self.make_soup()
\ No newline at end of file
+    def _page_source(self, page):
+        if page == 0:
+            return self.root_source
+        return f'{self.root_source}&start={page * self.constants.POSTS_PER_PAGE}'
@@ -0,0 +1,122 @@
+'''Per-host token buckets shared by every thread and process of a run.'''
+
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from yukon_cornelius import constants
+
+
+def parse_retry_after(value):
+    '''Returns the seconds to wait for a Retry-After header value, or None.'''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostRateLimiter:
+    '''Token bucket rate limiter keyed by host.
+
+    The state of each bucket lives in a small file guarded by `flock`, so every
+    thread and process using the same `directory` draws from the same buckets.
+    A host that answers 429 or 503 is slowed down (`penalize`), and recovers
+    gradually as requests succeed again (`reward`).
+    '''
+    def __init__(self, directory=constants.RATE_LIMIT_DIR,
+                 max_slowdown=constants.RATE_LIMIT_MAX_SLOWDOWN):
+        '''
+        Args:
+          directory: str. Where bucket files are kept. Created if needed.
+          max_slowdown: float. Largest factor a penalized host's rate is divided by.
+        '''
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_slowdown = max_slowdown
+
+    @contextmanager
+    def _bucket(self, host):
+        '''Yields the locked state of `host`'s bucket and saves changes to it.'''
+        path = os.path.join(self.directory, host.replace(':', '_') + '.json')
+        with open(path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else {}
+                state.setdefault('tokens', None)
+                state.setdefault('updated', time.time())
+                state.setdefault('slowdown', 1.0)
+                state.setdefault('blocked_until', 0.0)
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self, host, rate, burst=1):
+        '''Blocks until a request to `host` is allowed and returns the seconds waited.
+
+        Args:
+          host: str.
+          rate: float. Requests per second allowed when the host is not penalized.
+          burst: int. Number of requests that may be made back to back.
+        '''
+        waited = 0.0
+        while True:
+            with self._bucket(host) as state:
+                now = time.time()
+                effective_rate = rate / state['slowdown']
+                tokens = burst if state['tokens'] is None else state['tokens']
+                tokens = min(burst, tokens + (now - state['updated']) * effective_rate)
+
+                if now < state['blocked_until']:
+                    wait = state['blocked_until'] - now
+                elif tokens >= 1:
+                    wait = 0.0
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / effective_rate
+
+                state['tokens'] = tokens
+                state['updated'] = now
+
+            if wait == 0.0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def penalize(self, host, retry_after=None):
+        '''Slows down requests to `host` after it answered 429 or 503.
+
+        Args:
+          retry_after: float. Seconds the host asked to wait, if any. No request is
+            allowed until they have passed.
+        '''
+        with self._bucket(host) as state:
+            state['slowdown'] = min(self.max_slowdown, state['slowdown'] * 2)
+            if retry_after:
+                state['blocked_until'] = max(state['blocked_until'],
+                                             time.time() + retry_after)
+
+    def reward(self, host):
+        '''Lets a penalized `host` gradually recover its full rate.'''
+        with self._bucket(host) as state:
+            if state['slowdown'] > 1.0:
+                state['slowdown'] = max(1.0, state['slowdown'] * 0.8)
+
+    def slowdown(self, host):
+        with self._bucket(host) as state:
+            return state['slowdown']
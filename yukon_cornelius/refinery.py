@@ -0,0 +1,82 @@
+'''Bulk conversion of raw Ore values into typed columns, driven by a site's "schema".
+
+A schema maps attributes to a type and optional conversion details, e.g.
+
+    "schema": {
+        "id": {"type": "int"},
+        "name": {"type": "category"},
+        "date": {"type": "datetime",
+                 "pattern": "Posted: \\w+ (\\w+ \\d+, \\d+ \\d+:\\d+ [ap]m)",
+                 "format": "%b %d, %Y %I:%M %p"}
+    }
+
+so processors can return the raw text of a tag and leave the parsing to pandas, one
+column at a time instead of one post at a time.
+'''
+
+import re
+
+from yukon_cornelius import constants
+from yukon_cornelius import lazy
+
+pd = lazy.LazyModule('pandas')
+
+
+def check_schema(schema, attributes):
+    '''Raises ValueError if `schema` can't be applied to Ore with `attributes`.'''
+    for attribute, spec in schema.items():
+        if attribute not in attributes:
+            raise ValueError(f'Schema column "{attribute}" is not one of the attributes '
+                             f'{list(attributes)}')
+
+        column_type = spec.get('type')
+        if column_type not in constants.VALID_SCHEMA_TYPES:
+            raise ValueError(f'{column_type} is not a valid type for "{attribute}". '
+                             f'Valid types are: {constants.VALID_SCHEMA_TYPES}')
+
+        if 'format' in spec and column_type != 'datetime':
+            raise ValueError(f'"format" only applies to datetime columns. Got it for '
+                             f'{column_type} column "{attribute}"')
+
+        if 'pattern' in spec and re.compile(spec['pattern']).groups != 1:
+            raise ValueError(f'The pattern for "{attribute}" must have exactly one '
+                             f'group')
+
+
+def refine_column(column, spec):
+    '''Returns `column` (a Series of raw values) converted as described by `spec`.
+
+    Values that don't match the pattern or can't be converted become missing values
+    instead of raising an exception.
+    '''
+    if 'pattern' in spec:
+        column = column.str.extract(spec['pattern'], expand=False)
+
+    column_type = spec['type']
+    if column_type == 'int':
+        return pd.to_numeric(column, errors='coerce').astype('Int64')
+    if column_type == 'float':
+        return pd.to_numeric(column, errors='coerce')
+    if column_type == 'datetime':
+        return pd.to_datetime(column, format=spec.get('format'), errors='coerce')
+    if column_type == 'category':
+        return column.astype('category')
+    return column
+
+
+def refine_frame(df, schema):
+    '''Returns a copy of `df` with every column in `schema` converted in bulk.'''
+    df = df.copy()
+    for attribute, spec in schema.items():
+        df[attribute] = refine_column(df[attribute], spec)
+    return df
+
+
+def frame_rows(df):
+    '''Returns the rows of `df` as lists of plain values, with None for missing ones.
+
+    Datetimes stay `pandas.Timestamp`, a subclass of `datetime.datetime`.
+    '''
+    columns = [df[name].astype(object).where(df[name].notna(), None).tolist()
+               for name in df.columns]
+    return [list(row) for row in zip(*columns)]
@@ -0,0 +1,223 @@
+'''Validated website configs, loaded once per version of the config file.
+
+`get_registry` parses the config file the first time it is needed and validates
+every website in it: required keys, schema, source and source type, parser options,
+prospector class and a tester for every attribute (or for its `SAME_TAG` group).
+Later calls only check the modification time and size of the file, and reload it
+when either changed.
+
+Configs are read-only (mappings can't be changed and lists are tuples), so one
+registry can be shared by every prospector of a run. Worker processes that don't
+fork get the registries of their parent with `install(snapshot())`.
+'''
+
+import importlib
+import json
+import os
+import threading
+
+from yukon_cornelius import constants
+from yukon_cornelius import refinery
+from yukon_cornelius import utils
+
+_registries = {}
+_lock = threading.Lock()
+
+
+class FrozenDict(dict):
+    '''A dict that raises TypeError when it is changed.'''
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Website configs are read-only')
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+def _freeze(value):
+    '''Returns `value` with every dict made a FrozenDict and every list a tuple.'''
+    if isinstance(value, dict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def find_prospector_class(name):
+    '''Returns the prospector class called `name`, or None if there is none.
+
+    Classes are looked up in the modules of `constants.PROSPECTOR_MODULES`, in order.
+    '''
+    for module_name in constants.PROSPECTOR_MODULES:
+        prospector_class = getattr(importlib.import_module(module_name), name, None)
+        if prospector_class is not None:
+            return prospector_class
+    return None
+
+
+def config_path(path=None):
+    '''Returns the absolute path of the config file.
+
+    Args:
+      path: str. Defaults to the `constants.CONFIG_FILE_ENV` environment variable,
+        or `constants.CONFIG_FILE` in the working directory.
+    '''
+    if path is None:
+        path = os.environ.get(constants.CONFIG_FILE_ENV, constants.CONFIG_FILE)
+    return os.path.abspath(path)
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class SiteRegistry:
+    '''Every website of one version of a config file, validated.
+
+    Websites that fail validation don't prevent loading the others. Their error is
+    raised when they are looked up.
+    '''
+    def __init__(self, path, configs, stamp=None):
+        '''
+        Args:
+          path: str. Config file the configs were read from.
+          configs: dict. {site_name: config}, as read from the file.
+          stamp: tuple. Modification time and size of the file when it was read.
+        '''
+        self.path = path
+        self.stamp = stamp
+        self._configs = {}
+        self.errors = {}
+        for site_name, config in configs.items():
+            config = _freeze(config)
+            self._configs[site_name] = config
+            error = self._validate(site_name, config)
+            if error is not None:
+                self.errors[site_name] = error
+
+    @classmethod
+    def from_file(cls, path):
+        '''Reads and validates the config file at `path`.'''
+        stamp = _stamp(path)
+        with open(path, 'r') as f:
+            configs = json.load(f)
+        return cls(path, configs, stamp)
+
+    @staticmethod
+    def _validate(site_name, config):
+        '''Returns the reason `config` is invalid, or None if it is valid.'''
+        missing_keys = [key for key in constants.REQUIRED_CONFIG_KEYS
+                        if key not in config]
+        if missing_keys:
+            return (f'Website {site_name} is missing the following keys: '
+                    f'{missing_keys}')
+
+        try:
+            refinery.check_schema(config.get('schema', {}), config['attributes'])
+        except ValueError as e:
+            return f'Website {site_name} has an invalid schema: {e}'
+
+        try:
+            utils._check_source(config['source'], config['source_type'],
+                                config.get('parser', constants.DEFAULT_PARSER),
+                                config.get('parse_only'), config.get('stream'))
+        except (utils.InvalidSourceError, utils.InvalidConfigError) as e:
+            return f'Website {site_name} has an invalid source: {e}'
+
+        action = config.get('on_repeated_page', constants.DEFAULT_REPEATED_PAGE_ACTION)
+        if action not in constants.VALID_REPEATED_PAGE_ACTIONS:
+            return (f'Website {site_name} has an invalid on_repeated_page {action}. '
+                    f'Valid values are: {constants.VALID_REPEATED_PAGE_ACTIONS}')
+
+        unknown = [attribute for attribute in
+                   config.get('dedupe', {}).get('attributes', ())
+                   if attribute not in config['attributes']]
+        if unknown:
+            return (f'Website {site_name} dedupes on unknown attributes: '
+                    f'{list(unknown)}')
+
+        if 'prospector_class' not in config:
+            return None
+
+        prospector_class = find_prospector_class(config['prospector_class'])
+        if prospector_class is None:
+            return (f'Website {site_name} has an unknown prospector_class '
+                    f'{config["prospector_class"]}. Prospectors are looked up in: '
+                    f'{constants.PROSPECTOR_MODULES}')
+
+        followers = prospector_class.same_tag_followers(config['attributes'])
+        missing_testers = [f'_is_{attribute}_tag' for attribute in config['attributes']
+                           if not hasattr(prospector_class, f'_is_{attribute}_tag')
+                           and attribute not in prospector_class.SELECTORS
+                           and attribute not in followers]
+        if missing_testers:
+            return (f'Website {site_name} uses {prospector_class.__name__}, which does '
+                    f'not implement {", ".join(missing_testers)} (or add SELECTORS)')
+        return None
+
+    def __contains__(self, site_name):
+        return site_name in self._configs
+
+    @property
+    def site_names(self):
+        return list(self._configs)
+
+    def config(self, site_name):
+        '''Returns the read-only config of `site_name`.
+
+        Raises:
+          InvalidConfigError: if `site_name` is not in the file or is invalid.
+        '''
+        if site_name not in self._configs:
+            raise utils.InvalidConfigError(f'{site_name} not found in config!')
+        if site_name in self.errors:
+            raise utils.InvalidConfigError(self.errors[site_name])
+        return self._configs[site_name]
+
+    def prospector_class(self, site_name):
+        '''Returns the class named by the "prospector_class" of `site_name`.'''
+        config = self.config(site_name)
+        if 'prospector_class' not in config:
+            raise utils.InvalidConfigError(f'Website {site_name} has no '
+                                           f'prospector_class')
+        return find_prospector_class(config['prospector_class'])
+
+
+def get_registry(path=None):
+    '''Returns the SiteRegistry of the config file, loading it if it changed.
+
+    Args:
+      path: str. See `config_path`.
+    '''
+    path = config_path(path)
+    stamp = _stamp(path)
+    registry = _registries.get(path)
+    if registry is not None and registry.stamp == stamp:
+        return registry
+
+    with _lock:
+        registry = _registries.get(path)
+        if registry is None or registry.stamp != stamp:
+            registry = SiteRegistry.from_file(path)
+            _registries[path] = registry
+        return registry
+
+
+def snapshot():
+    '''Returns the registries loaded so far, for `install` in worker processes.'''
+    return dict(_registries)
+
+
+def install(registries):
+    '''Adds `registries` (from `snapshot`) to the registries of this process.
+
+    Used as the initializer of worker processes, so they don't read and validate the
+    config file again. A registry is still reloaded if its file changed since.
+    '''
+    with _lock:
+        for path, registry in registries.items():
+            _registries.setdefault(path, registry)
@@ -0,0 +1,209 @@
+'''Bounded scheduling of many mining jobs, with timeouts and result collection.'''
+
+import asyncio
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+
+from yukon_cornelius import constants
+from yukon_cornelius import fetchers
+from yukon_cornelius import registry
+
+
+class SiteResult:
+    '''Outcome of mining one site.'''
+    def __init__(self, site_name, status, elapsed, rows=None, exitcode=None, error=None):
+        '''
+        Args:
+          site_name: str.
+          status: str. One of "ok", "failed" or "timeout".
+          elapsed: float. Wall time in seconds.
+          rows: int. Number of Ore mined, if the job finished.
+          exitcode: int. Exit code of the worker process (process mode only).
+          error: str. Traceback or reason of a failure.
+        '''
+        self.site_name = site_name
+        self.status = status
+        self.elapsed = elapsed
+        self.rows = rows
+        self.exitcode = exitcode
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+    def __repr__(self):
+        return (f'SiteResult(site_name={self.site_name}, status={self.status}, '
+                f'rows={self.rows}, elapsed={self.elapsed:.1f})')
+
+
+def _run_job(target, job_id, site_name, kwargs, results, registries=None):
+    '''Runs `target` in a worker and reports the outcome on `results`.
+
+    Worker processes get the config registries of the scheduler in `registries`.
+    '''
+    if registries:
+        registry.install(registries)
+    try:
+        rows = target(site_name, **kwargs)
+    except BaseException:
+        results.put((job_id, 'failed', None, traceback.format_exc()))
+    else:
+        results.put((job_id, 'ok', rows, None))
+
+
+class RunScheduler:
+    '''Runs `target(site_name, **kwargs)` for many sites with at most `max_workers`
+    running at a time.
+
+    In "process" mode every site gets its own process, which is terminated if it
+    runs past its timeout. In "thread" mode sites share this process, which suits
+    sites that spend most of their time waiting on the network; a thread that runs
+    past its timeout is reported but can't be stopped. In "async" mode `target` is a
+    coroutine function and all sites run as tasks on one event loop, where a site
+    that runs past its timeout is cancelled.
+    '''
+    modes = ['process', 'thread', 'async']
+
+    def __init__(self, target, max_workers=constants.RUN_MAX_WORKERS, mode='process',
+                 poll_interval=0.05):
+        '''
+        Args:
+          target: callable. Accepts a site name and keyword arguments and returns
+            the number of Ore mined. Must be picklable in process mode on platforms
+            that don't fork, and a coroutine function in async mode.
+          max_workers: int. Maximum number of sites mined at once.
+          mode: str. One of `RunScheduler.modes`.
+          poll_interval: float. Seconds between checks on running workers.
+        '''
+        if mode not in self.modes:
+            raise ValueError(f'{mode} is not a valid mode. Valid modes are: {self.modes}')
+        if max_workers < 1:
+            raise ValueError(f'max_workers must be at least 1. Got {max_workers}')
+
+        self.target = target
+        self.max_workers = max_workers
+        self.mode = mode
+        self.poll_interval = poll_interval
+
+    def run(self, jobs):
+        '''Mines every job and returns a list of SiteResult in the order of `jobs`.
+
+        Args:
+          jobs: list of (site_name, kwargs, timeout) tuples. `timeout` is in seconds,
+            or None for no limit.
+        '''
+        if self.mode == 'async':
+            return asyncio.run(self._run_async(jobs))
+
+        if self.mode == 'process':
+            results_queue = multiprocessing.Queue()
+        else:
+            results_queue = queue.Queue()
+
+        pending = list(enumerate(jobs))
+        running = {}
+        reported = {}
+        results = [None] * len(jobs)
+
+        while pending or running:
+            while pending and len(running) < self.max_workers:
+                job_id, (site_name, kwargs, timeout) = pending.pop(0)
+                worker = self._start(job_id, site_name, kwargs or {}, results_queue)
+                running[job_id] = (worker, time.monotonic(), timeout)
+
+            time.sleep(self.poll_interval)
+            self._drain(results_queue, reported)
+
+            for job_id, (worker, start, timeout) in list(running.items()):
+                site_name = jobs[job_id][0]
+                elapsed = time.monotonic() - start
+
+                if not worker.is_alive():
+                    worker.join()
+                    self._drain(results_queue, reported)
+                    results[job_id] = self._result(site_name, elapsed, worker,
+                                                   reported.pop(job_id, None))
+                    del running[job_id]
+
+                elif timeout is not None and elapsed > timeout:
+                    if self.mode == 'process':
+                        worker.terminate()
+                        worker.join()
+                    results[job_id] = SiteResult(
+                        site_name, 'timeout', elapsed,
+                        exitcode=getattr(worker, 'exitcode', None),
+                        error=f'Timed out after {timeout} seconds')
+                    del running[job_id]
+
+        return results
+
+    async def _run_async(self, jobs):
+        slots = asyncio.Semaphore(self.max_workers)
+
+        async def run_job(site_name, kwargs, timeout):
+            async with slots:
+                start = time.monotonic()
+                try:
+                    job = self.target(site_name, **(kwargs or {}))
+                    rows = await asyncio.wait_for(job, timeout)
+                except asyncio.TimeoutError:
+                    return SiteResult(site_name, 'timeout', time.monotonic() - start,
+                                      error=f'Timed out after {timeout} seconds')
+                except Exception:
+                    return SiteResult(site_name, 'failed', time.monotonic() - start,
+                                      error=traceback.format_exc())
+                return SiteResult(site_name, 'ok', time.monotonic() - start, rows=rows)
+
+        try:
+            return await asyncio.gather(*(run_job(*job) for job in jobs))
+        finally:
+            await fetchers.close_async_fetcher()
+
+    def _start(self, job_id, site_name, kwargs, results_queue):
+        args = (self.target, job_id, site_name, kwargs, results_queue)
+        if self.mode == 'process':
+            worker = multiprocessing.Process(target=_run_job,
+                                             args=args + (registry.snapshot(),),
+                                             name=f'mine-{site_name}')
+        else:
+            worker = threading.Thread(target=_run_job, args=args,
+                                      name=f'mine-{site_name}', daemon=True)
+        worker.start()
+        return worker
+
+    @staticmethod
+    def _drain(results_queue, reported):
+        while True:
+            try:
+                job_id, status, rows, error = results_queue.get_nowait()
+            except queue.Empty:
+                return
+            reported[job_id] = (status, rows, error)
+
+    @staticmethod
+    def _result(site_name, elapsed, worker, report):
+        exitcode = getattr(worker, 'exitcode', None)
+        if report is None:
+            return SiteResult(site_name, 'failed', elapsed, exitcode=exitcode,
+                              error=f'Worker exited with code {exitcode} without '
+                                    f'reporting a result')
+        status, rows, error = report
+        if status == 'ok' and exitcode not in (None, 0):
+            status = 'failed'
+            error = f'Worker exited with code {exitcode}'
+        return SiteResult(site_name, status, elapsed, rows=rows, exitcode=exitcode,
+                          error=error)
+
+
+def format_summary(results):
+    '''Returns a printable table of a list of SiteResult.'''
+    lines = [f'{"site":<32}{"status":<10}{"rows":>10}{"seconds":>10}']
+    for result in results:
+        rows = '-' if result.rows is None else result.rows
+        lines.append(f'{result.site_name:<32}{result.status:<10}{rows:>10}'
+                     f'{result.elapsed:>10.1f}')
+    return '\n'.join(lines)
@@ -0,0 +1,125 @@
+'''Mining a single site in parallel by splitting its pages across processes.'''
+
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+from yukon_cornelius import constants
+from yukon_cornelius import registry
+from yukon_cornelius import sinks
+from yukon_cornelius import utils
+
+
+def find_page_count(prospector, max_pages=constants.SHARD_MAX_PAGES):
+    '''Returns the number of pages before the end of the forum.
+
+    Pages are probed with `prospector.is_forum_end_page`, doubling the page number
+    until the end is passed and then bisecting, so only about 2 * log2(pages)
+    pages are loaded.
+
+    Args:
+      prospector: ProspectorBase. Must define `_page_source`.
+      max_pages: int. Upper bound on the number of pages.
+    '''
+    # Largest page known to have posts and smallest page known to be past the end
+    last_page, end_page = 0, 1
+    while not prospector.is_forum_end_page(end_page):
+        last_page = end_page
+        if end_page >= max_pages:
+            raise ValueError(f'{prospector.site_name} has more than {max_pages} pages')
+        end_page = min(end_page * 2, max_pages)
+
+    while end_page - last_page > 1:
+        middle = (last_page + end_page) // 2
+        if prospector.is_forum_end_page(middle):
+            end_page = middle
+        else:
+            last_page = middle
+    return end_page
+
+
+def split_pages(page_count, num_shards):
+    '''Returns a list of (start_page, end_page) ranges covering `page_count` pages.'''
+    num_shards = max(1, min(num_shards, page_count))
+    size, extra = divmod(page_count, num_shards)
+    ranges = []
+    start = 0
+    for i in range(num_shards):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _mine_shard(prospector_class, site_name, start_page, end_page):
+    '''Mines pages [start_page, end_page) in a worker process.'''
+    prospector = prospector_class(site_name, start_page=start_page, end_page=end_page)
+    prospector.mine()
+    return prospector.ore_cart
+
+
+def iter_sharded(prospector_class, site_name, num_workers=constants.SHARD_WORKERS,
+                 num_shards=None):
+    '''Mines `site_name` with a pool of processes and yields its Ore in page order.
+
+    Every worker mines its own range of pages with its own prospector, and the Ore of
+    all ranges is yielded in page order, so the result matches mining sequentially.
+    At most `num_workers` ranges are mined ahead of the one being yielded, so only
+    their Ore is held in memory.
+
+    Args:
+      prospector_class: ProspectorBase subclass defining `_page_source`.
+      site_name: str.
+      num_workers: int. Number of worker processes.
+      num_shards: int. Number of page ranges. Defaults to `num_workers`; more shards
+        than workers evens out ranges that take longer than others, and holds less
+        Ore at a time.
+    '''
+    # Only probes pages, so nothing needs loading
+    prospector = prospector_class(site_name, load=False, prefetch_pages=0)
+    page_count = find_page_count(prospector)
+    shards = split_pages(page_count, num_shards or num_workers)
+    prospector.log(f'Mining {page_count} pages in {len(shards)} shards')
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=registry.install,
+                             initargs=(registry.snapshot(),)) as pool:
+        pending = collections.deque()
+        for start, end in shards:
+            pending.append(pool.submit(_mine_shard, prospector_class, site_name,
+                                       start, end))
+            if len(pending) > num_workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def mine_sharded(prospector_class, site_name, export_filetype,
+                 num_workers=constants.SHARD_WORKERS, num_shards=None,
+                 partition_by=None):
+    '''Mines `site_name` with a pool of processes, exports its Ore and returns the
+    number of Ore mined.
+
+    Ore is written to the sink of streamed filetypes as each range is done (see
+    `iter_sharded`). Other filetypes are refined from all the Ore at once.
+
+    Args:
+      prospector_class: ProspectorBase subclass defining `_page_source`.
+      site_name: str.
+      export_filetype: str.
+      num_workers: int. Number of worker processes.
+      num_shards: int. Number of page ranges. See `iter_sharded`.
+      partition_by: str. Datetime attribute to partition the export by, if any (see
+        `sinks.PartitionedSink`). Merged Ore can't be partitioned by page.
+    '''
+    config = registry.get_registry().config(site_name)
+    schema = config.get('schema')
+    ore_iter = iter_sharded(prospector_class, site_name, num_workers, num_shards)
+    if export_filetype in sinks.SINK_TYPES:
+        with sinks.open_sink(site_name, config['attributes'], export_filetype,
+                             partition_by=partition_by, schema=schema) as sink:
+            for ore in ore_iter:
+                sink.write(ore)
+            return sink.num_rows
+
+    ore_list = list(ore_iter)
+    utils.refine_ore(ore_list, export_filetype=export_filetype, schema=schema)
+    return len(ore_list)
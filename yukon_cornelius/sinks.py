@@ -0,0 +1,500 @@
+'''Writers that export Ore incrementally while a site is being mined.'''
+
+import csv
+import datetime
+import gzip
+import html
+import io
+import json
+import os
+import shutil
+
+from yukon_cornelius import constants
+from yukon_cornelius import lazy
+from yukon_cornelius import refinery
+
+pd = lazy.LazyModule('pandas')
+# Only needed for columnar exports
+pyarrow = lazy.optional('pyarrow', ['ipc', 'parquet'])
+
+
+class OreSink:
+    '''Base class for streaming exporters.
+
+    Each Ore is written as soon as it is mined, and the file is flushed every
+    `flush_every` rows, so memory use stays flat and a crash loses at most the
+    rows since the last flush. Subclasses implement `_open`, `_write_row` and
+    optionally `_close`.
+
+    Sinks given a `schema` instead hold up to `flush_every` rows, and convert them
+    to their types as one batch (see `refinery`) before writing them.
+    '''
+    extension = None
+    # Whether `resume` can cut the file back to a `position()` and append to it
+    resumable = True
+    # Whether rows are always held and written in batches, even without a schema
+    batched = False
+
+    def __init__(self, path, attributes, flush_every=constants.SINK_FLUSH_EVERY,
+                 resume=None, schema=None):
+        '''Opens `path` for writing.
+
+        Args:
+          path: str. File to write. Its directory is created if needed.
+          attributes: list of str. Column names, in order.
+          flush_every: int. Number of rows between flushes.
+          resume: dict. A `position()` of an earlier sink writing the same file. The
+            file is cut back to that position and new rows are appended after it.
+          schema: dict. The "schema" of the site's config, if any.
+        '''
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.attributes = list(attributes)
+        self.flush_every = flush_every
+        self.schema = schema or None
+        self._batch = []
+        if resume is None:
+            self.num_rows = 0
+            self._file = self._open_file(path, None)
+            self._open(header=True)
+        else:
+            self.num_rows = resume['num_rows']
+            self._file = self._open_file(path, resume['offset'])
+            self._open(header=False)
+
+    def write(self, ore, page=None):
+        '''Writes the values of `ore` as the next row.
+
+        `ore` must hold the sink's attributes, in the same order. `page`, the number
+        of the page `ore` was mined from, is only used by `PartitionedSink`.
+        '''
+        if self.batched or self.schema is not None:
+            self._batch.append(list(ore.values))
+        else:
+            self._write_row(self.num_rows, list(ore.values))
+        self.num_rows += 1
+        if self.num_rows % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            self._write_batch()
+        self._file.flush()
+
+    def _write_batch(self):
+        '''Converts the held rows in bulk and writes them.'''
+        df = self._batch_frame()
+        rows = refinery.frame_rows(df)
+        first_index = self.num_rows - len(self._batch)
+        for offset, values in enumerate(rows):
+            self._write_row(first_index + offset, values)
+        self._batch = []
+
+    def _batch_frame(self):
+        '''Returns the held rows as a DataFrame, converted if there is a schema.'''
+        df = pd.DataFrame(self._batch, columns=self.attributes)
+        if self.schema is not None:
+            df = refinery.refine_frame(df, self.schema)
+        return df
+
+    def position(self):
+        '''Flushes and returns a json-serializable record of how much was written.'''
+        self.flush()
+        return {'num_rows': self.num_rows, 'offset': self._file.tell()}
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._batch:
+            self._write_batch()
+        self._close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _open_file(path, offset):
+        '''Returns `path` opened for writing, cut back to `offset` if it isn't None.'''
+        if offset is None:
+            return open(path, 'w', newline='', encoding='utf-8')
+        f = open(path, 'r+', newline='', encoding='utf-8')
+        f.seek(offset)
+        f.truncate()
+        return f
+
+    def _open(self, header):
+        pass
+
+    def _write_row(self, index, values):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+def _json_default(value):
+    '''Serializes the datetimes of refined rows like `refine_ore` does.'''
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class CsvSink(OreSink):
+    '''Writes csv in the same layout as `pandas.DataFrame.to_csv`.'''
+    extension = 'csv'
+
+    def _open(self, header):
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        if header:
+            self._writer.writerow([''] + self.attributes)
+
+    def _write_row(self, index, values):
+        self._writer.writerow([index] + values)
+
+
+class JsonLinesSink(OreSink):
+    '''Writes one json object per line.'''
+    extension = 'jsonl'
+
+    def _write_row(self, index, values):
+        self._file.write(json.dumps(dict(zip(self.attributes, values)),
+                                    default=_json_default))
+        self._file.write('\n')
+
+
+class HtmlSink(OreSink):
+    '''Writes an html table in the same layout as `pandas.DataFrame.to_html`.
+
+    Rows are appended as they arrive and the table is closed in `close`.
+    '''
+    extension = 'html'
+
+    def _open(self, header):
+        if not header:
+            return
+        self._file.write('<table border="1" class="dataframe">\n'
+                         '  <thead>\n'
+                         '    <tr style="text-align: right;">\n'
+                         '      <th></th>\n')
+        for name in self.attributes:
+            self._file.write(f'      <th>{html.escape(name)}</th>\n')
+        self._file.write('    </tr>\n'
+                         '  </thead>\n'
+                         '  <tbody>\n')
+
+    def _write_row(self, index, values):
+        self._file.write(f'    <tr>\n      <th>{index}</th>\n')
+        for value in values:
+            self._file.write(f'      <td>{self._format_cell(value)}</td>\n')
+        self._file.write('    </tr>\n')
+
+    @staticmethod
+    def _format_cell(value):
+        '''Escapes `value` the way pandas does for html tables.'''
+        text = str(value)
+        for char, escaped in [('\t', r'\t'), ('\n', r'\n'), ('\r', r'\r')]:
+            text = text.replace(char, escaped)
+        return html.escape(text, quote=False).strip().replace('  ', '&nbsp;&nbsp;')
+
+    def _close(self):
+        self._file.write('  </tbody>\n'
+                         '</table>')
+
+
+class GzipTextFile:
+    '''Text file that is written as one gzip member per `flush`.
+
+    Readers treat concatenated members as a single gzip stream, and `tell` is only
+    asked for after a flush, so it is always a member boundary that a resumed sink
+    can cut the file back to.
+    '''
+    def __init__(self, path, offset=None, level=constants.SINK_GZIP_LEVEL):
+        if offset is None:
+            self._raw = open(path, 'wb')
+        else:
+            self._raw = open(path, 'r+b')
+            self._raw.seek(offset)
+            self._raw.truncate()
+        self._level = level
+        self._buffer = io.StringIO()
+
+    @property
+    def closed(self):
+        return self._raw.closed
+
+    def write(self, text):
+        return self._buffer.write(text)
+
+    def flush(self):
+        text = self._buffer.getvalue()
+        if text:
+            self._raw.write(gzip.compress(text.encode('utf-8'), self._level))
+            self._buffer = io.StringIO()
+        self._raw.flush()
+
+    def tell(self):
+        return self._raw.tell()
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self._raw.close()
+
+
+class CsvGzipSink(CsvSink):
+    '''Writes gzip compressed csv, which pandas reads like plain csv.'''
+    extension = 'csv.gz'
+    _open_file = GzipTextFile
+
+
+class JsonLinesGzipSink(JsonLinesSink):
+    '''Writes gzip compressed json lines.'''
+    extension = 'jsonl.gz'
+    _open_file = GzipTextFile
+
+
+def arrow_schema(attributes, schema=None):
+    '''Returns the `pyarrow.Schema` of Ore with `attributes`, typed by a site's schema.
+
+    Attributes missing from `schema` are stored as strings.
+    '''
+    types = {
+        'str': pyarrow.string(),
+        'int': pyarrow.int64(),
+        'float': pyarrow.float64(),
+        'datetime': pyarrow.timestamp('us'),
+        'category': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+    }
+    schema = schema or {}
+    return pyarrow.schema([
+        (name, types[schema[name]['type']] if name in schema else pyarrow.string())
+        for name in attributes])
+
+
+class ArrowSink(OreSink):
+    '''Base class for columnar exports written with pyarrow.
+
+    Rows are always held, and every `flush_every` rows are converted to an arrow table
+    as one batch, so a file is written as row groups of that size. Columnar files
+    can't be appended to, so these sinks can't be resumed. Subclasses implement
+    `_new_writer`.
+    '''
+    resumable = False
+    batched = True
+
+    def __init__(self, path, attributes, flush_every=constants.SINK_ROW_GROUP_SIZE,
+                 resume=None, schema=None):
+        if pyarrow is None:
+            raise ImportError(f'{self.extension} exports need pyarrow. Install it with '
+                              f'`pip install pyarrow`')
+        if resume is not None:
+            raise ValueError(f'{self.extension} exports can not be resumed')
+
+        self._arrow_schema = arrow_schema(attributes, schema)
+        self._writer = None
+        # Categories seen so far, in order, so dictionaries only ever grow
+        self._categories = {name: [] for name, spec in (schema or {}).items()
+                            if spec['type'] == 'category'}
+        super().__init__(path, attributes, flush_every=flush_every, schema=schema)
+
+    @staticmethod
+    def _open_file(path, offset):
+        return open(path, 'wb')
+
+    def _open(self, header):
+        self._writer = self._new_writer(self._arrow_schema)
+
+    def _write_batch(self):
+        df = self._batch_frame()
+        for name, known in self._categories.items():
+            seen = set(known)
+            known.extend(c for c in df[name].cat.categories if c not in seen)
+            df[name] = df[name].cat.set_categories(known)
+        for name in self.attributes:
+            if name not in (self.schema or {}):
+                df[name] = df[name].astype('string')
+
+        self._writer.write_table(pyarrow.Table.from_pandas(
+            df, schema=self._arrow_schema, preserve_index=False))
+        self._batch = []
+
+    def position(self):
+        raise ValueError(f'{self.extension} exports can not be resumed')
+
+    def _close(self):
+        self._writer.close()
+
+    def _new_writer(self, schema):
+        raise NotImplementedError
+
+
+class ParquetSink(ArrowSink):
+    '''Writes a Parquet file with a row group every `flush_every` rows.'''
+    extension = 'parquet'
+
+    def _new_writer(self, schema):
+        return pyarrow.parquet.ParquetWriter(self._file, schema,
+                                             compression=constants.COLUMNAR_COMPRESSION)
+
+
+class FeatherSink(ArrowSink):
+    '''Writes a Feather (Arrow IPC) file with a record batch every `flush_every` rows.'''
+    extension = 'feather'
+
+    def _new_writer(self, schema):
+        options = pyarrow.ipc.IpcWriteOptions(compression=constants.COLUMNAR_COMPRESSION,
+                                              emit_dictionary_deltas=True)
+        return pyarrow.ipc.new_file(self._file, schema, options=options)
+
+
+SINK_TYPES = {sink.extension: sink for sink in [CsvSink, JsonLinesSink, HtmlSink,
+                                                CsvGzipSink, JsonLinesGzipSink,
+                                                ParquetSink, FeatherSink]}
+
+
+class PartitionedSink:
+    '''Splits an export into one file per partition, streamed like a single sink.
+
+    Partitions are hive-style `<key>=<value>` directories under `directory`, holding
+    a `part.<filetype>` file each, which pandas and pyarrow read back as one
+    dataset. Ore is partitioned by ranges of `pages_per_partition` pages
+    (`partition_by="page"`), or by month of a datetime column of the schema
+    (`partition_by="<attribute>"`, with a `month=unknown` partition for missing
+    dates).
+
+    Rows are held until `flush_every` of them have been written, so the dates of a
+    whole batch are converted at once. Pages are mined in order, so page partitions
+    are closed as soon as the next one starts. Partitioned exports can't be resumed,
+    and any earlier export at `directory` is removed.
+    '''
+    resumable = False
+
+    def __init__(self, directory, attributes, export_filetype, partition_by, schema=None,
+                 pages_per_partition=constants.PARTITION_PAGES,
+                 flush_every=constants.SINK_FLUSH_EVERY, **kwargs):
+        '''
+        Args:
+          directory: str. Directory of the partitions.
+          attributes: list of str. Column names, in order.
+          export_filetype: str. One of the keys of `SINK_TYPES`, used for every
+            partition.
+          partition_by: str. "page", or a datetime attribute of `schema`.
+          schema: dict. The "schema" of the site's config, if any.
+          pages_per_partition: int. Number of pages in each page partition.
+          flush_every: int. Number of rows held before they are partitioned.
+          kwargs: Passed on to the sink of every partition.
+        '''
+        if partition_by != 'page' and \
+            (schema or {}).get(partition_by, {}).get('type') != 'datetime':
+            raise ValueError(f'Exports can be partitioned by "page" or a datetime column '
+                             f'of the schema. Got "{partition_by}"')
+
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        elif os.path.exists(directory):
+            os.remove(directory)
+        os.makedirs(directory)
+
+        self.path = directory
+        self.attributes = list(attributes)
+        self.schema = schema or None
+        self.partition_by = partition_by
+        self.pages_per_partition = pages_per_partition
+        self.flush_every = flush_every
+        self.num_rows = 0
+        self._sink_type = SINK_TYPES[export_filetype]
+        self._sink_kwargs = kwargs
+        self._pending = []
+        self._partitions = {}
+
+    @property
+    def partitions(self):
+        '''Names of the partitions written to so far.'''
+        return sorted(os.listdir(self.path))
+
+    def write(self, ore, page=None):
+        if self.partition_by == 'page' and page is None:
+            raise ValueError('Ore must come with its page to be partitioned by page')
+        self._pending.append((page, ore))
+        self.num_rows += 1
+        if len(self._pending) >= self.flush_every:
+            self._write_pending()
+
+    def _write_pending(self):
+        for key, (page, ore) in zip(self._partition_keys(), self._pending):
+            self._partition(key).write(ore, page=page)
+        self._pending = []
+
+    def _partition_keys(self):
+        if self.partition_by == 'page':
+            size = self.pages_per_partition
+            return [f'pages={page // size * size}-{page // size * size + size - 1}'
+                    for page, _ in self._pending]
+
+        index = self.attributes.index(self.partition_by)
+        dates = refinery.refine_column(
+            pd.Series([ore.values[index] for _, ore in self._pending], dtype=object),
+            self.schema[self.partition_by])
+        return [f'month={month}' for month in dates.dt.strftime('%Y-%m').fillna('unknown')]
+
+    def _partition(self, key):
+        '''Returns the sink of partition `key`, opening it if needed.'''
+        if key not in self._partitions:
+            if self.partition_by == 'page':
+                self._close_partitions()
+            path = os.path.join(self.path, key, f'part.{self._sink_type.extension}')
+            self._partitions[key] = self._sink_type(path, self.attributes,
+                                                    schema=self.schema,
+                                                    **self._sink_kwargs)
+        return self._partitions[key]
+
+    def _close_partitions(self):
+        for sink in self._partitions.values():
+            sink.close()
+        self._partitions = {}
+
+    def flush(self):
+        self._write_pending()
+        for sink in self._partitions.values():
+            sink.flush()
+
+    def position(self):
+        raise ValueError('Partitioned exports can not be resumed')
+
+    def close(self):
+        self._write_pending()
+        self._close_partitions()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_sink(site_name, attributes, export_filetype='csv', partition_by=None, **kwargs):
+    '''Returns a sink writing `exports/<site_name>.<export_filetype>`.
+
+    Args:
+      site_name: str. Name of the site being mined.
+      attributes: list of str. Column names, in order.
+      export_filetype: str. One of the keys of `SINK_TYPES`.
+      partition_by: str. If given, the export is a directory of partitions instead
+        of a single file (see `PartitionedSink`).
+      kwargs: Passed on to the sink.
+    '''
+    if export_filetype not in SINK_TYPES:
+        raise ValueError(f'{export_filetype} can not be streamed. Streamable types are: '
+                         f'{list(SINK_TYPES)}')
+
+    path = os.path.join(constants.EXPORT_DIR, f'{site_name}.{export_filetype}')
+    if partition_by is not None:
+        return PartitionedSink(path, attributes, export_filetype, partition_by, **kwargs)
+    return SINK_TYPES[export_filetype](path, attributes, **kwargs)
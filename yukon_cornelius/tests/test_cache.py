@@ -0,0 +1,108 @@
+import unittest
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .. import cache
+from .. import fetchers
+from .. import instrumentation
+
+
+class _ETagHandler(BaseHTTPRequestHandler):
+    '''Serves a fixed page with an ETag and answers matching conditional requests.'''
+    etag = '"v1"'
+    body = b'<html><body><div class="id">1</div></body></html>'
+
+    def do_GET(self):
+        self.server.num_requests += 1
+        if self.headers.get('If-None-Match') == self.etag:
+            self.server.num_not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_store_and_lookup(self):
+        c = cache.ResponseCache(self.path)
+        c.store('https://www.foo.com', 'foobar' * 100, etag='"abc"')
+        page = c.lookup('https://www.foo.com')
+        self.assertEqual(page.text, 'foobar' * 100)
+        self.assertEqual(page.etag, '"abc"')
+        self.assertLess(c.size(), len('foobar' * 100))
+
+    def test_missing_url_returns_none(self):
+        c = cache.ResponseCache(self.path)
+        self.assertIsNone(c.lookup('https://www.foo.com'))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        c = cache.ResponseCache(self.path)
+        for url in ['a', 'b', 'c']:
+            c.store(url, os.urandom(300).hex())
+        c.lookup('a')
+        c.max_bytes = c.size() - 1
+        c.store('d', os.urandom(300).hex())
+
+        self.assertIsNotNone(c.lookup('a'))
+        self.assertIsNone(c.lookup('b'))
+        self.assertIsNotNone(c.lookup('d'))
+
+
+class TestCachedFetching(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _ETagHandler)
+        self.server.num_requests = 0
+        self.server.num_not_modified = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.timings = instrumentation.Timings()
+        self.fetcher = fetchers.HttpFetcher(
+            timings=self.timings,
+            cache=cache.ResponseCache(os.path.join(self.tmpdir.name, 'cache.sqlite')))
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_fresh_entry_skips_network(self):
+        first = self.fetcher.get_text(self.url, cache_ttl=60)
+        second = self.fetcher.get_text(self.url, cache_ttl=60)
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.num_requests, 1)
+        self.assertEqual(self.timings.count('cache_hit'), 1)
+
+    def test_stale_entry_is_revalidated(self):
+        first = self.fetcher.get_text(self.url, cache_ttl=0)
+        second = self.fetcher.get_text(self.url, cache_ttl=0)
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.num_requests, 2)
+        self.assertEqual(self.server.num_not_modified, 1)
+
+    def test_no_ttl_bypasses_cache(self):
+        self.fetcher.get_text(self.url)
+        self.assertIsNone(self.fetcher.cache.lookup(self.url))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import os
+import tempfile
+
+import pandas as pd
+
+from ..prospectors import samples
+from ..checkpoint import Checkpoint
+from .. import sinks
+
+
+class _CrashingSamplePaged(samples.SamplePaged):
+    '''Dies while mining the second post of page 1.'''
+
+    def _process_body(self, tag):
+        if 'Sundays' in tag.text:
+            raise RuntimeError('Connection lost')
+        return str(tag)
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.checkpoint = Checkpoint(os.path.join(self.tmpdir.name, 'site.json'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_missing_checkpoint_loads_none(self):
+        self.assertIsNone(self.checkpoint.load())
+
+    def test_save_load_and_clear(self):
+        self.checkpoint.save({'current_page': 3})
+        self.assertEqual(self.checkpoint.load(), {'current_page': 3})
+        self.checkpoint.clear()
+        self.assertIsNone(self.checkpoint.load())
+
+    def test_resume_after_crash(self):
+        path = os.path.join(self.tmpdir.name, 'sample_paged_forum.csv')
+        attributes = ['id', 'name', 'date', 'body']
+
+        with sinks.CsvSink(path, attributes, flush_every=1) as sink:
+            p = _CrashingSamplePaged('sample_paged_forum', sink=sink,
+                                     checkpoint=self.checkpoint)
+            with self.assertRaisesRegex(RuntimeError, 'Connection lost'):
+                p.mine()
+
+        state = self.checkpoint.load()
+        self.assertEqual(state['current_page'], 1)
+        self.assertEqual(state['num_ore'], 4)
+
+        # The crashed run wrote part of page 1, which is rewritten on resume
+        self.assertEqual(len(pd.read_csv(path)), 5)
+
+        with sinks.CsvSink(path, attributes, resume=state['sink']) as sink:
+            p = samples.SamplePaged('sample_paged_forum', sink=sink,
+                                    checkpoint=self.checkpoint,
+                                    start_page=state['current_page'],
+                                    start_source=state['current_source'])
+            p.mine()
+
+        df = pd.read_csv(path, index_col=0)
+        self.assertEqual(list(df.index), list(range(6)))
+        self.assertTrue(df['id'].is_unique)
+        self.assertEqual(p.state['num_ore'], 6)
+
+
+class TestIncrementalMining(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'sample_paged_forum.html')
+        self.attributes = ['id', 'name', 'date', 'body']
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_watermark_is_newest_page_with_ore(self):
+        p = samples.SamplePaged('sample_paged_forum')
+        p.mine()
+        mark = p.watermark()
+        self.assertEqual(mark['current_page'], 1)
+        self.assertEqual(len(mark['ids']), 2)
+
+    def test_nothing_mined_has_no_watermark(self):
+        p = samples.SamplePaged('sample_paged_forum')
+        self.assertIsNone(p.watermark())
+
+    def test_only_new_ore_is_appended(self):
+        # First run, before page 1 existed
+        with sinks.HtmlSink(self.path, self.attributes) as sink:
+            p = samples.SamplePaged('sample_paged_forum', sink=sink, end_page=1)
+            p.mine()
+            mark = p.watermark()
+            mark['sink'] = sink.position()
+
+        # Second run starts on the newest page of the first run
+        with sinks.HtmlSink(self.path, self.attributes, resume=mark['sink']) as sink:
+            p = samples.SamplePaged('sample_paged_forum', sink=sink,
+                                    start_page=mark['current_page'],
+                                    start_source=mark['current_source'],
+                                    known_ids=mark['ids'])
+            p.mine()
+
+        df = pd.read_html(self.path, index_col=0)[0]
+        self.assertEqual(list(df.index), list(range(6)))
+        self.assertTrue(df['id'].is_unique)
+        self.assertEqual(p.watermark()['current_page'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import os
+import tempfile
+
+from .. import dedupe
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_same_values_have_same_fingerprint(self):
+        self.assertEqual(dedupe.fingerprint('1', 'John'), dedupe.fingerprint('1', 'John'))
+        self.assertEqual(len(dedupe.fingerprint('1')), dedupe.DIGEST_SIZE)
+
+    def test_values_are_separated(self):
+        self.assertNotEqual(dedupe.fingerprint('1', '23'), dedupe.fingerprint('12', '3'))
+
+
+class TestSeenSet(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'seen', 'forum.seen')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_add_reports_new_fingerprints(self):
+        seen = dedupe.SeenSet()
+        self.assertTrue(seen.add(dedupe.fingerprint('a')))
+        self.assertFalse(seen.add(dedupe.fingerprint('a')))
+        self.assertEqual(len(seen), 1)
+
+    def test_least_recently_seen_is_forgotten(self):
+        seen = dedupe.SeenSet(max_entries=2)
+        a, b, c = (dedupe.fingerprint(value) for value in 'abc')
+        seen.add(a)
+        seen.add(b)
+        # Seeing a again makes b the oldest
+        seen.add(a)
+        seen.add(c)
+        self.assertEqual(len(seen), 2)
+        self.assertIn(a, seen)
+        self.assertNotIn(b, seen)
+
+    def test_saved_set_is_loaded(self):
+        seen = dedupe.SeenSet(path=self.path)
+        seen.add(dedupe.fingerprint('a'))
+        seen.save()
+
+        loaded = dedupe.SeenSet(path=self.path)
+        self.assertFalse(loaded.add(dedupe.fingerprint('a')))
+        self.assertTrue(loaded.add(dedupe.fingerprint('b')))
+
+    def test_save_keeps_fingerprints_saved_by_others(self):
+        first = dedupe.SeenSet(path=self.path)
+        second = dedupe.SeenSet(path=self.path)
+        first.add(dedupe.fingerprint('a'))
+        second.add(dedupe.fingerprint('b'))
+        first.save()
+        second.save()
+
+        loaded = dedupe.SeenSet(path=self.path)
+        self.assertIn(dedupe.fingerprint('a'), loaded)
+        self.assertIn(dedupe.fingerprint('b'), loaded)
+
+    def test_invalid_size_raises_exception(self):
+        with self.assertRaisesRegex(ValueError, 'at least 1'):
+            dedupe.SeenSet(max_entries=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from parameterized import parameterized
+
+from .. import fetchers
+from .. import instrumentation
+
+
+class _FlakyHandler(BaseHTTPRequestHandler):
+    '''Answers 503 for the first `server.failures` requests and 200 afterwards.
+
+    Failures ask to be retried after `server.retry_after`, if set.
+    '''
+
+    def do_GET(self):
+        self.server.num_requests += 1
+        if self.server.num_requests <= self.server.failures:
+            self.send_response(503)
+            if self.server.retry_after is not None:
+                self.send_header('Retry-After', self.server.retry_after)
+            self.end_headers()
+            return
+        body = b'<html><body><div class="id">1</div></body></html>'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FlakyHandler)
+        self.server.num_requests = 0
+        self.server.failures = 0
+        self.server.retry_after = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.timings = instrumentation.Timings()
+        self.fetcher = fetchers.HttpFetcher(retries=2, backoff=0.01,
+                                            timings=self.timings)
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_text(self):
+        self.assertIn('class="id"', self.fetcher.get_text(self.url))
+        self.assertEqual(self.timings.count('fetch'), 1)
+
+    def test_retries_until_success(self):
+        self.server.failures = 2
+        self.assertEqual(self.fetcher.get(self.url).status_code, 200)
+        self.assertEqual(self.server.num_requests, 3)
+        self.assertEqual(self.timings.count('fetch_backoff'), 2)
+
+    def test_exhausted_retries_raise_exception(self):
+        self.server.failures = 10
+        with self.assertRaisesRegex(fetchers.FetchError, 'after 3 attempts'):
+            self.fetcher.get(self.url)
+
+    def test_retry_after_is_honored(self):
+        self.server.failures = 1
+        self.server.retry_after = '0.2'
+        self.assertEqual(self.fetcher.get(self.url).status_code, 200)
+        self.assertGreaterEqual(self.timings.seconds('fetch_backoff'), 0.2)
+
+    def test_retries_can_be_overridden_per_request(self):
+        self.server.failures = 1
+        with self.assertRaisesRegex(fetchers.FetchError, 'after 1 attempts'):
+            self.fetcher.get(self.url, retries=0)
+
+
+class TestAsyncFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FlakyHandler)
+        self.server.num_requests = 0
+        self.server.failures = 0
+        self.server.retry_after = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.timings = instrumentation.Timings()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _get_text(self, url, **kwargs):
+        async def get_text():
+            fetcher = fetchers.AsyncFetcher(retries=2, backoff=0.01,
+                                            timings=self.timings)
+            try:
+                return await fetcher.get_text(url, retries=2, backoff=0.01, **kwargs)
+            finally:
+                await fetcher.close()
+        return asyncio.run(get_text())
+
+    def test_get_text(self):
+        self.assertIn('class="id"', self._get_text(self.url))
+        self.assertEqual(self.timings.count('fetch'), 1)
+
+    def test_retries_until_success(self):
+        self.server.failures = 2
+        self.assertIn('class="id"', self._get_text(self.url))
+        self.assertEqual(self.server.num_requests, 3)
+
+    def test_exhausted_retries_raise_exception(self):
+        self.server.failures = 10
+        with self.assertRaisesRegex(fetchers.FetchError, 'after 3 attempts'):
+            self._get_text(self.url)
+
+    def test_retry_after_is_honored(self):
+        self.server.failures = 1
+        self.server.retry_after = '0.2'
+        self.assertIn('class="id"', self._get_text(self.url))
+        self.assertGreaterEqual(self.timings.seconds('fetch_backoff'), 0.2)
+
+    def test_fetcher_is_shared_per_loop(self):
+        async def get_fetchers():
+            try:
+                return fetchers.get_async_fetcher(), fetchers.get_async_fetcher()
+            finally:
+                await fetchers.close_async_fetcher()
+        first, second = asyncio.run(get_fetchers())
+        self.assertIs(first, second)
+
+
+class TestRetryDelay(unittest.TestCase):
+
+    @parameterized.expand([
+        ('backoff', 0, None, 0.5),
+        ('doubled_backoff', 2, None, 2.0),
+        ('longer_retry_after', 1, 3.0, 3.0),
+        ('shorter_retry_after', 2, 1.0, 2.0),
+    ])
+    def test_retry_delay(self, _, attempt, retry_after, expected):
+        self.assertEqual(fetchers.retry_delay(0.5, attempt, retry_after), expected)
+
+
+class TestGetFetcher(unittest.TestCase):
+
+    def test_fetcher_is_shared(self):
+        self.assertIs(fetchers.get_fetcher(), fetchers.get_fetcher())
+
+
+if __name__ == '__main__':
+    unittest.main()
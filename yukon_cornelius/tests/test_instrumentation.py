@@ -0,0 +1,96 @@
+import unittest
+import io
+import json
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from .. import instrumentation
+from ..prospectors import samples
+
+
+class TestTimings(unittest.TestCase):
+
+    def test_timed_records_every_call(self):
+        timings = instrumentation.Timings()
+        double = timings.timed('double', lambda x: 2 * x)
+        self.assertEqual([double(1), double(2)], [2, 4])
+        self.assertEqual(timings.count('double'), 2)
+
+    def test_timed_records_failing_calls(self):
+        timings = instrumentation.Timings()
+
+        def fail():
+            raise RuntimeError('Layout changed')
+
+        with self.assertRaises(RuntimeError):
+            timings.timed('fail', fail)()
+        self.assertEqual(timings.count('fail'), 1)
+
+    def test_timed_leaves_none_alone(self):
+        self.assertIsNone(instrumentation.Timings().timed('missing', None))
+
+
+class TestRunSummaries(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write_summary(self):
+        path = os.path.join(self.tmpdir.name, 'exports', 'site.csv.stats.json')
+        instrumentation.write_summary(path, {'num_ore': 3})
+        with open(path) as f:
+            self.assertEqual(json.load(f), {'num_ore': 3})
+
+    def test_profiled_saves_stats(self):
+        path = os.path.join(self.tmpdir.name, 'site.prof')
+        with redirect_stdout(io.StringIO()) as out:
+            with instrumentation.profiled(path):
+                sorted(range(1000))
+        self.assertTrue(os.path.exists(path))
+        self.assertIn('cumulative', out.getvalue())
+
+
+class TestProspectorStats(unittest.TestCase):
+
+    def test_counts(self):
+        p = samples.SamplePaged('sample_paged_forum')
+        p.mine()
+        stats = p.stats
+        self.assertEqual(stats['num_ore'], 6)
+        self.assertEqual(stats['num_pages'], 3)
+        self.assertGreater(stats['num_tags'], 0)
+        self.assertGreater(stats['elapsed'], 0)
+        self.assertEqual(stats['timings']['parse']['count'], 3)
+        json.dumps(stats)
+
+    def test_hooks_are_only_timed_when_profiling(self):
+        p = samples.SampleWithDateProcessor('sample_forum')
+        p.mine()
+        self.assertNotIn('test_name', p.state['timings'])
+
+        p = samples.SampleWithDateProcessor('sample_forum', profile=True)
+        p.mine()
+        timings = p.state['timings']
+        for name in ['walk', 'test_forum_end', 'test_name', 'process_date']:
+            self.assertIn(name, timings)
+        self.assertEqual(timings['process_date']['count'], p.state['num_ore'])
+
+    def test_walk_includes_collecting_tags(self):
+        class SlowTags(samples.SamplePaged):
+            def _page_tags(self):
+                time.sleep(0.02)
+                return super()._page_tags()
+
+        p = SlowTags('sample_paged_forum', profile=True)
+        p.mine()
+        self.assertGreaterEqual(p.state['timings']['walk']['seconds'],
+                                0.02 * p.state['num_pages'])
+
+
+if __name__ == '__main__':
+    unittest.main()
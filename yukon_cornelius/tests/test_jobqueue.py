@@ -0,0 +1,159 @@
+import unittest
+import os
+import tempfile
+import time
+
+from parameterized import parameterized
+
+from ..prospectors import samples
+from .. import jobqueue
+
+
+def mine_pages(job, lease):
+    p = samples.SamplePaged(job.site_name, start_page=job.start_page,
+                            end_page=job.end_page)
+    p.mine()
+    return len(p.ore_cart)
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'queue', 'jobs.sqlite')
+        self.queue = jobqueue.JobQueue(self.path, backoff=60)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_claim_leases_jobs_in_order(self):
+        first = self.queue.add('sample_paged_forum', start_page=0, end_page=1)
+        second = self.queue.add('sample_paged_forum', start_page=1, end_page=2)
+
+        job = self.queue.claim('a')
+        self.assertEqual((job.id, job.start_page, job.end_page, job.attempts),
+                         (first, 0, 1, 1))
+        self.assertEqual(self.queue.claim('b').id, second)
+        self.assertIsNone(self.queue.claim('c'))
+        self.assertEqual(self.queue.counts()['running'], 2)
+
+    def test_expired_lease_is_claimed_again(self):
+        job_id = self.queue.add('sample_forum')
+        self.queue.claim('a', lease_seconds=0)
+        time.sleep(0.01)
+
+        job = self.queue.claim('b')
+        self.assertEqual((job.id, job.attempts), (job_id, 2))
+        # The first worker lost the job
+        self.assertFalse(self.queue.renew(job_id, 'a'))
+        self.assertFalse(self.queue.complete(job_id, 'a'))
+        self.assertTrue(self.queue.complete(job_id, 'b', rows=4))
+        self.assertEqual(self.queue.jobs('done')[0]['rows'], 4)
+
+    def test_failed_job_is_retried_after_backoff(self):
+        job_id = self.queue.add('sample_forum')
+        self.queue.claim('a')
+        self.assertTrue(self.queue.fail(job_id, 'a', 'boom'))
+
+        # Not available until the backoff passed
+        self.assertIsNone(self.queue.claim('a'))
+        job = self.queue.jobs('pending')[0]
+        self.assertEqual((job['attempts'], job['error']), (1, 'boom'))
+
+    def test_expired_last_attempt_fails_job(self):
+        job_id = self.queue.add('sample_forum', max_attempts=1)
+        self.queue.claim('a', lease_seconds=0)
+        time.sleep(0.01)
+
+        self.assertIsNone(self.queue.claim('b'))
+        job = self.queue.jobs('failed')[0]
+        self.assertEqual(job['id'], job_id)
+        self.assertIn('Lease expired', job['error'])
+
+    def test_job_fails_after_max_attempts(self):
+        queue = jobqueue.JobQueue(self.path, backoff=0)
+        job_id = queue.add('sample_forum', max_attempts=2)
+        for _ in range(2):
+            queue.claim('a')
+            queue.fail(job_id, 'a', 'boom')
+
+        self.assertIsNone(queue.claim('a'))
+        self.assertEqual(queue.counts()['failed'], 1)
+        self.assertEqual(queue.retry_failed(), 1)
+        self.assertEqual(queue.claim('a').attempts, 1)
+
+    @parameterized.expand([
+        ('xlsx2', {}, 'not a valid export filetype'),
+        ('csv', {'start_page': 2, 'end_page': 2}, 'end_page must be after'),
+    ])
+    def test_invalid_jobs_raise_exception(self, export_filetype, pages, message):
+        with self.assertRaisesRegex(ValueError, message):
+            self.queue.add('sample_forum', export_filetype, **pages)
+
+
+class TestRunWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'jobs.sqlite')
+        self.queue = jobqueue.JobQueue(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_worker_drains_queue(self):
+        for start in range(2):
+            self.queue.add('sample_paged_forum', start_page=start, end_page=start + 1)
+
+        self.assertEqual(jobqueue.run_worker(self.path, mine_pages, worker_id='a'), 2)
+        self.assertTrue(self.queue.is_drained())
+        self.assertEqual([job['rows'] for job in self.queue.jobs('done')], [4, 2])
+
+    def test_failing_job_is_retried_until_it_fails(self):
+        def target(job, lease):
+            raise RuntimeError('no posts here')
+
+        self.queue.add('sample_forum', max_attempts=2)
+        num_jobs = jobqueue.run_worker(self.path, target, poll_interval=0, backoff=0)
+        self.assertEqual(num_jobs, 2)
+        failed = self.queue.jobs('failed')
+        self.assertEqual(len(failed), 1)
+        self.assertIn('no posts here', failed[0]['error'])
+
+    def take_over(self, job):
+        '''Lets worker "b" take over `job` and finish it with 5 rows.'''
+        with self.queue._connect() as db:
+            db.execute('UPDATE jobs SET lease_expires = 0 WHERE id = ?', (job.id,))
+        self.assertEqual(self.queue.claim('b').id, job.id)
+        self.queue.complete(job.id, 'b', rows=5)
+
+    @parameterized.expand([('finished', False), ('stopped', True)])
+    def test_lost_job_is_not_counted(self, _, stops):
+        def target(job, lease):
+            self.take_over(job)
+            lease.lost = True
+            if stops:
+                lease.check()
+            return 4
+
+        self.queue.add('sample_forum')
+        self.assertEqual(jobqueue.run_worker(self.path, target, worker_id='a'), 0)
+        job = self.queue.jobs('done')[0]
+        self.assertEqual((job['lease_owner'], job['rows'], job['error']), ('b', 5, None))
+
+    def test_lost_lease_raises_exception(self):
+        self.queue.add('sample_forum')
+        job = self.queue.claim('a')
+        lease = jobqueue.Lease(self.queue, job, 'a', lease_seconds=0.03)
+        self.take_over(job)
+        time.sleep(0.1)
+        lease.stop()
+        with self.assertRaises(jobqueue.LeaseLostError):
+            lease.check()
+
+    def test_pool_of_workers(self):
+        for start in range(2):
+            self.queue.add('sample_paged_forum', start_page=start, end_page=start + 1)
+
+        counts = jobqueue.run_workers(self.path, mine_pages, num_workers=2)
+        self.assertEqual(counts, {'pending': 0, 'running': 0, 'done': 2, 'failed': 0})
@@ -0,0 +1,48 @@
+import unittest
+import os
+import subprocess
+import sys
+
+from parameterized import parameterized
+
+from .. import lazy
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TestLazyModule(unittest.TestCase):
+
+    def test_module_is_imported_on_first_use(self):
+        module = lazy.LazyModule('json')
+        self.assertFalse(module.loaded)
+        self.assertEqual(module.dumps([1]), '[1]')
+        self.assertTrue(module.loaded)
+
+    def test_submodules_are_imported(self):
+        module = lazy.LazyModule('xml', ['dom.minidom'])
+        self.assertTrue(hasattr(module.dom, 'minidom'))
+
+    def test_missing_attribute_raises_exception(self):
+        with self.assertRaises(AttributeError):
+            lazy.LazyModule('json').not_an_attribute
+
+    def test_optional_missing_module_is_none(self):
+        self.assertIsNone(lazy.optional('not_a_module_yukon'))
+        self.assertIsInstance(lazy.optional('json'), lazy.LazyModule)
+
+
+class TestImportLightStartup(unittest.TestCase):
+
+    @parameterized.expand(['mine', 'yukon_cornelius.utils',
+                           'yukon_cornelius.prospectors.sites'])
+    def test_import_does_not_load_heavy_modules(self, module):
+        code = (f'import sys, {module}\n'
+                f'print(",".join(name for name in ["pandas", "bs4", "lxml", "requests"] '
+                f'if name in sys.modules))')
+        output = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
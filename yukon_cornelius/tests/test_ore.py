@@ -0,0 +1,76 @@
+import unittest
+import pickle
+
+import pandas as pd
+
+from ..prospectors import samples
+from .. import ore
+
+
+class TestOre(unittest.TestCase):
+
+    def setUp(self):
+        self.ore_type = ore.make_ore_type(('id', 'name'))
+
+    def test_ore_starts_bare(self):
+        o = self.ore_type('foo')
+        self.assertTrue(o.bare)
+        self.assertFalse(o.complete)
+        self.assertEqual(o.attributes, {'id': None, 'name': None})
+
+    def test_filling_all_attributes_completes_ore(self):
+        o = self.ore_type('foo')
+        o.id = '1'
+        self.assertFalse(o.bare)
+        self.assertFalse(o.complete)
+        o.set(1, 'John')
+        self.assertTrue(o.complete)
+        self.assertEqual(o.values, ('1', 'John'))
+
+    def test_overwriting_attribute_keeps_count(self):
+        o = self.ore_type('foo')
+        o.id = '1'
+        o.id = '2'
+        o.id = None
+        self.assertTrue(o.bare)
+
+    def test_ore_has_no_instance_dict(self):
+        with self.assertRaises(AttributeError):
+            self.ore_type('foo').age = 4
+
+    def test_ore_type_is_cached(self):
+        self.assertIs(ore.make_ore_type(('id', 'name')), self.ore_type)
+
+    def test_reserved_attribute_raises_exception(self):
+        with self.assertRaisesRegex(ValueError, 'reserved'):
+            ore.make_ore_type(('id', 'values'))
+
+    def test_pickle(self):
+        o = self.ore_type('foo')
+        o.id = '1'
+        copy = pickle.loads(pickle.dumps(o))
+        self.assertEqual(copy.attributes, o.attributes)
+        self.assertEqual(copy.site_name, 'foo')
+
+
+class TestOreBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.p = samples.SampleNoProcessors('sample_forum')
+        self.p.mine()
+
+    def test_batch_frame_matches_refined_frame(self):
+        batch = ore.OreBatch(self.p.attributes, 'sample_forum')
+        batch.extend(self.p.ore_cart)
+        self.assertEqual(len(batch), 4)
+        expected = pd.DataFrame([o.attributes for o in self.p.ore_cart])
+        pd.testing.assert_frame_equal(batch.to_frame(), expected)
+
+    def test_batch_rejects_ore_from_other_site(self):
+        batch = ore.OreBatch(self.p.attributes, 'other_forum')
+        with self.assertRaisesRegex(ValueError, 'other_forum'):
+            batch.append(self.p.ore_cart[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,23 @@
 import unittest
+import asyncio
+import os
 import re
+import tempfile
+from unittest import mock
 
+import bs4
+import lxml.etree
+import pandas as pd
 from bs4.element import Tag
 from parameterized import parameterized
 
 from .. import constants
+from .. import dedupe
 from ..prospectors import base
 from ..prospectors import samples
+from ..prospectors import sites
+from .. import refinery
+from .. import sinks
 from .. import utils
 
 
@@ -52,6 +63,19 @@ class TestProspectorBase(unittest.TestCase):
         with self.assertRaises(NotImplementedError):
             p.mine()
 
+    def test_missing_tester_raises_exception_before_mining(self):
+        p = base.ProspectorBase('sample_forum')
+        with self.assertRaisesRegex(NotImplementedError, '_is_id_tag'):
+            p.mine()
+        self.assertEqual(p.state['num_ore'], 0)
+
+    def test_invalid_selector_raises_exception(self):
+        class EmptySelector(samples.SampleWithSelectors):
+            SELECTORS = {'id': (None, None)}
+
+        with self.assertRaisesRegex(ValueError, 'tag name or a class'):
+            EmptySelector('sample_forum')
+
 
 
 class TestSampleNoProcesors(unittest.TestCase):
@@ -78,7 +102,400 @@ class TestSampleWithDateProcessor(unittest.TestCase):
                                  '10/1/2000',
                                  '10/1/2000',
                                  '10/1/2000'])
-    
+
+
+class TestSampleWithSelectors(unittest.TestCase):
+
+    def test_selectors_match_testers(self):
+        expected = samples.SampleNoProcessors('sample_forum')
+        expected.mine()
+        p = samples.SampleWithSelectors('sample_forum')
+        p.mine()
+        self.assertEqual([ore.attributes for ore in p.ore_cart],
+                         [ore.attributes for ore in expected.ore_cart])
+
+
+class _PostInOneTag(samples.SampleNoProcessors):
+    SAME_TAG = [('id', 'name', 'date', 'body')]
+
+    def _is_id_tag(self, tag):
+        return utils.check_class(tag, 'poststart')
+
+    @base.per_tag
+    def _fields(self, tag):
+        self.parsed.append(tag)
+        return {child.attrs['class'][0]: child.text.strip()
+                for child in tag.find_all(True)}
+
+    def _process_id(self, tag):
+        return self._fields(tag)['id']
+
+    def _process_name(self, tag):
+        return self._fields(tag)['name']
+
+    def _process_date(self, tag):
+        return self._fields(tag)['date']
+
+    def _process_body(self, tag):
+        return self._fields(tag)['postbody']
+
+
+class _SharedTester(samples.SampleNoProcessors):
+
+    def _is_id_tag(self, tag):
+        self.tested.append(tag)
+        return utils.check_class(tag, 'id')
+
+    _is_name_tag = _is_id_tag
+
+    def _process_name(self, tag):
+        return f'poster of {tag.text}'
+
+
+class TestSameTag(unittest.TestCase):
+
+    def test_group_is_filled_from_one_tag(self):
+        p = _PostInOneTag('sample_forum')
+        p.parsed = []
+        p.mine()
+        self.assertEqual([ore.attributes['name'] for ore in p.ore_cart],
+                         ['John', 'Cathy', 'Sam', 'Josephine'])
+        self.assertEqual(p.ore_cart[0].attributes['body'], 'I like butter')
+        # Every post was parsed once for its four attributes
+        self.assertEqual(len(p.parsed), 4)
+
+    def test_same_tester_is_called_once_per_tag(self):
+        p = _SharedTester('sample_forum')
+        p.tested = []
+        p.mine()
+        self.assertEqual(len(p.tested), p.state['num_tags'])
+        self.assertEqual([ore.attributes['name'] for ore in p.ore_cart],
+                         [f'poster of {i}' for i in range(1, 5)])
+
+    def test_followers_need_no_tester(self):
+        self.assertEqual(_PostInOneTag.same_tag_followers(['id', 'name', 'body']),
+                         {'name': 'id', 'body': 'id'})
+        self.assertEqual(_PostInOneTag.same_tag_followers(['name', 'date']),
+                         {'date': 'name'})
+
+
+class TestClassicCars(unittest.TestCase):
+
+    @parameterized.expand([
+        ('Posted: Mon Jan 5, 2009 10:25 pm', '2009-01-05T22:25:00'),
+        ('Posted: Tue Dec 12, 2010 12:05 am', '2010-12-12T00:05:00'),
+        ('Posted: Tue Dec 12, 2010 12:05 pm', '2010-12-12T12:05:00'),
+        ('Posted: Tue Dec 12, 2010 9:05 am', '2010-12-12T09:05:00'),
+    ])
+    def test_date_matches_schema_conversion(self, text, expected):
+        p = sites.ClassicCars('classic_cars_forum', load=False)
+        tag = bs4.BeautifulSoup(f'<span class="postdetails">{text}</span>',
+                                'html.parser').span
+        converted = refinery.refine_column(pd.Series([text], dtype=object),
+                                           p.schema['date'])
+        self.assertEqual(converted[0].isoformat(), expected)
+
+        p.schema = {}
+        self.assertEqual(p._process_date(tag), expected)
+
+    def test_unrecognized_date_is_left_empty(self):
+        p = sites.ClassicCars('classic_cars_forum', load=False)
+        p.schema = {}
+        tag = bs4.BeautifulSoup('<span>Posted: yesterday</span>', 'html.parser').span
+        self.assertEqual(p._process_date(tag), '')
+
+
+class _SelectedForumEnd(samples.SampleNoProcessors):
+    FORUM_END_SELECTOR = ('div', 'forumend')
+
+    def _is_forum_end(self, tag):
+        self.tested.append(tag)
+        return super()._is_forum_end(tag)
+
+
+class TestTagHelpers(unittest.TestCase):
+
+    def test_patterns_are_compiled_once_per_class(self):
+        patterns = base.compile_patterns(constants.ClassicCars)
+        self.assertIs(patterns, base.compile_patterns(constants.ClassicCars))
+        self.assertIsInstance(patterns.POST_DATE_PATTERN, re.Pattern)
+        self.assertFalse(hasattr(patterns, 'MONTHS'))
+
+    def test_sites_without_constants_have_no_patterns(self):
+        p = samples.SampleNoProcessors('sample_forum')
+        self.assertEqual(vars(p.patterns), {})
+
+    @parameterized.expand(['sample_forum', 'sample_forum_etree'])
+    def test_forum_end_is_only_tested_on_selected_tags(self, site_name):
+        _SelectedForumEnd.tested = []
+        p = _SelectedForumEnd(site_name)
+        p.mine()
+        self.assertEqual(len(p.ore_cart), 4)
+        self.assertGreater(p.state['num_tags'], 0)
+        self.assertEqual(_SelectedForumEnd.tested, [])
+
+    @parameterized.expand(['sample_forum', 'sample_forum_etree'])
+    def test_tag_text_is_kept_for_one_tag(self, site_name):
+        p = samples.SampleNoProcessors(site_name)
+        tag = p.state['current_tag']
+        text = p.tag_text(tag)
+        self.assertIn('Test Forum', text)
+        self.assertIs(p.tag_text(tag), text)
+
+        p.mine()
+        self.assertEqual(p._tag_memo, {})
+
+
+class _SkippedPosts(samples.SampleNoProcessors):
+    SKIP_SELECTORS = [('div', 'poststart')]
+
+
+class TestTagWalk(unittest.TestCase):
+
+    @parameterized.expand(['sample_forum', 'sample_forum_etree',
+                           'sample_forum_streamed'])
+    def test_skipped_subtrees_are_not_visited(self, site_name):
+        expected = samples.SampleNoProcessors(site_name)
+        expected.mine()
+        p = _SkippedPosts(site_name)
+        p.mine()
+
+        self.assertEqual(p.ore_cart, [])
+        # Four posts of four tags each
+        self.assertEqual(expected.state['num_tags'] - p.state['num_tags'], 16)
+
+    def test_invalid_skip_selector_raises_exception(self):
+        class EmptySkip(samples.SampleNoProcessors):
+            SKIP_SELECTORS = [(None, None)]
+
+        with self.assertRaisesRegex(ValueError, 'tag name or a class'):
+            EmptySkip('sample_forum')
+
+    @parameterized.expand(['sample_forum', 'sample_forum_etree'])
+    def test_page_ends_when_tags_run_out(self, site_name):
+        p = samples.SampleNoProcessors(site_name)
+        if p._uses_etree:
+            num_tags = sum(1 for _ in p._soup.iter(lxml.etree.Element))
+        else:
+            num_tags = len(p._soup.find_all(True))
+        p.mine()
+        self.assertEqual(p.state['num_tags'], num_tags)
+        self.assertTrue(p.state['is_finished'])
+
+
+class TestParsers(unittest.TestCase):
+
+    def _mine(self, prospector_class, site_name):
+        p = prospector_class(site_name)
+        p.mine()
+        return p
+
+    @parameterized.expand(['sample_forum_strained', 'sample_forum_etree',
+                           'sample_forum_streamed'])
+    def test_parser_finds_same_posts(self, site_name):
+        expected = self._mine(samples.SampleWithDateProcessor, 'sample_forum')
+        p = self._mine(samples.SampleWithDateProcessor, site_name)
+        self.assertEqual([ore.date for ore in p.ore_cart],
+                         [ore.date for ore in expected.ore_cart])
+        self.assertEqual(len(p.ore_cart), 4)
+
+    def test_strained_soup_drops_other_tags(self):
+        p = samples.SampleNoProcessors('sample_forum_strained')
+        self.assertIsNone(p.state['soup'].find('h3'))
+
+    def test_etree_default_processor_serializes_tag(self):
+        p = self._mine(samples.SampleNoProcessors, 'sample_forum_etree')
+        self.assertEqual(p.ore_cart[0].id, '<div class="id">1</div>')
+
+    def test_etree_with_selectors(self):
+        p = self._mine(samples.SampleWithSelectors, 'sample_forum_etree')
+        self.assertEqual(len(p.ore_cart), 4)
+
+    def test_streamed_file_matches_etree(self):
+        expected = self._mine(samples.SampleNoProcessors, 'sample_forum_etree')
+        p = self._mine(samples.SampleNoProcessors, 'sample_forum_streamed')
+        self.assertEqual([ore.values for ore in p.ore_cart],
+                         [ore.values for ore in expected.ore_cart])
+
+
+class TestSamplePaged(unittest.TestCase):
+
+    def test_mine_all_pages(self):
+        p = samples.SamplePaged('sample_paged_forum')
+        p.mine()
+        self.assertEqual(len(p.ore_cart), 6)
+        self.assertEqual(p.state['current_page'], 2)
+
+    @parameterized.expand([1, 2, 5])
+    def test_prefetch_keeps_ore_order(self, prefetch_pages):
+        expected = samples.SamplePaged('sample_paged_forum', prefetch_pages=0)
+        expected.mine()
+        p = samples.SamplePaged('sample_paged_forum', prefetch_pages=prefetch_pages)
+        p.mine()
+        self.assertEqual([ore.attributes for ore in p.ore_cart],
+                         [ore.attributes for ore in expected.ore_cart])
+
+    def test_failed_mining_releases_resources(self):
+        class Failing(samples.SamplePaged):
+            def _process_body(self, tag):
+                raise RuntimeError('bad post')
+
+        sink = mock.Mock(num_rows=0)
+        p = Failing('sample_paged_forum', prefetch_pages=2, sink=sink)
+        with self.assertRaisesRegex(RuntimeError, 'bad post'):
+            p.mine()
+        self.assertIsNone(p._prefetcher)
+        sink.flush.assert_called_once_with()
+        self.assertIn('mine', p.stats['timings'])
+
+    def test_prefetch_stops_at_end_page(self):
+        p = samples.SamplePaged('sample_paged_forum', prefetch_pages=5, end_page=1,
+                                load=False)
+        p._prefetcher.schedule = mock.Mock()
+        p._prefetcher.get = mock.Mock(return_value=None)
+        p._start_page = mock.Mock()
+        p.make_soup()
+        p._prefetcher.schedule.assert_called_once_with([p.root_source])
+        p._prefetcher.close()
+
+
+class _RepeatedPage(samples.SamplePaged):
+    '''Serves the first page again as page 1, and the other pages one later.'''
+
+    def _page_source(self, page):
+        return super()._page_source(max(page - 1, 0))
+
+
+class TestRepeatedContent(unittest.TestCase):
+
+    def setUp(self):
+        expected = samples.SamplePaged('sample_paged_forum')
+        expected.mine()
+        self.ids = [ore.id for ore in expected.ore_cart]
+
+    @parameterized.expand([
+        ('stop', 'sample_paged_forum', 0, 4),
+        ('skip', 'sample_paged_forum_skipping', 0, 6),
+        ('skip_prefetched', 'sample_paged_forum_skipping', 2, 6),
+    ])
+    def test_repeated_page_is_not_mined(self, _, site_name, prefetch_pages, num_ore):
+        p = _RepeatedPage(site_name, prefetch_pages=prefetch_pages)
+        p.mine()
+        self.assertEqual([ore.id for ore in p.ore_cart], self.ids[:num_ore])
+        self.assertEqual(p.stats['num_repeated_pages'], 1)
+
+    @parameterized.expand([('mine',), ('amine',)])
+    def test_duplicate_ore_is_dropped(self, method):
+        p = _RepeatedPage('sample_paged_forum_deduped')
+        if method == 'amine':
+            asyncio.run(p.amine())
+        else:
+            p.mine()
+        self.assertEqual([ore.id for ore in p.ore_cart], self.ids)
+        self.assertEqual(p.stats['num_duplicates'], 4)
+        self.assertEqual(p.stats['num_repeated_pages'], 0)
+
+
+class _FailingOnSecondPage(samples.SamplePaged):
+
+    def _process_body(self, tag):
+        if self._current_page == 1:
+            raise RuntimeError('bad post')
+        return self.tag_text(tag)
+
+
+class TestPersistedDedupe(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'export.csv')
+        patcher = mock.patch.object(constants, 'SEEN_DIR',
+                                    os.path.join(self.tmpdir.name, 'seen'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def export(self, prospector_class=samples.SamplePaged, resume=None):
+        '''Mines into the export, appending after `resume`, and returns the export
+        and the position of the sink.'''
+        with sinks.CsvSink(self.path, ['id', 'name', 'date', 'body'],
+                           resume=resume) as sink:
+            p = prospector_class('sample_paged_forum_persisted', sink=sink,
+                                 keep_ore=False)
+            try:
+                p.mine()
+            finally:
+                position = sink.position()
+        return pd.read_csv(self.path), position
+
+    def saved_fingerprints(self):
+        return len(dedupe.SeenSet.for_site('sample_paged_forum_persisted'))
+
+    def test_rerun_exports_every_row(self):
+        first, _ = self.export()
+        second, _ = self.export()
+        self.assertEqual(len(first), 6)
+        pd.testing.assert_frame_equal(second, first)
+
+    def test_appending_run_drops_exported_ore(self):
+        _, position = self.export()
+        export, _ = self.export(resume=position)
+        self.assertEqual(len(export), 6)
+
+    def test_failed_run_does_not_save_fingerprints(self):
+        self.export()
+        self.assertEqual(self.saved_fingerprints(), 6)
+
+        with self.assertRaisesRegex(RuntimeError, 'bad post'):
+            self.export(_FailingOnSecondPage)
+        # The export was written again from the start
+        self.assertEqual(self.saved_fingerprints(), 0)
+
+        _, position = self.export()
+        with self.assertRaisesRegex(RuntimeError, 'bad post'):
+            self.export(_FailingOnSecondPage, resume=position)
+        self.assertEqual(self.saved_fingerprints(), 6)
+
+
+class TestAsyncMining(unittest.TestCase):
+
+    @parameterized.expand([
+        ('sample_paged_forum',),
+        ('sample_forum_etree',),
+        ('sample_forum_streamed',),
+    ])
+    def test_amine_matches_mine(self, site_name):
+        prospector_class = samples.SamplePaged
+        if site_name != 'sample_paged_forum':
+            prospector_class = samples.SampleWithDateProcessor
+        expected = prospector_class(site_name)
+        expected.mine()
+
+        p = prospector_class(site_name, load=False)
+        asyncio.run(p.amine())
+        self.assertEqual([ore.values for ore in p.ore_cart],
+                         [ore.values for ore in expected.ore_cart])
+        self.assertEqual(p.state['num_pages'], expected.state['num_pages'])
+
+    def test_many_prospectors_share_one_loop(self):
+        async def mine_all():
+            prospectors = [samples.SamplePaged('sample_paged_forum', load=False)
+                           for _ in range(5)]
+            await asyncio.gather(*(p.amine() for p in prospectors))
+            return prospectors
+
+        for p in asyncio.run(mine_all()):
+            self.assertEqual(len(p.ore_cart), 6)
+            self.assertTrue(p.state['is_finished'])
+
+    def test_mine_loads_deferred_soup(self):
+        p = samples.SamplePaged('sample_paged_forum', load=False)
+        self.assertIsNone(p.state['soup'])
+        p.mine()
+        self.assertEqual(len(p.ore_cart), 6)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
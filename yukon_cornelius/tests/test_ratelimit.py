@@ -0,0 +1,152 @@
+import unittest
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from parameterized import parameterized
+
+from .. import fetchers
+from .. import instrumentation
+from ..ratelimit import HostRateLimiter, parse_retry_after
+
+
+def _acquire_tokens(directory, count):
+    limiter = HostRateLimiter(directory)
+    for _ in range(count):
+        limiter.acquire('forum.example.com', rate=20, burst=1)
+
+
+class _PoliteHandler(BaseHTTPRequestHandler):
+    '''Serves a robots.txt and answers 429 for the first `server.failures` pages.'''
+
+    def do_GET(self):
+        if self.path == '/robots.txt':
+            body = self.server.robots.encode()
+        else:
+            self.server.num_requests += 1
+            if self.server.num_requests <= self.server.failures:
+                self.send_response(429)
+                self.send_header('Retry-After', '0')
+                self.end_headers()
+                return
+            body = b'<html></html>'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHostRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.limiter = HostRateLimiter(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_burst_is_not_delayed(self):
+        waits = [self.limiter.acquire('forum.example.com', rate=1, burst=3)
+                 for _ in range(3)]
+        self.assertEqual(waits, [0.0, 0.0, 0.0])
+
+    def test_requests_past_burst_wait_for_tokens(self):
+        start = time.time()
+        for _ in range(5):
+            self.limiter.acquire('forum.example.com', rate=20, burst=1)
+        # The first token is free, the next four take 1 / 20 seconds each
+        self.assertGreaterEqual(time.time() - start, 0.19)
+
+    def test_hosts_have_separate_buckets(self):
+        self.limiter.acquire('a.example.com', rate=0.1, burst=1)
+        self.assertEqual(self.limiter.acquire('b.example.com', rate=0.1, burst=1), 0.0)
+
+    def test_bucket_is_shared_across_processes(self):
+        start = time.time()
+        workers = [multiprocessing.Process(target=_acquire_tokens,
+                                           args=(self.tmpdir.name, 3))
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        # Six tokens at 20 per second, one of them free
+        self.assertGreaterEqual(time.time() - start, 0.24)
+
+    def test_penalize_and_reward(self):
+        self.limiter.penalize('forum.example.com')
+        self.limiter.penalize('forum.example.com')
+        self.assertEqual(self.limiter.slowdown('forum.example.com'), 4)
+        for _ in range(20):
+            self.limiter.reward('forum.example.com')
+        self.assertEqual(self.limiter.slowdown('forum.example.com'), 1)
+
+    def test_retry_after_blocks_requests(self):
+        self.limiter.penalize('forum.example.com', retry_after=0.2)
+        waited = self.limiter.acquire('forum.example.com', rate=100, burst=10)
+        self.assertGreater(waited, 0.1)
+
+    @parameterized.expand([
+        ('seconds', '3', 3.0),
+        ('missing', None, None),
+        ('garbage', 'soon', None),
+        ('past_date', 'Wed, 21 Oct 2015 07:28:00 GMT', 0.0),
+    ])
+    def test_parse_retry_after(self, _, value, expected):
+        self.assertEqual(parse_retry_after(value), expected)
+
+
+class TestRateLimitedFetching(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _PoliteHandler)
+        self.server.num_requests = 0
+        self.server.failures = 0
+        self.server.robots = 'User-agent: *\nDisallow:\n'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/page'
+        self.host = f'127.0.0.1:{self.server.server_port}'
+        self.timings = instrumentation.Timings()
+        self.fetcher = fetchers.HttpFetcher(
+            retries=2, backoff=0.01, timings=self.timings,
+            rate_limiter=HostRateLimiter(os.path.join(self.tmpdir.name, 'limits')))
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_wait_is_recorded(self):
+        for _ in range(3):
+            self.fetcher.get(self.url, rate_limit={'requests_per_second': 20})
+        self.assertEqual(self.timings.count('rate_limit_wait'), 3)
+        self.assertGreater(self.timings.seconds('rate_limit_wait'), 0.05)
+
+    def test_robots_crawl_delay_lowers_rate(self):
+        self.server.robots = 'User-agent: *\nCrawl-delay: 1\n'
+        self.assertEqual(self.fetcher.crawl_delay(self.url), 1)
+
+        rate_limit = {'requests_per_second': 100}
+        start = time.time()
+        self.fetcher.get(self.url, rate_limit=rate_limit)
+        self.fetcher.get(self.url, rate_limit=rate_limit)
+        self.assertGreaterEqual(time.time() - start, 0.9)
+
+    def test_too_many_requests_slows_host_down(self):
+        self.server.failures = 1
+        response = self.fetcher.get(self.url, rate_limit={'requests_per_second': 100})
+        self.assertEqual(response.status_code, 200)
+        # Halved by the 429, then partly recovered by the 200
+        self.assertAlmostEqual(self.fetcher.rate_limiter.slowdown(self.host), 1.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
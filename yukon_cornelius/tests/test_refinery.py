@@ -0,0 +1,135 @@
+import unittest
+import datetime
+import json
+import os
+import tempfile
+
+import pandas as pd
+from parameterized import parameterized
+
+from .. import constants
+from .. import refinery
+from .. import sinks
+from .. import utils
+from ..ore import make_ore_type
+
+ATTRIBUTES = ('id', 'name', 'date')
+SCHEMA = {
+    'id': {'type': 'int'},
+    'name': {'type': 'category'},
+    'date': {'type': 'datetime',
+             'pattern': 'Posted: (?:[a-zA-Z]{3} )?([a-zA-Z]{3} [0-9]{1,2}, [0-9]{4} '
+                        '[0-9]{1,2}:[0-9]{2} [ap]m)',
+             'format': '%b %d, %Y %I:%M %p'},
+}
+RAW_ROWS = [
+    ('1', 'John', 'Posted: Mon Jan 5, 2009 10:25 pm\xa0 Post subject: A35'),
+    ('2', 'Cathy', 'Posted: Tue Dec 12, 2010 12:05 am'),
+    ('three', 'John', 'Posted: sometime'),
+]
+
+
+def _make_ore_list():
+    ore_type = make_ore_type(ATTRIBUTES)
+    ore_list = []
+    for values in RAW_ROWS:
+        ore = ore_type('typed_forum')
+        for i, value in enumerate(values):
+            ore.set(i, value)
+        ore_list.append(ore)
+    return ore_list
+
+
+class TestCheckSchema(unittest.TestCase):
+
+    def test_valid_schema(self):
+        refinery.check_schema(SCHEMA, ATTRIBUTES)
+
+    @parameterized.expand([
+        ('unknown_attribute', {'age': {'type': 'int'}}, 'not one of the attributes'),
+        ('unknown_type', {'id': {'type': 'uuid'}}, 'not a valid type'),
+        ('format_without_datetime', {'id': {'type': 'int', 'format': '%d'}},
+         'only applies to datetime'),
+        ('pattern_without_group', {'id': {'type': 'int', 'pattern': '[0-9]+'}},
+         'exactly one group'),
+    ])
+    def test_invalid_schema_raises_exception(self, _, schema, message):
+        with self.assertRaisesRegex(ValueError, message):
+            refinery.check_schema(schema, ATTRIBUTES)
+
+
+class TestRefineFrame(unittest.TestCase):
+
+    def setUp(self):
+        self.df = refinery.refine_frame(
+            pd.DataFrame(RAW_ROWS, columns=list(ATTRIBUTES)), SCHEMA)
+
+    def test_columns_are_typed(self):
+        self.assertEqual(str(self.df['id'].dtype), 'Int64')
+        self.assertEqual(str(self.df['name'].dtype), 'category')
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(self.df['date']))
+
+    def test_values_are_converted(self):
+        self.assertEqual(self.df['id'][0], 1)
+        self.assertEqual(self.df['date'][0], pd.Timestamp(2009, 1, 5, 22, 25))
+        self.assertEqual(self.df['date'][1], pd.Timestamp(2010, 12, 12, 0, 5))
+
+    def test_unconvertible_values_are_missing(self):
+        self.assertTrue(pd.isna(self.df['id'][2]))
+        self.assertTrue(pd.isna(self.df['date'][2]))
+
+    def test_frame_rows(self):
+        rows = refinery.frame_rows(self.df)
+        self.assertEqual(rows[0], [1, 'John', datetime.datetime(2009, 1, 5, 22, 25)])
+        self.assertEqual(rows[2], [None, 'John', None])
+
+
+class TestTypedExports(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        for f in os.listdir(constants.EXPORT_DIR):
+            if f.startswith('typed_forum'):
+                os.remove(os.path.join(constants.EXPORT_DIR, f))
+
+    def test_refine_ore_applies_schema(self):
+        df = utils.refine_ore(_make_ore_list(), 'csv', schema=SCHEMA)
+        self.assertEqual(str(df['id'].dtype), 'Int64')
+
+    def test_streamed_jsonl_matches_refined_jsonl(self):
+        path = os.path.join(self.tmpdir.name, 'typed_forum.jsonl')
+        with sinks.JsonLinesSink(path, ATTRIBUTES, schema=SCHEMA) as sink:
+            for ore in _make_ore_list():
+                sink.write(ore)
+        utils.refine_ore(_make_ore_list(), 'jsonl', schema=SCHEMA)
+
+        with open(path) as f:
+            streamed = [json.loads(line) for line in f]
+        with open(os.path.join(constants.EXPORT_DIR, 'typed_forum.jsonl')) as f:
+            refined = [json.loads(line) for line in f]
+        self.assertEqual(streamed, refined)
+        self.assertEqual(streamed[0]['date'], '2009-01-05T22:25:00')
+
+    def test_sink_converts_in_batches(self):
+        path = os.path.join(self.tmpdir.name, 'typed_forum.csv')
+        sink = sinks.CsvSink(path, ATTRIBUTES, flush_every=2, schema=SCHEMA)
+        for ore in _make_ore_list():
+            sink.write(ore)
+
+        # The first two rows were converted and written when the batch filled up
+        self.assertEqual(len(pd.read_csv(path)), 2)
+        position = sink.position()
+        self.assertEqual(position['num_rows'], 3)
+        self.assertEqual(len(pd.read_csv(path)), 3)
+        sink.close()
+
+        df = pd.read_csv(path, index_col=0, parse_dates=['date'])
+        self.assertEqual(list(df.index), [0, 1, 2])
+        self.assertEqual(df['date'][0], pd.Timestamp(2009, 1, 5, 22, 25))
+
+
+if __name__ == '__main__':
+    unittest.main()
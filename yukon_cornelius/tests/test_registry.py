@@ -0,0 +1,109 @@
+import unittest
+import json
+import os
+import pickle
+import tempfile
+from unittest import mock
+
+from parameterized import parameterized
+
+from .. import constants
+from .. import registry
+from .. import utils
+
+SAMPLE_FORUM = {
+    'source': '/Users/nate/flashpoint/yukon_cornelius/tests/sample_forum.html',
+    'source_type': 'html_file',
+    'prospector_class': 'SampleNoProcessors',
+    'attributes': ['id', 'name', 'date', 'body'],
+}
+
+
+class TestSiteRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, constants.CONFIG_FILE)
+        self.write_config({'sample_forum': SAMPLE_FORUM})
+
+    def tearDown(self):
+        registry._registries.pop(self.path, None)
+        self.tmpdir.cleanup()
+
+    def write_config(self, configs):
+        with open(self.path, 'w') as f:
+            json.dump(configs, f)
+
+    def test_config_is_read_only(self):
+        config = registry.get_registry(self.path).config('sample_forum')
+        self.assertEqual(config['source_type'], 'html_file')
+        self.assertEqual(config['attributes'], ('id', 'name', 'date', 'body'))
+        with self.assertRaisesRegex(TypeError, 'read-only'):
+            config['source'] = 'other.html'
+
+    def test_registry_is_loaded_once(self):
+        site_registry = registry.get_registry(self.path)
+        with mock.patch.object(registry.SiteRegistry, 'from_file') as from_file:
+            self.assertIs(registry.get_registry(self.path), site_registry)
+        from_file.assert_not_called()
+
+    def test_changed_file_is_reloaded(self):
+        registry.get_registry(self.path)
+        self.write_config({'sample_forum': SAMPLE_FORUM,
+                           'sample_forum2': SAMPLE_FORUM})
+        self.assertIn('sample_forum2', registry.get_registry(self.path))
+
+    def test_path_from_environment(self):
+        with mock.patch.dict(os.environ, {constants.CONFIG_FILE_ENV: self.path}):
+            self.assertEqual(registry.get_registry().path, self.path)
+
+    @parameterized.expand([
+        ('invalid_source', {'source': 'forum.txt'}, 'invalid source'),
+        ('invalid_stream', {'stream': {'name': 'div'}}, 'lxml-etree'),
+        ('unknown_prospector', {'prospector_class': 'Missing'}, 'unknown prospector'),
+        ('missing_tester', {'attributes': ['id', 'likes']}, '_is_likes_tag'),
+        ('invalid_repeated_page', {'on_repeated_page': 'retry'}, 'on_repeated_page'),
+        ('unknown_dedupe', {'dedupe': {'attributes': ['likes']}}, 'dedupes on'),
+    ])
+    def test_invalid_site_raises_exception_when_used(self, _, changes, message):
+        self.write_config({'sample_forum': SAMPLE_FORUM,
+                           'invalid_forum': dict(SAMPLE_FORUM, **changes)})
+        site_registry = registry.get_registry(self.path)
+
+        self.assertIn('invalid_forum', site_registry.errors)
+        with self.assertRaisesRegex(utils.InvalidConfigError, message):
+            site_registry.config('invalid_forum')
+        # Other websites are still usable
+        site_registry.config('sample_forum')
+
+    def test_prospector_class_is_resolved(self):
+        site_registry = registry.get_registry(self.path)
+        self.assertEqual(site_registry.prospector_class('sample_forum').__name__,
+                         'SampleNoProcessors')
+
+    @parameterized.expand([
+        ('same_tag', ['id', 'name', 'date', 'body']),
+        ('without_first_of_group', ['name', 'body']),
+    ])
+    def test_same_tag_attributes_are_valid(self, _, attributes):
+        # ClassicCars fills "name" from the tag of "id"
+        self.write_config({'classic_cars': dict(SAMPLE_FORUM, attributes=attributes,
+                                                prospector_class='ClassicCars')})
+        site_registry = registry.get_registry(self.path)
+        self.assertEqual(site_registry.errors, {})
+
+    def test_installed_registry_is_used(self):
+        registry.get_registry(self.path)
+        # As passed to a worker process
+        snapshot = pickle.loads(pickle.dumps(registry.snapshot()))
+        registry._registries.pop(self.path)
+
+        registry.install(snapshot)
+        site_registry = registry.get_registry(self.path)
+        self.assertIs(site_registry, snapshot[self.path])
+        self.assertEqual(site_registry.config('sample_forum')['attributes'],
+                         ('id', 'name', 'date', 'body'))
+
+
+if __name__ == '__main__':
+    unittest.main()
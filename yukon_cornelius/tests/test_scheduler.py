@@ -0,0 +1,108 @@
+import unittest
+import asyncio
+import sys
+import threading
+import time
+
+from parameterized import parameterized
+
+from .. import scheduler
+
+
+def _count_rows(site_name, rows=3, delay=0):
+    time.sleep(delay)
+    if site_name == 'broken_forum':
+        raise RuntimeError('Page layout changed')
+    if site_name == 'exiting_forum':
+        sys.exit(3)
+    return rows
+
+
+async def _acount_rows(site_name, rows=3, delay=0):
+    await asyncio.sleep(delay)
+    if site_name == 'broken_forum':
+        raise RuntimeError('Page layout changed')
+    return rows
+
+
+class _ConcurrencyCounter:
+    '''Target that records the largest number of calls running at once.'''
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, site_name):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.1)
+        with self.lock:
+            self.running -= 1
+        return 1
+
+
+class TestRunScheduler(unittest.TestCase):
+
+    @parameterized.expand(['process', 'thread'])
+    def test_results_are_collected_in_job_order(self, mode):
+        s = scheduler.RunScheduler(_count_rows, max_workers=2, mode=mode)
+        results = s.run([('forum_a', {'rows': 5}, None),
+                         ('broken_forum', {}, None),
+                         ('forum_b', {}, None)])
+
+        self.assertEqual([r.site_name for r in results],
+                         ['forum_a', 'broken_forum', 'forum_b'])
+        self.assertEqual([r.status for r in results], ['ok', 'failed', 'ok'])
+        self.assertEqual(results[0].rows, 5)
+        self.assertIn('Page layout changed', results[1].error)
+
+    @parameterized.expand(['process', 'thread'])
+    def test_timeout(self, mode):
+        s = scheduler.RunScheduler(_count_rows, mode=mode)
+        results = s.run([('slow_forum', {'delay': 5}, 0.2)])
+        self.assertEqual(results[0].status, 'timeout')
+        self.assertLess(results[0].elapsed, 5)
+
+    def test_process_exit_code_is_reported(self):
+        s = scheduler.RunScheduler(_count_rows, mode='process')
+        result = s.run([('exiting_forum', {}, None)])[0]
+        self.assertEqual(result.status, 'failed')
+
+    def test_max_workers_is_respected(self):
+        counter = _ConcurrencyCounter()
+        s = scheduler.RunScheduler(counter, max_workers=2, mode='thread')
+        results = s.run([(f'forum_{i}', {}, None) for i in range(6)])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(counter.max_running, 2)
+
+    def test_async_mode(self):
+        s = scheduler.RunScheduler(_acount_rows, max_workers=2, mode='async')
+        results = s.run([('forum_a', {'rows': 5}, None),
+                         ('broken_forum', {}, None),
+                         ('slow_forum', {'delay': 5}, 0.2)])
+        self.assertEqual([r.status for r in results], ['ok', 'failed', 'timeout'])
+        self.assertEqual(results[0].rows, 5)
+        self.assertIn('Page layout changed', results[1].error)
+        self.assertLess(results[2].elapsed, 5)
+
+    def test_async_mode_runs_jobs_concurrently(self):
+        s = scheduler.RunScheduler(_acount_rows, max_workers=10, mode='async')
+        start = time.monotonic()
+        results = s.run([(f'forum_{i}', {'delay': 0.2}, None) for i in range(10)])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_invalid_mode_raises_exception(self):
+        with self.assertRaisesRegex(ValueError, 'not a valid mode'):
+            scheduler.RunScheduler(_count_rows, mode='fork')
+
+    def test_format_summary(self):
+        summary = scheduler.format_summary(
+            [scheduler.SiteResult('forum_a', 'ok', 1.5, rows=10)])
+        self.assertIn('forum_a', summary)
+        self.assertIn('10', summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import os
+from unittest import mock
+
+import pandas as pd
+from parameterized import parameterized
+
+from ..prospectors import samples
+from .. import constants
+from .. import sharding
+
+
+class TestFindPageCount(unittest.TestCase):
+
+    def test_sample_paged_forum(self):
+        p = samples.SamplePaged('sample_paged_forum')
+        self.assertEqual(sharding.find_page_count(p), 2)
+
+    def test_unaddressable_pages_raise_exception(self):
+        p = samples.SampleNoProcessors('sample_forum')
+        with self.assertRaisesRegex(ValueError, '_page_source'):
+            sharding.find_page_count(p)
+
+
+class TestSplitPages(unittest.TestCase):
+
+    @parameterized.expand([
+        (10, 3, [(0, 4), (4, 7), (7, 10)]),
+        (2, 4, [(0, 1), (1, 2)]),
+        (5, 1, [(0, 5)]),
+    ])
+    def test_split_pages(self, page_count, num_shards, expected):
+        self.assertEqual(sharding.split_pages(page_count, num_shards), expected)
+
+
+class TestMineSharded(unittest.TestCase):
+
+    def test_page_range(self):
+        p = samples.SamplePaged('sample_paged_forum', start_page=1, end_page=2)
+        p.mine()
+        self.assertEqual(len(p.ore_cart), 2)
+
+    def test_end_page_stops_before_turning(self):
+        p = samples.SamplePaged('sample_paged_forum', end_page=1)
+        p.mine()
+        self.assertEqual(len(p.ore_cart), 4)
+        self.assertEqual(p.state['current_page'], 0)
+
+    def test_sharded_ore_matches_sequential_ore(self):
+        expected = samples.SamplePaged('sample_paged_forum')
+        expected.mine()
+        ore_list = sharding.iter_sharded(samples.SamplePaged, 'sample_paged_forum',
+                                         num_workers=2, num_shards=3)
+        self.assertEqual([ore.attributes for ore in ore_list],
+                         [ore.attributes for ore in expected.ore_cart])
+
+    def test_sharded_ore_is_exported(self):
+        expected = samples.SamplePaged('sample_paged_forum')
+        expected.mine()
+        path = os.path.join(constants.EXPORT_DIR, 'sample_paged_forum.csv')
+        self.addCleanup(os.remove, path)
+        num_ore = sharding.mine_sharded(samples.SamplePaged, 'sample_paged_forum',
+                                        'csv', num_workers=2)
+        self.assertEqual(num_ore, 6)
+        self.assertEqual(list(pd.read_csv(path)['id']),
+                         [ore.id for ore in expected.ore_cart])
+
+    def test_page_count_is_probed_without_loading(self):
+        with mock.patch.object(samples.SamplePaged, 'make_soup') as make_soup:
+            list(sharding.iter_sharded(samples.SamplePaged, 'sample_paged_forum',
+                                       num_workers=1))
+        # Shards are mined in other processes
+        make_soup.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
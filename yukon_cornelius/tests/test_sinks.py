@@ -0,0 +1,203 @@
+import unittest
+import os
+import tempfile
+
+import pandas as pd
+from parameterized import parameterized
+
+from ..prospectors import samples
+from .. import constants
+from .. import sinks
+from .. import utils
+from ..ore import make_ore_type
+
+
+def _make_ore_list(rows, attributes=('id', 'name', 'date')):
+    ore_type = make_ore_type(attributes)
+    ore_list = []
+    for values in rows:
+        ore = ore_type('sample_forum')
+        for i, value in enumerate(values):
+            ore.set(i, value)
+        ore_list.append(ore)
+    return ore_list
+
+
+class TestSinks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        for f in os.listdir(constants.EXPORT_DIR):
+            if f.startswith('sample_forum'):
+                os.remove(os.path.join(constants.EXPORT_DIR, f))
+
+    def _stream(self, export_type, **kwargs):
+        path = os.path.join(self.tmpdir.name, f'sample_forum.{export_type}')
+        p = samples.SampleNoProcessors('sample_forum')
+        with sinks.SINK_TYPES[export_type](path, p.attributes, **kwargs) as sink:
+            p._sink = sink
+            p.mine()
+        return p, path
+
+    # Streamed files should read back the same as files written by `refine_ore`
+    @parameterized.expand([
+        ('csv', pd.read_csv),
+        ('html', lambda path: pd.read_html(path)[0]),
+        ('jsonl', lambda path: pd.read_json(path, lines=True)),
+        ('csv.gz', pd.read_csv),
+        ('jsonl.gz', lambda path: pd.read_json(path, lines=True)),
+    ])
+    def test_streamed_export_matches_refined_export(self, export_type, reader):
+        p, path = self._stream(export_type)
+        utils.refine_ore(p.ore_cart, export_type)
+        expected = os.path.join(constants.EXPORT_DIR, f'sample_forum.{export_type}')
+        pd.testing.assert_frame_equal(reader(path), reader(expected))
+
+    def test_rows_are_flushed_while_mining(self):
+        path = os.path.join(self.tmpdir.name, 'sample_forum.csv')
+        p = samples.SampleNoProcessors('sample_forum')
+        sink = sinks.CsvSink(path, p.attributes, flush_every=1)
+        p._sink = sink
+        p.mine()
+
+        # Not closed yet, but every row is already on disk
+        self.assertEqual(len(pd.read_csv(path)), 4)
+        sink.close()
+
+    def test_ore_cart_is_optional(self):
+        p = samples.SampleNoProcessors('sample_forum', keep_ore=False)
+        p.mine()
+        self.assertEqual(p.ore_cart, [])
+        self.assertEqual(p.state['num_ore'], 4)
+
+    def test_gzip_sink_resumes_from_position(self):
+        path = os.path.join(self.tmpdir.name, 'sample_forum.csv.gz')
+        ore_list = _make_ore_list([(i, 'John', '10/1/2000') for i in range(5)])
+        with sinks.CsvGzipSink(path, ['id', 'name', 'date'], flush_every=1) as sink:
+            for ore in ore_list[:3]:
+                sink.write(ore)
+            position = sink.position()
+            sink.write(ore_list[3])
+
+        with sinks.CsvGzipSink(path, ['id', 'name', 'date'], resume=position) as sink:
+            for ore in ore_list[3:]:
+                sink.write(ore)
+
+        df = pd.read_csv(path, index_col=0)
+        self.assertEqual(list(df.index), list(range(5)))
+        self.assertEqual(list(df['id']), list(range(5)))
+
+    def test_open_sink_with_unstreamable_type_raises_exception(self):
+        with self.assertRaisesRegex(ValueError, 'can not be streamed'):
+            sinks.open_sink('sample_forum', ['id'], 'json')
+
+
+@unittest.skipUnless(sinks.pyarrow, 'pyarrow is not installed')
+class TestColumnarSinks(unittest.TestCase):
+
+    SCHEMA = {'id': {'type': 'int'},
+              'name': {'type': 'category'},
+              'date': {'type': 'datetime', 'format': '%m/%d/%Y'}}
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @parameterized.expand([
+        ('parquet', pd.read_parquet),
+        ('feather', pd.read_feather),
+    ])
+    def test_columns_are_typed(self, export_type, reader):
+        path = os.path.join(self.tmpdir.name, f'sample_forum.{export_type}')
+        rows = [('1', 'John', '10/1/2000'), ('2', 'Cathy', '10/2/2000'),
+                ('3', 'Amy', '10/3/2000')]
+        with sinks.SINK_TYPES[export_type](path, ['id', 'name', 'date'], flush_every=2,
+                                           schema=self.SCHEMA) as sink:
+            for ore in _make_ore_list(rows):
+                sink.write(ore)
+
+        df = reader(path)
+        self.assertEqual(list(df['id']), [1, 2, 3])
+        # Categories of later batches are added to those of earlier ones
+        self.assertEqual(list(df['name']), ['John', 'Cathy', 'Amy'])
+        self.assertEqual(str(df['name'].dtype), 'category')
+        self.assertEqual(df['date'][2], pd.Timestamp(2000, 10, 3))
+
+    def test_parquet_row_groups(self):
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.tmpdir.name, 'sample_forum.parquet')
+        rows = [(str(i), 'John', '10/1/2000') for i in range(5)]
+        with sinks.ParquetSink(path, ['id', 'name', 'date'], flush_every=2) as sink:
+            for ore in _make_ore_list(rows):
+                sink.write(ore)
+
+        self.assertEqual(pq.ParquetFile(path).num_row_groups, 3)
+        self.assertEqual(list(pd.read_parquet(path)['id']), [str(i) for i in range(5)])
+
+    def test_columnar_sinks_can_not_be_resumed(self):
+        path = os.path.join(self.tmpdir.name, 'sample_forum.parquet')
+        with self.assertRaisesRegex(ValueError, 'can not be resumed'):
+            sinks.ParquetSink(path, ['id'], resume={'num_rows': 1, 'offset': 10})
+
+
+class TestPartitionedSink(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, 'sample_forum.csv')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _read(self, partition):
+        return pd.read_csv(os.path.join(self.directory, partition, 'part.csv'))
+
+    def test_partition_by_page(self):
+        p = samples.SamplePaged('sample_paged_forum')
+        with sinks.PartitionedSink(self.directory, p.attributes, 'csv', 'page',
+                                   pages_per_partition=1) as sink:
+            p._sink = sink
+            p.mine()
+
+        self.assertEqual(sink.partitions, ['pages=0-0', 'pages=1-1'])
+        self.assertEqual(len(self._read('pages=0-0')), 4)
+        self.assertEqual(len(self._read('pages=1-1')), 2)
+
+    def test_partition_by_month(self):
+        schema = {'date': {'type': 'datetime', 'format': '%b %d, %Y'}}
+        rows = [(1, 'John', 'Jan 5, 2009'), (2, 'Cathy', 'Feb 1, 2009'),
+                (3, 'Amy', 'Jan 30, 2009'), (4, 'Amy', 'sometime')]
+        with sinks.PartitionedSink(self.directory, ['id', 'name', 'date'], 'csv',
+                                   'date', schema=schema, flush_every=3) as sink:
+            for ore in _make_ore_list(rows):
+                sink.write(ore)
+
+        self.assertEqual(sink.partitions, ['month=2009-01', 'month=2009-02',
+                                           'month=unknown'])
+        self.assertEqual(list(self._read('month=2009-01')['id']), [1, 3])
+        self.assertEqual(list(self._read('month=unknown')['id']), [4])
+
+    def test_earlier_partitions_are_removed(self):
+        os.makedirs(os.path.join(self.directory, 'pages=900-999'))
+        with sinks.PartitionedSink(self.directory, ['id'], 'csv', 'page') as sink:
+            sink.write(_make_ore_list([(1,)], attributes=('id',))[0], page=0)
+        self.assertEqual(sink.partitions, ['pages=0-99'])
+
+    @parameterized.expand([
+        ('unknown_column', 'author', None),
+        ('untyped_column', 'date', {'date': {'type': 'str'}}),
+    ])
+    def test_invalid_partitioning_raises_exception(self, _, partition_by, schema):
+        with self.assertRaisesRegex(ValueError, 'can be partitioned by'):
+            sinks.PartitionedSink(self.directory, ['id', 'date'], 'csv', partition_by,
+                                  schema=schema)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,16 @@
 import unittest
+import asyncio
 from parameterized import parameterized
 from bs4 import BeautifulSoup
 from pandas import DataFrame
 import os
+import tempfile
+from unittest import mock
 
 from ..prospectors import samples
 from .. import constants
+from .. import lazy
+from .. import sinks
 from .. import utils
     
 
@@ -18,6 +23,10 @@ class TestLoadConfig(unittest.TestCase):
         with self.assertRaisesRegex(utils.InvalidConfigError, 'missing the following'):
             config = utils.load_website_config('test_website_with_missing_keys')
 
+    def test_load_site_with_invalid_schema_raises_exception(self):
+        with self.assertRaisesRegex(utils.InvalidConfigError, 'invalid schema'):
+            config = utils.load_website_config('test_website_with_invalid_schema')
+
     def test_attempt_to_load_missing_site_raises_exception(self):
         with self.assertRaisesRegex(utils.InvalidConfigError, 'google not found'):
             config = utils.load_website_config('google')
@@ -33,6 +42,10 @@ class TestMakeSoup(unittest.TestCase):
         with self.assertRaisesRegex(utils.InvalidSourceError, 'https_url'):
             soup = utils.make_soup('thiswebsite.com', 'https_url')
 
+    def test_make_soup_from_invalid_http_url(self):
+        with self.assertRaisesRegex(utils.InvalidSourceError, 'http_url'):
+            soup = utils.make_soup('https://www.google.com', 'http_url')
+
     def test_make_soup_from_valid_html_file(self):
         soup = utils.make_soup('/Users/nate/flashpoint/yukon_cornelius/'
                                'tests/sample_forum.html', 'html_file')
@@ -42,12 +55,101 @@ class TestMakeSoup(unittest.TestCase):
         with self.assertRaisesRegex(utils.InvalidSourceError, 'html_file'):
             soup = utils.make_soup('thiswebsite.txt', 'html_file')
 
+    def test_amake_soup_from_valid_html_file(self):
+        soup = asyncio.run(utils.amake_soup('/Users/nate/flashpoint/yukon_cornelius/'
+                                            'tests/sample_forum.html', 'html_file'))
+        self.assertIsInstance(soup, BeautifulSoup)
+
+    def test_amake_soup_from_invalid_html_file(self):
+        with self.assertRaisesRegex(utils.InvalidSourceError, 'html_file'):
+            asyncio.run(utils.amake_soup('thiswebsite.txt', 'html_file'))
+
+    def test_make_soup_with_lxml_etree_parser(self):
+        root = utils.make_soup('/Users/nate/flashpoint/yukon_cornelius/'
+                               'tests/sample_forum.html', 'html_file',
+                               parser='lxml-etree')
+        self.assertEqual(root.tag, 'html')
+
+    def test_make_soup_with_invalid_parser(self):
+        with self.assertRaisesRegex(utils.InvalidConfigError, 'not a valid parser'):
+            soup = utils.make_soup('sample_forum.html', 'html_file', parser='foo')
+
     def test_make_soup_with_invalid_source_type(self):
         with self.assertRaisesRegex(utils.InvalidSourceError,
                                      'not a valid source type'):
             soup = utils.make_soup('sample_forum.html', 'html')
 
 
+class TestHtmlFileStream(unittest.TestCase):
+
+    SAMPLE_FORUM = '/Users/nate/flashpoint/yukon_cornelius/tests/sample_forum.html'
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_make_soup_returns_stream(self):
+        stream = utils.make_soup(self.SAMPLE_FORUM, 'html_file', parser='lxml-etree',
+                                 stream={'class': 'poststart'})
+        self.assertIsInstance(stream, utils.HtmlFileStream)
+
+    # Small chunks split tags and text across reads
+    @parameterized.expand([(16,), (constants.STREAM_CHUNK_BYTES,)])
+    def test_selected_tags_are_yielded_whole(self, chunk_bytes):
+        stream = utils.HtmlFileStream(self.SAMPLE_FORUM,
+                                      {'name': 'div', 'class': 'poststart'})
+        # Elements are cleared once walked, so only what was seen on the way is kept
+        with mock.patch.object(constants, 'STREAM_CHUNK_BYTES', chunk_bytes):
+            seen = [(e.get('class'), e.text) for e in stream]
+        ids = [text for classname, text in seen if classname == 'id']
+        self.assertEqual(ids, ['1', '2', '3', '4'])
+
+        # Each post is followed by its id, name, date and body
+        classes = [classname for classname, _ in seen]
+        position = classes.index('poststart')
+        self.assertEqual(classes[position:position + 5],
+                         ['poststart', 'id', 'name', 'date', 'postbody'])
+
+    def test_nested_selected_tags_are_not_split(self):
+        path = os.path.join(self.tmpdir.name, 'nested.html')
+        with open(path, 'w') as f:
+            f.write('<html><body>' + '<div class="post"><div class="post">quote</div>'
+                    '<p class="body">reply</p></div>' * 3 + '</body></html>')
+        stream = utils.HtmlFileStream(path, {'class': 'post'})
+        with mock.patch.multiple(constants, STREAM_CHUNK_BYTES=8,
+                                 STREAM_SEGMENT_BYTES=8):
+            seen = [e.get('class') for e in stream if e.get('class')]
+        # Every reply is walked inside its post, after the post it quotes
+        self.assertEqual(seen, ['post', 'post', 'body'] * 3)
+
+    def test_walked_posts_are_released(self):
+        stream = utils.HtmlFileStream(self.SAMPLE_FORUM, {'class': 'poststart'})
+        posts = []
+        for element in stream:
+            if utils.check_class(element, 'poststart'):
+                posts.append(element)
+                if len(posts) == 3:
+                    break
+        self.assertEqual(len(posts[0]), 0)
+        self.assertEqual(len(posts[2]), 4)
+
+    def test_stream_without_selector_raises_exception(self):
+        with self.assertRaisesRegex(utils.InvalidConfigError, 'must select'):
+            utils.HtmlFileStream(self.SAMPLE_FORUM, {})
+
+    @parameterized.expand([
+        ('url', 'https://www.google.com', 'https_url', 'lxml-etree', 'html_file'),
+        ('parser', SAMPLE_FORUM, 'html_file', 'lxml', 'lxml-etree parser'),
+    ])
+    def test_invalid_stream_raises_exception(self, _, source, source_type, parser,
+                                             message):
+        with self.assertRaisesRegex(utils.InvalidConfigError, message):
+            utils.make_soup(source, source_type, parser=parser,
+                            stream={'class': 'poststart'})
+
+
 class TestCheckClass(unittest.TestCase):
 
     def setUp(self):
@@ -63,6 +165,18 @@ class TestCheckClass(unittest.TestCase):
 
     def test_no_classes_returns_false(self):
         self.assertFalse(utils.check_class(self.tag_noclasses, 'classname'))
+
+    def test_lxml_element(self):
+        element = utils.parse_html('<div class="foo bar"></div>', parser='lxml-etree')
+        self.assertTrue(utils.check_class(element.find('.//div'), 'bar'))
+        self.assertFalse(utils.check_class(element.find('.//div'), 'foobar'))
+
+    def test_lxml_element_imported_elsewhere(self):
+        import lxml.html
+        element = lxml.html.fromstring('<div class="foo bar"></div>')
+        # As if only another module had used lxml so far
+        with mock.patch.object(utils, 'lxml', lazy.LazyModule('lxml', ['html'])):
+            self.assertTrue(utils.check_class(element, 'bar'))
         
 
 class TestRefineOre(unittest.TestCase):
@@ -75,6 +189,8 @@ class TestRefineOre(unittest.TestCase):
     # added, the test should not have to be updated
     @parameterized.expand(constants.VALID_ORE_EXPORT_TYPES)
     def test_refine_valid_ore_(self, export_type):
+        if export_type in ['parquet', 'feather'] and sinks.pyarrow is None:
+            self.skipTest('pyarrow is not installed')
         df = utils.refine_ore(self.p.ore_cart, export_type)
         self.assertIsInstance(df, DataFrame)
         path = os.path.join(constants.EXPORT_DIR, f'sample_forum.{export_type}')
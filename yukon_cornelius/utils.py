@@ -1,11 +1,21 @@
-import bs4
-import requests
+import asyncio
 import re
-import json
-import pandas as pd
+import mmap
 import os
+import sys
 
 from yukon_cornelius import constants
+from yukon_cornelius import dedupe
+from yukon_cornelius import fetchers
+from yukon_cornelius import instrumentation
+from yukon_cornelius import lazy
+from yukon_cornelius import refinery
+from yukon_cornelius import registry
+from yukon_cornelius.ore import OreBatch
+
+bs4 = lazy.LazyModule('bs4')
+lxml = lazy.LazyModule('lxml', ['etree', 'html'])
+pd = lazy.LazyModule('pandas')
 
 class InvalidSourceError(Exception):
     '''Raised if source is not valid.'''
@@ -15,60 +25,310 @@ class InvalidConfigError(Exception):
     '''Rasied if config file is not valid.'''
     pass
 
+class RepeatedPageError(Exception):
+    '''Raised instead of parsing a page that was already mined.'''
+    pass
+
 def load_website_config(site_name):
     '''Loads the configuration for a specific website.
-    
+
+    The config file is read and validated once, and again only when it changes (see
+    `registry.get_registry`). The returned config is read-only.
+
     Args:
       site_name: str. A website defined in the config file `constants.CONFIG_FILE.`
-      
+
+    Raises:
+      InvalidConfigError: if `site_name` is not in the config file or is invalid.
     '''
-    with open(constants.CONFIG_FILE, 'r') as f:
-        config = json.load(f)
+    return registry.get_registry().config(site_name)
 
-    if site_name not in config.keys():
-        raise InvalidConfigError(f'{site_name} not found in config!')
 
-    # Make sure each website has required keys
-    missing_keys = []
-    keys = config[site_name].keys()
-    for req_key in constants.REQUIRED_CONFIG_KEYS:
-        if req_key not in keys:
-            missing_keys.append(req_key)
-    if missing_keys:
-        raise InvalidConfigError(f'Website {site_name} is missing the following'
-                                    f'keys: {missing_keys}') 
+def make_soup(source, source_type, fetch_options=None, timings=None,
+              parser=constants.DEFAULT_PARSER, parse_only=None, stream=None,
+              check_page=None):
+    '''Makes soup from a source.
 
-    return config[site_name]
+    Args:
+      source: str. Path or url, depending on `source_type`.
+      source_type: str. One of `constants.VALID_SOURCE_TYPES`.
+      fetch_options: dict. Keyword arguments for `fetchers.HttpFetcher.get`, e.g.
+        the "fetch" key of a website config. Only used for urls.
+      timings: instrumentation.Timings. Receives the time spent reading and
+        parsing. Defaults to `instrumentation.TIMINGS`.
+      parser: str. One of `constants.VALID_PARSERS`. "lxml" and "html.parser" build
+        a `bs4.BeautifulSoup`, while "lxml-etree" returns the root
+        `lxml.html.HtmlElement` of the document.
+      parse_only: dict. Restricts a BeautifulSoup to the tags matching a "name"
+        and/or "class" (each a string or list of strings). Everything else on the
+        page is dropped while parsing.
+      stream: dict. A "name" and/or "class" like `parse_only`, selecting the tags
+        that hold posts. Only for html files with the "lxml-etree" parser. Instead
+        of a parsed document, an `HtmlFileStream` is returned, which parses the file
+        while it is being walked.
+      check_page: callable. Called with the fingerprint of the html (see
+        `dedupe.fingerprint`) before it is parsed, and may raise RepeatedPageError
+        to skip parsing it. Not called for streams.
+    '''
+    if timings is None:
+        timings = instrumentation.TIMINGS
+    _check_source(source, source_type, parser, parse_only, stream)
 
+    if stream is not None:
+        return HtmlFileStream(source, stream, timings)
+    if source_type == 'html_file':
+        html = _read_file(source, timings)
+    else:
+        html = fetchers.get_fetcher().get_text(source, timings=timings,
+                                               **(fetch_options or {}))
+    if check_page is not None:
+        check_page(dedupe.fingerprint(html))
+    return _timed_parse(html, parser, parse_only, timings)
 
-def make_soup(source, source_type):
-    '''Makes soup from a source.'''
-    
+
+async def amake_soup(source, source_type, fetch_options=None, timings=None,
+                     parser=constants.DEFAULT_PARSER, parse_only=None, stream=None,
+                     check_page=None, executor=None):
+    '''Same as `make_soup`, without blocking the running event loop.
+
+    Urls are fetched with `fetchers.get_async_fetcher()`. Files are read and every
+    page is parsed in `executor`, or the loop's default executor if None. Streams
+    are returned right away, and parsed by whoever walks them.
+    '''
+    if timings is None:
+        timings = instrumentation.TIMINGS
+    _check_source(source, source_type, parser, parse_only, stream)
+    loop = asyncio.get_running_loop()
+
+    if stream is not None:
+        return HtmlFileStream(source, stream, timings)
+    if source_type == 'html_file':
+        html = await loop.run_in_executor(executor, _read_file, source, timings)
+    else:
+        html = await fetchers.get_async_fetcher().get_text(source, timings=timings,
+                                                           **(fetch_options or {}))
+    if check_page is not None:
+        check_page(dedupe.fingerprint(html))
+
+    return await loop.run_in_executor(executor, _timed_parse, html, parser, parse_only,
+                                      timings)
+
+
+def _check_source(source, source_type, parser, parse_only, stream=None):
+    '''Raises an exception if `make_soup` can't load `source` with these arguments.'''
     if source_type not in constants.VALID_SOURCE_TYPES:
         raise InvalidSourceError(f'{source_type} not a valid source type. Valid types'
                                  f' are: {constants.VALID_SOURCE_TYPES}')
+
+    if parser not in constants.VALID_PARSERS:
+        raise InvalidConfigError(f'{parser} not a valid parser. Valid parsers are: '
+                                 f'{constants.VALID_PARSERS}')
+
+    if parse_only is not None and parser == 'lxml-etree':
+        raise InvalidConfigError('parse_only is not supported by the lxml-etree parser')
+
+    if stream is not None:
+        if source_type != 'html_file':
+            raise InvalidConfigError(f'stream only supports html_file sources. Got '
+                                     f'{source_type}')
+        if parser != 'lxml-etree':
+            raise InvalidConfigError(f'stream requires the lxml-etree parser. Got '
+                                     f'{parser}')
     
     if source_type == 'html_file':
         if not source.endswith('.html'):
             raise InvalidSourceError(f'Invalid {source_type}')
-        with open(source, 'r') as f:
-            html = f.read()
     
     elif source_type == 'https_url':
         if not source.startswith('https://www.'):
             raise InvalidSourceError(f'Invaid {source_type}')    
-        html = requests.get(source).text
 
-    return bs4.BeautifulSoup(html, features='lxml')
+    # Plain http, e.g. local stand-ins for a site
+    elif source_type == 'http_url':
+        if not source.startswith('http://'):
+            raise InvalidSourceError(f'Invalid {source_type}')
+
+
+def _read_file(path, timings):
+    with timings.timer('read'):
+        with open(path, 'r') as f:
+            return f.read()
+
+
+def _timed_parse(html, parser, parse_only, timings):
+    with timings.timer('parse'):
+        return parse_html(html, parser=parser, parse_only=parse_only)
+
+
+def parse_html(html, parser=constants.DEFAULT_PARSER, parse_only=None):
+    '''Parses `html` with `parser`. See `make_soup` for the arguments.'''
+    if parser == 'lxml-etree':
+        return lxml.html.document_fromstring(html)
+
+    strainer = None
+    if parse_only is not None:
+        strainer = bs4.SoupStrainer(parse_only.get('name'),
+                                    class_=parse_only.get('class'))
+    return bs4.BeautifulSoup(html, features=parser, parse_only=strainer)
+
+
+def _as_list(value):
+    '''Returns a "name" or "class" of a selector as a list of strings.'''
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+class HtmlFileStream:
+    '''Elements of a local html file, parsed while they are being walked.
+
+    The file is memory-mapped and fed to an incremental lxml parser in chunks of
+    `constants.STREAM_CHUNK_BYTES`, so the document is never held in memory as a
+    whole. Iterating yields `lxml.html.HtmlElement`s:
+
+      - Tags matching `select` (usually one per post) are yielded together with
+        every element inside them, in document order, as soon as they have been
+        parsed. They are cleared once the next element is asked for.
+      - Any other tag is yielded once it has been parsed, after the tags inside
+        it, and without the selected tags it contained.
+
+    libxml2 keeps all input fed to one parser, so every
+    `constants.STREAM_SEGMENT_BYTES` or so the file is split just before a selected
+    tag, and the rest is parsed with a fresh parser. Splits are found by searching
+    the raw html for the selected start tags, and only made between selected tags.
+    Tags that are still open at a split, such as the body, are not yielded.
+    '''
+    def __init__(self, path, select, timings=None):
+        '''
+        Args:
+          path: str. Html file to stream.
+          select: dict. A "name" and/or "class" (each a string or list of strings)
+            matching the tags to yield whole.
+          timings: instrumentation.Timings. Receives the time spent reading and
+            parsing. Defaults to `instrumentation.TIMINGS`.
+        '''
+        self.path = path
+        self._names = _as_list(select.get('name'))
+        self._classes = _as_list(select.get('class'))
+        if not self._names and not self._classes:
+            raise InvalidConfigError('stream must select a "name" or a "class"')
+        self._timings = timings if timings is not None else instrumentation.TIMINGS
+
+        names = '|'.join(re.escape(name) for name in self._names) or r'[a-zA-Z][\w:-]*'
+        start_tag = rf'<(?:{names})\b'
+        if self._classes:
+            classes = '|'.join(re.escape(name) for name in self._classes)
+            start_tag += rf'[^>]*\bclass\s*=\s*["\']?[^"\'>]*\b(?:{classes})\b'
+        self._start_tag = re.compile(start_tag.encode(), re.IGNORECASE)
+
+    def _selects(self, element):
+        if self._names and element.tag not in self._names:
+            return False
+        return not self._classes or \
+            any(name in self._classes for name in element.get('class', '').split())
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                position = 0
+                while position < len(data):
+                    end = yield from self._walk_segment(data, position)
+                    _drop_pages(data, end)
+                    position = end
+
+    def _walk_segment(self, data, start):
+        '''Yields the elements of `data` from byte `start` on, with a fresh parser.
+
+        Returns the position the segment ended at.
+        '''
+        parser = lxml.etree.HTMLPullParser(events=('start', 'end'))
+        parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+        # Number of selected tags the parser is inside of
+        self._depth = 0
+        position = start
+        at_start_tag = False
+        while position < len(data):
+            long_enough = position - start >= constants.STREAM_SEGMENT_BYTES
+            if long_enough and at_start_tag and self._depth == 0:
+                # Drops the ends of tags that are still open, like the body
+                parser.close()
+                return position
+
+            end = min(position + constants.STREAM_CHUNK_BYTES, len(data))
+            at_start_tag = False
+            if position + constants.STREAM_CHUNK_BYTES - start >= \
+                constants.STREAM_SEGMENT_BYTES:
+                # Stop short of the next selected tag, where the segment may end
+                match = self._start_tag.search(data, position + 1, end)
+                if match is not None:
+                    end = match.start()
+                    at_start_tag = True
+
+            with self._timings.timer('read'):
+                chunk = data[position:end]
+            with self._timings.timer('parse'):
+                parser.feed(chunk)
+            position = end
+            yield from self._walk_events(parser)
+
+        with self._timings.timer('parse'):
+            parser.close()
+        yield from self._walk_events(parser)
+        return position
+
+    def _walk_events(self, parser):
+        for event, element in parser.read_events():
+            if not isinstance(element, lxml.html.HtmlElement):
+                continue
+            if event == 'start':
+                if self._selects(element):
+                    self._depth += 1
+            elif self._selects(element):
+                self._depth -= 1
+                if self._depth == 0:
+                    yield from element.iter(lxml.etree.Element)
+                    self._release(element)
+            elif self._depth == 0:
+                yield element
+                self._release(element)
+
+    @staticmethod
+    def _release(element):
+        '''Frees `element` and the siblings before it, which were already walked.'''
+        element.clear(keep_tail=False)
+        parent = element.getparent()
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def _drop_pages(data, end):
+    '''Lets the OS take back the pages of the memory map `data` before `end`.
+
+    They stay in the page cache, but no longer count towards this process.
+    '''
+    if not hasattr(mmap, 'MADV_DONTNEED'):
+        return
+    length = end - end % mmap.PAGESIZE
+    if length:
+        data.madvise(mmap.MADV_DONTNEED, 0, length)
 
 
 def check_class(tag, classname):
     '''Returns True if `tag` has a class `classname`.
     
     Args:
-      tag: bs4.element.Tag
+      tag: bs4.element.Tag or lxml.html.HtmlElement
       classname: str
     '''
+    # lxml elements only exist once lxml.html was imported, here or elsewhere
+    lxml_html = sys.modules.get('lxml.html')
+    if lxml_html is not None and isinstance(tag, lxml_html.HtmlElement):
+        return classname in tag.classes
+
     if not tag.attrs:
         return False 
 
@@ -77,35 +337,59 @@ def check_class(tag, classname):
     
     return classname in tag.attrs['class']
 
-def refine_ore(ore_list, export_filetype='csv'):
+def refine_ore(ore_list, export_filetype='csv', schema=None):
     '''Returns DataFrame of content in `ore_list`, optionally exporting.
     
     Args:
-      ore_list. list of Ore objects. All Ores in this list must have the same value
-        for `Ore.site_name`. It is very unlikely that any other scenario would occur.
+      ore_list. list of Ore objects, or an `ore.OreBatch`. All Ores in this list must
+        have the same value for `Ore.site_name`. It is very unlikely that any other
+        scenario would occur.
       export_filetype: str. Filetype for export. Valid filetypes are defined in
         `constants.VALID_ORE_EXPORT_TYPES`
+      schema: dict. The "schema" of the site's config. If given, its columns are
+        converted to their types in bulk (see `refinery`) before exporting.
        '''
     
-    if not isinstance(ore_list, list):
-        raise ValueError(f'Expected list, got {type(ore_list)}')
+    if isinstance(ore_list, OreBatch):
+        site_name = ore_list.site_name
+        df = ore_list.to_frame()
+
+    elif isinstance(ore_list, list):
+        site_name = ore_list[0].site_name
+        attributes = ore_list[0]._attr_names
+        for ore in ore_list:
+            if ore.site_name != site_name:
+                raise ValueError(f'All Ore should come from {site_name}. Found Ore '
+                                 f'from {ore.site_name}')
 
-    site_name = ore_list[0].site_name
+        # Build columns directly instead of one dictionary per Ore
+        columns = zip(*[ore._values for ore in ore_list])
+        df = pd.DataFrame(dict(zip(attributes, columns)), columns=list(attributes))
 
-    ore_dicts = []
-    for i, ore in enumerate(ore_list):
-        if ore.site_name != site_name:
-            raise ValueError(f'All Ore should come from {site_name}. Found Ore from '
-                             f'{ore.site_name}')
-        ore_dicts.append(ore.attributes)
+    else:
+        raise ValueError(f'Expected list, got {type(ore_list)}')
 
-    df = pd.DataFrame(ore_dicts)
+    if schema:
+        df = refinery.refine_frame(df, schema)
 
     # Make export directory if it doesn't exist
     if not os.path.isdir(constants.EXPORT_DIR):
         os.makedirs(constants.EXPORT_DIR)
 
-    exporter = getattr(df, f'to_{export_filetype}')
     filepath = os.path.join(constants.EXPORT_DIR, f'{site_name}.{export_filetype}')
-    exporter(filepath)
+    # pandas compresses "csv.gz" and "jsonl.gz" by their extension
+    base_filetype = export_filetype.split('.')[0]
+    if base_filetype == 'jsonl':
+        df.to_json(filepath, orient='records', lines=True, date_format='iso',
+                   date_unit='s')
+    elif base_filetype == 'json':
+        df.to_json(filepath, date_format='iso', date_unit='s')
+    elif base_filetype == 'parquet':
+        df.to_parquet(filepath, compression=constants.COLUMNAR_COMPRESSION,
+                      row_group_size=constants.SINK_ROW_GROUP_SIZE)
+    elif base_filetype == 'feather':
+        df.to_feather(filepath, compression=constants.COLUMNAR_COMPRESSION)
+    else:
+        exporter = getattr(df, f'to_{base_filetype}')
+        exporter(filepath)
     return df